@@ -25,6 +25,7 @@ import os
 import sys
 import xlrd
 
+import checks
 import interface
 import tools
 import version
@@ -120,6 +121,7 @@ class CutPlace(object):
         self.icdEncoding = DEFAULT_ICD_ENCODING
         self.icdPath = None
         self.isSplit = False
+        self.jobs = 1
         self.dataToValidatePaths = None
         self.lastValidationWasOk = False
 
@@ -136,13 +138,28 @@ class CutPlace(object):
     launch web server providing a web interface for validation"""
 
         parser = _NoExitOptionParser(usage=usage, version="%prog " + version.VERSION_NUMBER)
-        parser.set_defaults(icdEncoding=DEFAULT_ICD_ENCODING, isLogTrace=False, isOpenBrowser=False, logLevel="warning", port=_web.DEFAULT_PORT)
+        parser.set_defaults(icdEncoding=DEFAULT_ICD_ENCODING, isLogTrace=False, isOpenBrowser=False, isMemoryMap=False, jobs=1, logLevel="warning",
+                maxUniqueKeysInMemory=checks.DEFAULT_MAX_UNIQUE_KEYS_IN_MEMORY, port=_web.DEFAULT_PORT)
         parser.add_option("--list-encodings", action="store_true", dest="isShowEncodings", help="show list of available character encodings and exit")
         validationGroup = optparse.OptionGroup(parser, "Validation options", "Specify how to validate data and how to report the results")
         validationGroup.add_option("-e", "--icd-encoding", metavar="ENCODING", dest="icdEncoding",
                 help="character encoding to use when reading the ICD (default: %default)")
         validationGroup.add_option("-P", "--plugins", metavar="FOLDER", dest="pluginsFolderPath",
                 help="folder to scan for plugins (default: %default)")
+        validationGroup.add_option("-j", "--jobs", metavar="COUNT", type="int", dest="jobs",
+                help="number of processes to validate delimited data in parallel (default: %default)")
+        validationGroup.add_option("--mmap", action="store_true", dest="isMemoryMap",
+                help="read delimited and fixed data files using a memory map")
+        validationGroup.add_option("--unique-keys-in-memory", metavar="COUNT", type="int", dest="maxUniqueKeysInMemory",
+                help="number of keys IsUnique checks remember in memory before storing them in a temporary file (default: %default)")
+        validationGroup.add_option("--unique-key-store", metavar="FILE", dest="uniqueKeyStorePath",
+                help="ensure keys of IsUnique checks did not occur in data validated before and store them in FILE")
+        validationGroup.add_option("--reference-index-folder", metavar="FOLDER", dest="referenceIndexFolder",
+                help="folder to store indices of Reference checks in (default: private folder in the temporary folder)")
+        validationGroup.add_option("--distinct-count-error", metavar="ERROR", type="float", dest="distinctCountError",
+                help="estimate the count of DistinctCount checks using little memory with a relative error of ERROR, for example 0.01")
+        validationGroup.add_option("--max-errors", metavar="COUNT", type="int", dest="maxErrors",
+                help="report only the first COUNT rejected rows in detail and summarize all rejected rows by field and error")
         validationGroup.add_option("-s", "--split", action="store_true", dest="isSplit",
                 help="split data in a CSV file containing the accepted rows and a raw text file "
                 + "containing rejected rows with both using UTF-8 as character encoding")
@@ -167,6 +184,17 @@ class CutPlace(object):
         self.isWebServer = self.options.isWebServer
         self.port = self.options.port
         self.isSplit = self.options.isSplit
+        self.jobs = self.options.jobs
+
+        if self.jobs < 1:
+            parser.error(u"number of jobs is %d but must be at least 1" % self.jobs)
+        if self.options.maxUniqueKeysInMemory < 1:
+            parser.error(u"number of unique keys in memory is %d but must be at least 1" % self.options.maxUniqueKeysInMemory)
+        distinctCountError = self.options.distinctCountError
+        if (distinctCountError is not None) and not (0.0 < distinctCountError < 1.0):
+            parser.error(u"distinct count error is %r but must be greater than 0 and less than 1" % distinctCountError)
+        if (self.options.maxErrors is not None) and (self.options.maxErrors < 0):
+            parser.error(u"maximum number of errors is %d but must be at least 0" % self.options.maxErrors)
 
         if self.options.pluginsFolderPath is not None:
             interface.importPlugins(self.options.pluginsFolderPath)
@@ -211,12 +239,14 @@ class CutPlace(object):
             try:
                 self.icd.addValidationListener(validationSplitListener)
                 try:
-                    self.icd.validate(dataFilePath)
+                    self.icd.validate(dataFilePath, self.jobs)
                 finally:
                     self.icd.removeValidationListener(validationSplitListener)
                 shortDataFilePath = os.path.basename(dataFilePath)
                 acceptedRowCount = validationSplitListener.acceptedRowCount
-                rejectedRowCount = validationSplitListener.rejectedRowCount
+                # Use the count of the ICD because a `RejectionSummary` does not notify the
+                # listener about all rejected rows.
+                rejectedRowCount = self.icd.rejectedCount
                 checksAtEndFailedCount = validationSplitListener.checksAtEndFailedCount
                 totalRowCount = acceptedRowCount + rejectedRowCount
                 if rejectedRowCount + checksAtEndFailedCount == 0:
@@ -225,6 +255,10 @@ class CutPlace(object):
                 else:
                     print "%s: rejected %d of %d rows. %d final checks failed." \
                          % (shortDataFilePath, rejectedRowCount, totalRowCount, checksAtEndFailedCount)
+                    rejectionSummary = self.icd.rejectionSummary
+                    if rejectionSummary is not None:
+                        for rejectionGroup in rejectionSummary.groups:
+                            print "  %s" % rejectionGroup
             finally:
                 if isWriteSplit:
                     rejectedTextFile.close()
@@ -237,7 +271,20 @@ class CutPlace(object):
         newIcd = interface.InterfaceControlDocument()
         if self.options is not None:
             newIcd.logTrace = self.options.isLogTrace
+            newIcd.useMemoryMap = self.options.isMemoryMap
         newIcd.read(newIcdPath, self.icdEncoding)
+        if self.options is not None:
+            for checkName in newIcd.checkNames:
+                check = newIcd.getCheck(checkName)
+                if isinstance(check, checks.IsUniqueCheck):
+                    check.maxKeysInMemory = self.options.maxUniqueKeysInMemory
+                    check.keyStorePath = self.options.uniqueKeyStorePath
+                elif isinstance(check, checks.DistinctCountCheck):
+                    check.approximationError = self.options.distinctCountError
+                elif isinstance(check, checks.ReferenceCheck):
+                    check.indexFolder = self.options.referenceIndexFolder
+            if self.options.maxErrors is not None:
+                newIcd.rejectionSummary = interface.RejectionSummary(self.options.maxErrors)
         self.icd = newIcd
         self.interfaceSpecificationPath = newIcdPath
 
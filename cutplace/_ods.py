@@ -119,18 +119,54 @@ class RowListContentHandler(AbstractOdsContentHandler):
         self.rows.append(self.row)
 
 
+class _ProducingStoppedError(Exception):
+    """
+    Error raised by `RowProducingContentHandler` to stop parsing once `stop()` has been called.
+    """
+    pass
+
+
 class RowProducingContentHandler(AbstractOdsContentHandler):
     """
     ContentHandler to produce all rows to a target queue where a consumer in a different thread
     can get them.
+
+    If ``batchSize`` is ``None``, each row is put on its own. Otherwise rows are put in lists of
+    up to ``batchSize`` rows; call `flush()` after parsing to put the last incomplete list.
     """
-    def __init__(self, targetQueue, sheet=1):
+    def __init__(self, targetQueue, sheet=1, batchSize=None):
         assert targetQueue is not None
+        assert (batchSize is None) or (batchSize >= 1)
         AbstractOdsContentHandler.__init__(self, sheet)
         self.queue = targetQueue
+        self.batchSize = batchSize
+        self._rows = []
+        self._isStopped = False
+
+    def stop(self):
+        """
+        Stop parsing at the next completed row, discarding rows not put to the queue yet.
+        """
+        self._isStopped = True
 
     def rowCompleted(self):
-        self.queue.put(self.row)
+        if self._isStopped:
+            self._rows = []
+            raise _ProducingStoppedError()
+        if self.batchSize is None:
+            self.queue.put(self.row)
+        else:
+            self._rows.append(self.row)
+            if len(self._rows) == self.batchSize:
+                self.flush()
+
+    def flush(self):
+        """
+        Put all rows collected so far to the target queue.
+        """
+        if self._rows:
+            self.queue.put(self._rows)
+            self._rows = []
 
 
 def toCsv(odsFilePath, csvTargetPath, dialect="excel", sheet=1):
@@ -162,8 +198,11 @@ class ProducerThread(threading.Thread):
     Consumers should call ``Queue.get()`` until it returns ``None``. Possible exceptions raised
     in the background during `run()` are raised again when calling `join()` so no special means
     are necessary for the consumer to handle exceptions in the producer thread.
+
+    With a ``batchSize``, the queue receives lists of rows instead of single rows as described
+    in `RowProducingContentHandler`.
     """
-    def __init__(self, readable, targetQueue, sheet=1):
+    def __init__(self, readable, targetQueue, sheet=1, batchSize=None):
         assert readable is not None
         assert targetQueue is not None
         assert sheet is not None
@@ -172,18 +211,29 @@ class ProducerThread(threading.Thread):
         self.readable = readable
         self.targetQueue = targetQueue
         self.sheet = sheet
+        self.batchSize = batchSize
         self.error = None
+        self._contentHandler = RowProducingContentHandler(self.targetQueue, self.sheet, self.batchSize)
 
     def run(self):
         try:
-            xml.sax.parse(self.readable, RowProducingContentHandler(self.targetQueue, self.sheet))
+            xml.sax.parse(self.readable, self._contentHandler)
+        except _ProducingStoppedError:
+            pass
         except Exception, error:
             # Remember error information to raise it later during `join()`.
             self.error = error
         finally:
+            self._contentHandler.flush()
             # The last row always is a `None` to mark the end.
             self.targetQueue.put(None)
 
+    def stop(self):
+        """
+        Stop parsing the remaining document at the next completed row.
+        """
+        self._contentHandler.stop()
+
     def join(self):
         super(ProducerThread, self).join()
         if self.error is not None:
@@ -0,0 +1,478 @@
+"""
+Parallel validation of delimited data using several processes.
+
+The data are split in chunks of bytes at line delimiters located outside of quotes. Each chunk is
+validated by a worker process of a `multiprocessing.Pool` using the same ICD as the main
+process. Once a worker is done, the results of its chunk are merged into the main process in the
+same order as the chunks are stored in the data. This includes:
+
+  * shifting the line number of all `tools.InputLocation`s by the number of rows in previous
+    chunks,
+  * merging the state of checks using `checks.AbstractCheck.mergePartialState()` so that
+    `checkAtEnd()` can be performed on the whole data,
+  * notifying validation listeners about accepted and rejected rows.
+
+If the ICD uses a memory map, the main process splits the mapped data and each worker maps
+the data file once and parses its chunks directly from the map. All processes share the same
+pages of the file, so chunks do not have to be copied into the workers.
+
+Rows rejected because of a conflict with a previous chunk reported by `mergePartialState()`
+do not add keys to `checks.IsUniqueCheck`s performed after the check in question, so duplicate
+keys found by the merge only refer to rows that have been accepted. They are still taken into
+account by the state of other checks, and by checks of later rows in the same chunk, which
+the worker validated before the conflict was known.
+"""
+# Copyright (C) 2009-2012 Thomas Aglassinger
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+import cStringIO
+import logging
+import multiprocessing
+import os
+import types
+
+import checks
+import data
+import interface
+import sniff
+import tools
+import _parsers
+import _tools
+
+_log = logging.getLogger("cutplace")
+
+# Approximate number of bytes in a chunk to be validated by a single worker.
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of bytes to read at once while searching for positions to split the data at.
+_BLOCK_SIZE = 64 * 1024
+
+# The shortest chunk size possible; shorter chunks could consist of a single empty line, which
+# the delimited parser would skip.
+_MINIMUM_CHUNK_SIZE = 4
+
+# Worker specific data set by `_initializeWorker()`.
+_workerIcd = None
+_workerDataFilePath = None
+_workerDialect = None
+_workerCollectsAcceptedRows = None
+_workerMappedData = None
+
+
+def canValidateInParallel(icd, dataFileToValidatePath):
+    """
+    ``True`` if ``dataFileToValidatePath`` can be validated in parallel using `validate()`.
+    """
+    assert icd is not None
+    assert dataFileToValidatePath is not None
+
+    result = False
+    if not isinstance(dataFileToValidatePath, types.StringTypes):
+        _log.info(u"validating using a single process because data are not stored in a file")
+    elif icd.dataFormat.name not in (data.FORMAT_CSV, data.FORMAT_DELIMITED):
+        _log.info(u"validating using a single process because data format is not delimited: %s", icd.dataFormat.name)
+    elif not hasattr(os, "fork"):
+        _log.info(u"validating using a single process because platform does not support fork()")
+    elif not _tools.isAsciiCompatibleEncoding(icd.dataFormat.encoding):
+        _log.info(u"validating using a single process because encoding does not allow to split data: %s", icd.dataFormat.encoding)
+    elif icd.rejectionSummary is not None:
+        _log.info(u"validating using a single process because rejected rows are summarized")
+    else:
+        result = True
+        for checkName in icd.checkNames:
+            check = icd.getCheck(checkName)
+            try:
+                check.partialState()
+            except NotImplementedError:
+                _log.warning(u"validating using a single process because check does not support partial states: %s", check)
+                result = False
+                break
+    return result
+
+
+class _DelimitedSplitter(object):
+    """
+    Splitter to find positions in ``readable`` where delimited data can be split without breaking
+    quoted items that contain line delimiters.
+
+    Quotes are tracked by counting quote characters, which also works for quotes escaped by
+    doubling them.
+    """
+    def __init__(self, readable, lineDelimiter, quoteCharacter, blockSize=_BLOCK_SIZE):
+        assert readable is not None
+        assert lineDelimiter
+        assert quoteCharacter is not None
+        assert len(quoteCharacter) == 1
+        assert blockSize > 0
+
+        self._readable = readable
+        # Split after the last character of the line delimiter, for example after the LF of CRLF.
+        self._delimiter = str(lineDelimiter[-1])
+        self._quoteCharacter = str(quoteCharacter)
+        self._blockSize = blockSize
+        self._block = ""
+        self._blockPosition = 0
+        # Index in `_block` up to which quotes have been counted.
+        self._scanIndex = 0
+        self._isInQuotesAtScanIndex = False
+
+    def splitPosition(self, minimumPosition):
+        """
+        Position right after the first line delimiter located outside of quotes at or after
+        ``minimumPosition``, or ``None`` if there is no such line delimiter.
+        """
+        assert minimumPosition is not None
+        assert minimumPosition >= self._blockPosition + self._scanIndex
+
+        result = None
+        while result is None:
+            blockEndPosition = self._blockPosition + len(self._block)
+            if minimumPosition < blockEndPosition:
+                delimiterIndex = self._block.find(self._delimiter, minimumPosition - self._blockPosition)
+                while (result is None) and (delimiterIndex != -1):
+                    quoteCount = self._block.count(self._quoteCharacter, self._scanIndex, delimiterIndex)
+                    if quoteCount % 2:
+                        self._isInQuotesAtScanIndex = not self._isInQuotesAtScanIndex
+                    self._scanIndex = delimiterIndex + 1
+                    if self._isInQuotesAtScanIndex:
+                        delimiterIndex = self._block.find(self._delimiter, self._scanIndex)
+                    else:
+                        result = self._blockPosition + self._scanIndex
+            if result is None:
+                # Advance to next block.
+                quoteCount = self._block.count(self._quoteCharacter, self._scanIndex)
+                if quoteCount % 2:
+                    self._isInQuotesAtScanIndex = not self._isInQuotesAtScanIndex
+                self._blockPosition = blockEndPosition
+                self._block = self._readable.read(self._blockSize)
+                self._scanIndex = 0
+                if not self._block:
+                    break
+        return result
+
+
+def _chunks(dataFileToValidatePath, dialect, firstRowToValidateFieldsIn, chunkSize, useMemoryMap=False):
+    """
+    Generator yielding the chunks of ``dataFileToValidatePath`` as tuple ``(start, end,
+    firstRowToValidateFieldsIn)``. With ``useMemoryMap``, the splitter reads its blocks from a
+    memory map instead of a file.
+    """
+    assert dataFileToValidatePath is not None
+    assert dialect is not None
+    assert firstRowToValidateFieldsIn >= 0
+    assert chunkSize >= _MINIMUM_CHUNK_SIZE
+
+    dataSize = os.path.getsize(dataFileToValidatePath)
+    dataFile = None
+    if useMemoryMap:
+        dataFile = _tools.mappedFile(dataFileToValidatePath)
+    if dataFile is None:
+        dataFile = open(dataFileToValidatePath, "rb")
+    try:
+        splitter = _DelimitedSplitter(dataFile, dialect.lineDelimiter, dialect.quoteChar)
+        # Keep header rows in the first chunk.
+        start = 0
+        minimumEnd = 0
+        for _ in range(firstRowToValidateFieldsIn):
+            headerEnd = splitter.splitPosition(minimumEnd)
+            if headerEnd is not None:
+                minimumEnd = headerEnd
+        end = None
+        while end != dataSize:
+            end = splitter.splitPosition(max(start + chunkSize - 1, minimumEnd))
+            if (end is None) or (dataSize - end < _MINIMUM_CHUNK_SIZE):
+                end = dataSize
+            yield (start, end, firstRowToValidateFieldsIn)
+            start = end
+            firstRowToValidateFieldsIn = 0
+    finally:
+        dataFile.close()
+
+
+class _ChunkResult(object):
+    """
+    The result of validating ``chunk`` in a worker process.
+    """
+    def __init__(self, chunk):
+        assert chunk is not None
+        self.chunk = chunk
+        self.lineCount = 0
+        self.acceptedCount = 0
+        self.rejectedCount = 0
+        # List of tuples ``(line, row, error)`` with ``error`` being ``None`` for accepted rows.
+        self.events = []
+        self.checkNameToStateMap = {}
+        self.hasUnicodeError = False
+        self.error = None
+        # Reason why the check states cannot be merged, in which case `checkNameToStateMap` is ``None``.
+        self.unmergeableReason = None
+
+
+class _CollectingValidationListener(interface.BaseValidationListener):
+    """
+    Listener to collect the validation events of a chunk so they can be passed on to the main
+    process.
+    """
+    def __init__(self, location, collectsAcceptedRows):
+        assert location is not None
+        self._location = location
+        self._collectsAcceptedRows = collectsAcceptedRows
+        self.events = []
+        self.hasUnicodeError = False
+
+    def acceptedRow(self, row, location):
+        if self._collectsAcceptedRows:
+            self.events.append((location.line, row, None))
+
+    def rejectedRow(self, row, error):
+        self.events.append((self._location.line, row, error))
+        if isinstance(error, tools.CutplaceUnicodeError):
+            self.hasUnicodeError = True
+
+
+def _initializeWorker(icd, dataFileToValidatePath, dialect, collectsAcceptedRows):
+    global _workerIcd
+    global _workerDataFilePath
+    global _workerDialect
+    global _workerCollectsAcceptedRows
+    global _workerMappedData
+
+    _workerIcd = icd
+    _workerDataFilePath = dataFileToValidatePath
+    _workerDialect = dialect
+    _workerCollectsAcceptedRows = collectsAcceptedRows
+    if icd.useMemoryMap:
+        _workerMappedData = _tools.mappedFile(dataFileToValidatePath)
+    else:
+        _workerMappedData = None
+
+
+def _validatedChunk(chunk):
+    """
+    `_ChunkResult` for validating ``chunk`` using the worker data set up by `_initializeWorker()`.
+    """
+    assert chunk is not None
+    start, end, firstRowToValidateFieldsIn = chunk
+
+    if _workerMappedData is not None:
+        chunkReadable = _tools.MappedRange(_workerMappedData, start, end)
+    else:
+        dataFile = open(_workerDataFilePath, "rb")
+        try:
+            dataFile.seek(start)
+            chunkReadable = cStringIO.StringIO(dataFile.read(end - start))
+        finally:
+            dataFile.close()
+
+    icd = _workerIcd
+    location = tools.InputLocation(_workerDataFilePath, hasCell=True)
+    listener = _CollectingValidationListener(location, _workerCollectsAcceptedRows)
+    # Replace the listeners inherited from the main process.
+    icd._validationListeners = [listener]
+    icd._resetCounts()
+    icd._resetChecks()
+    result = _ChunkResult(chunk)
+    try:
+        reader = _parsers.delimitedReader(chunkReadable, _workerDialect, encoding=icd.dataFormat.encoding,
+                isThreaded=False)
+        icd._validateRows(reader, location, firstRowToValidateFieldsIn)
+    except tools.CutplaceError, error:
+        result.error = error
+    result.lineCount = location.line
+    result.acceptedCount = icd.acceptedCount
+    result.rejectedCount = icd.rejectedCount
+    result.events = listener.events
+    result.hasUnicodeError = listener.hasUnicodeError
+    try:
+        for checkName in icd.checkNames:
+            check = icd.getCheck(checkName)
+            result.checkNameToStateMap[checkName] = check.partialState()
+    except NotImplementedError, error:
+        # For example, an `checks.IsUniqueCheck` that had to store keys on disk.
+        result.checkNameToStateMap = None
+        result.unmergeableReason = unicode(error)
+    return result
+
+
+def _shiftedLocation(location, lineOffset):
+    """
+    Copy of ``location`` with the line number moved by ``lineOffset``.
+    """
+    if location is not None:
+        result = copy.copy(location)
+        result.moveLine(lineOffset)
+    else:
+        result = None
+    return result
+
+
+def _shiftedError(error, lineOffset):
+    """
+    Copy of ``error`` with the line number of all locations moved by ``lineOffset``, including
+    the locations of errors it has been caused by and which are part of its message.
+    """
+    assert error is not None
+    assert lineOffset >= 0
+
+    result = error
+    if isinstance(error, tools._BaseCutplaceError) and lineOffset:
+        result = copy.copy(error)
+        result._location = _shiftedLocation(error.location, lineOffset)
+        result._seeAlsoLocation = _shiftedLocation(error.seeAlsoLocation, lineOffset)
+        cause = error.cause
+        if isinstance(cause, tools._BaseCutplaceError):
+            shiftedCause = _shiftedError(cause, lineOffset)
+            result._cause = shiftedCause
+            message = error.args[0]
+            causeText = unicode(cause)
+            if message.endswith(causeText):
+                result.args = (message[:-len(causeText)] + unicode(shiftedCause),)
+    return result
+
+
+def _mergeChunkResult(icd, dataFileToValidatePath, result, lineOffset):
+    """
+    Merge the `_ChunkResult` ``result`` into ``icd`` and notify its listeners.
+    """
+    assert icd is not None
+    assert dataFileToValidatePath is not None
+    assert result is not None
+    assert lineOffset >= 0
+
+    # Merge checks and find rows that have to be rejected because they conflict with rows in a
+    # previous chunk, for example because of duplicate keys.
+    lineToConflictMap = {}
+    for checkName in icd.checkNames:
+        check = icd.getCheck(checkName)
+        checkState = result.checkNameToStateMap[checkName]
+        if lineToConflictMap and isinstance(check, checks.IsUniqueCheck):
+            # Like with a single process, rows rejected by a previous check do not add keys.
+            checkState = check._partialStateWithoutLines(checkState, lineToConflictMap)
+        for conflictError in check.mergePartialState(checkState, lineOffset):
+            line = conflictError.location.line - lineOffset
+            if line not in lineToConflictMap:
+                lineToConflictMap[line] = interface._createRowCheckError(check, conflictError, conflictError.location)
+    for line, _, error in result.events:
+        if (error is not None) and (line in lineToConflictMap):
+            # Row has been rejected by the worker already.
+            del lineToConflictMap[line]
+    conflictCount = len(lineToConflictMap)
+    icd.acceptedCount += result.acceptedCount - conflictCount
+    icd.rejectedCount += result.rejectedCount + conflictCount
+
+    # Notify listeners in the same order as the rows are stored in the data.
+    listeners = icd._validationListeners
+    if listeners:
+        for line, row, error in result.events:
+            conflictError = lineToConflictMap.get(line)
+            if conflictError is not None:
+                error = conflictError
+            if error is None:
+                location = tools.InputLocation(dataFileToValidatePath, hasCell=True)
+                if lineOffset + line:
+                    location.advanceLine(lineOffset + line)
+                for listener in listeners:
+                    listener.acceptedRow(row, location)
+            else:
+                if conflictError is None:
+                    error = _shiftedError(error, lineOffset)
+                for listener in listeners:
+                    listener.rejectedRow(row, error)
+
+
+def _validateRemainingRows(icd, dataFileToValidatePath, dialect, chunk, location):
+    """
+    Validate the rows of ``dataFileToValidatePath`` starting with ``chunk`` in the current
+    process with ``location`` pointing to the first row of ``chunk``.
+    """
+    assert icd is not None
+    assert dataFileToValidatePath is not None
+    assert dialect is not None
+    assert chunk is not None
+    assert location is not None
+
+    start, _, firstRowToValidateFieldsIn = chunk
+    dataFile = open(dataFileToValidatePath, "rb")
+    try:
+        dataFile.seek(start)
+        reader = _parsers.delimitedReader(dataFile, dialect, encoding=icd.dataFormat.encoding)
+        icd._validateRows(reader, location, firstRowToValidateFieldsIn)
+    finally:
+        dataFile.close()
+
+
+def validate(icd, dataFileToValidatePath, jobs, chunkSize=DEFAULT_CHUNK_SIZE):
+    """
+    Validate the delimited data in ``dataFileToValidatePath`` using ``icd`` in ``jobs`` parallel
+    processes, and return the `tools.InputLocation` after the last row. The caller is
+    responsible for resetting ``icd`` before and performing the checks at the end afterwards.
+
+    If the partial state of a check cannot be obtained after validating a chunk, for example
+    because an `checks.IsUniqueCheck` had to store keys on disk, the chunks validated so far
+    are merged and the remaining data are validated using the current process.
+    """
+    assert icd is not None
+    assert dataFileToValidatePath is not None
+    assert jobs >= 1
+    assert chunkSize >= _MINIMUM_CHUNK_SIZE
+    assert canValidateInParallel(icd, dataFileToValidatePath)
+
+    # Resolve line and item delimiter once so all workers use the same dialect even if the
+    # ICD allows any delimiter.
+    dialect = interface._createDelimitedDialect(icd)
+    dataFile = open(dataFileToValidatePath, "rb")
+    try:
+        delimitedOptions = sniff.delimitedOptions(dataFile, **{
+            sniff._ENCODING: icd.dataFormat.encoding,
+            sniff._ESCAPE_CHARACTER: dialect.escapeChar,
+            sniff._ITEM_DELIMITER: dialect.itemDelimiter,
+            sniff._LINE_DELIMITER: dialect.lineDelimiter,
+            sniff._QUOTE_CHARACTER: dialect.quoteChar
+        })
+    finally:
+        dataFile.close()
+    dialect.lineDelimiter = delimitedOptions[sniff._LINE_DELIMITER]
+    dialect.itemDelimiter = delimitedOptions[sniff._ITEM_DELIMITER]
+    dialect.quoteChar = delimitedOptions[sniff._QUOTE_CHARACTER]
+    firstRowToValidateFieldsIn = icd.dataFormat.get(data.KEY_HEADER)
+    collectsAcceptedRows = bool(icd._validationListeners)
+    _log.info(u"validate using %d processes", jobs)
+
+    lineOffset = 0
+    remainingChunk = None
+    pool = multiprocessing.Pool(jobs, _initializeWorker, (icd, dataFileToValidatePath, dialect, collectsAcceptedRows))
+    try:
+        chunks = _chunks(dataFileToValidatePath, dialect, firstRowToValidateFieldsIn, chunkSize, icd.useMemoryMap)
+        for result in pool.imap(_validatedChunk, chunks):
+            if result.checkNameToStateMap is None:
+                _log.warning(u"validating remaining data using a single process because check does not support partial states: %s",
+                    result.unmergeableReason)
+                remainingChunk = result.chunk
+                break
+            _mergeChunkResult(icd, dataFileToValidatePath, result, lineOffset)
+            if result.error is not None:
+                raise _shiftedError(result.error, lineOffset)
+            lineOffset += result.lineCount
+            if result.hasUnicodeError:
+                # Like the sequential validation, stop at the first broken row.
+                break
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    result = _shiftedLocation(tools.InputLocation(dataFileToValidatePath, hasCell=True), lineOffset)
+    if remainingChunk is not None:
+        _validateRemainingRows(icd, dataFileToValidatePath, dialect, remainingChunk, result)
+    return result
@@ -16,11 +16,14 @@ containing the columns.
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import codecs
 import csv
 import datetime
 import logging
+import mmap
 import Queue
 import threading
+import xml.sax
 
 import data
 import sniff
@@ -41,29 +44,93 @@ class CutplaceXlrdImportError(tools.CutplaceError):
     """
 
 
-def _createRowQueue():
+# Number of rows a producer thread passes to the consumer at once.
+DEFAULT_BATCH_SIZE = 256
+
+# Number of batches of rows that can wait for a consumer before a producer thread blocks.
+DEFAULT_QUEUE_SIZE = 3
+
+
+def _createRowQueue(queueSize=DEFAULT_QUEUE_SIZE):
     """
     A queue to be used for consumer/producer readers, ensuring that memory usage is kept at bay even when
     reading is much faster than validating.
     """
-    return Queue.Queue(3)
+    assert queueSize is not None
+    assert queueSize >= 1
+    return Queue.Queue(queueSize)
+
+
+def _producedRows(producer, rowQueue, isThreaded=True):
+    """
+    Generator yielding the rows of `_AbstractRowProducerThread` ``producer``.
+
+    If ``isThreaded`` is ``True``, start ``producer`` and yield the rows it puts in batches into
+    ``rowQueue``. Otherwise, simply iterate ``producer.reader()`` within the current thread.
+    This avoids the overhead of passing rows between threads, which only pays off if the
+    consumer can do something useful while the producer is waiting for input.
+    """
+    assert producer is not None
+    assert rowQueue is not None
+
+    if isThreaded:
+        rows = _queuedRows(producer, rowQueue)
+    else:
+        rows = producer.reader()
+    for row in rows:
+        yield row
+
+
+def _queuedRows(producer, rowQueue):
+    """
+    Generator yielding the rows thread ``producer`` puts in lists into ``rowQueue``.
+
+    If the consumer stops early, for example because of an error, the producer is told to stop
+    too and any error it might have run into meanwhile is ignored.
+    """
+    assert producer is not None
+    assert rowQueue is not None
+
+    producer.start()
+    isConsumed = False
+    try:
+        rows = rowQueue.get()
+        while rows is not None:
+            for row in rows:
+                yield row
+            rows = rowQueue.get()
+        isConsumed = True
+    finally:
+        if isConsumed:
+            producer.join()
+        else:
+            producer.stop()
+            # Make sure the producer is not blocked on a full queue.
+            while rowQueue.get() is not None:
+                pass
+            threading.Thread.join(producer)
 
 
 class _AbstractRowProducerThread(threading.Thread):
     """
     Thread to produce the contents of a row reader to a queue where a consumer can get it.
 
+    To reduce the overhead of locking, rows are passed in lists of up to ``batchSize`` rows.
     Consumers should call ``Queue.get()`` until it returns ``None``. Possible exceptions raised
     in the background during `run()` are raised again when calling `join()` so no special means
     are necessary for the consumer to handle exceptions in the producer thread.
     """
-    def __init__(self, readable, targetQueue):
+    def __init__(self, readable, targetQueue, batchSize=DEFAULT_BATCH_SIZE):
         assert readable is not None
         assert targetQueue is not None
+        assert batchSize is not None
+        assert batchSize >= 1
         super(_AbstractRowProducerThread, self).__init__()
         self.readable = readable
         self._targetQueue = targetQueue
+        self._batchSize = batchSize
         self._error = None
+        self._isStopped = False
 
     def reader(self):
         """
@@ -72,16 +139,30 @@ class _AbstractRowProducerThread(threading.Thread):
         raise NotImplementedError(u'reader() must be implemented')
 
     def run(self):
+        rows = []
         try:
             for row in self.reader():
-                self._targetQueue.put(row)
+                rows.append(row)
+                if len(rows) == self._batchSize:
+                    self._targetQueue.put(rows)
+                    rows = []
+                    if self._isStopped:
+                        break
         except Exception, error:
             # Remember error information to raise it later during `join()`.
             self._error = error
         finally:
-            # The last row always is a `None` to mark the end.
+            if rows:
+                self._targetQueue.put(rows)
+            # The last batch always is a `None` to mark the end.
             self._targetQueue.put(None)
 
+    def stop(self):
+        """
+        Stop producing rows after the next list of rows.
+        """
+        self._isStopped = True
+
     def join(self):
         super(_AbstractRowProducerThread, self).join()
         if self._error is not None:
@@ -130,10 +211,10 @@ def _excelCellValue(cell, datemode):
 
 
 class _ExcelRowProducerThread(_AbstractRowProducerThread):
-    def __init__(self, readable, targetQueue, sheetIndex=1):
+    def __init__(self, readable, targetQueue, sheetIndex=1, batchSize=DEFAULT_BATCH_SIZE):
         assert sheetIndex is not None
         assert sheetIndex >= 1
-        super(_ExcelRowProducerThread, self).__init__(readable, targetQueue)
+        super(_ExcelRowProducerThread, self).__init__(readable, targetQueue, batchSize)
         self.sheetIndex = sheetIndex
 
     def reader(self):
@@ -153,75 +234,62 @@ class _ExcelRowProducerThread(_AbstractRowProducerThread):
             yield row
 
 
-def delimitedReader(readable, dialect, encoding="ascii"):
+def delimitedReader(readable, dialect, encoding="ascii", isThreaded=True, batchSize=DEFAULT_BATCH_SIZE,
+        queueSize=DEFAULT_QUEUE_SIZE):
     """
     Generator yielding the ``readable`` row by row using `DelimitedDialect` ``dialect`` and ``encoding``.
+
+    Unless ``isThreaded`` is ``False``, rows are read in a separate thread, which passes
+    them in lists of ``batchSize`` rows through a queue holding up to ``queueSize`` lists.
     """
     assert readable is not None
     assert dialect is not None
     assert encoding is not None
 
-    rowQueue = _createRowQueue()
-    producer = _DelimitedRowProducerThread(readable, rowQueue, dialect, encoding)
-    producer.start()
-    hasRow = True
-    while hasRow:
-        row = rowQueue.get()
-        if row is not None:
-            yield row
-        else:
-            hasRow = False
-    producer.join()
+    rowQueue = _createRowQueue(queueSize)
+    producer = _DelimitedRowProducerThread(readable, rowQueue, dialect, encoding, batchSize)
+    for row in _producedRows(producer, rowQueue, isThreaded):
+        yield row
 
 
-def excelReader(readable, sheetIndex=1):
+def excelReader(readable, sheetIndex=1, isThreaded=True, batchSize=DEFAULT_BATCH_SIZE, queueSize=DEFAULT_QUEUE_SIZE):
     """
     Generator yielding the Excel spreadsheet located in the workbook stored in ``readable`` at index
-    ``sheetIndex`` row by row.
+    ``sheetIndex`` row by row. For ``isThreaded``, ``batchSize`` and ``queueSize`` see
+    `delimitedReader()`.
     """
     assert readable is not None
     assert sheetIndex is not None
     assert sheetIndex >= 1
 
-    rowQueue = _createRowQueue()
-    producer = _ExcelRowProducerThread(readable, rowQueue, sheetIndex)
-    producer.start()
-    try:
-        hasRow = True
-        while hasRow:
-            row = rowQueue.get()
-            if row is not None:
-                yield row
-            else:
-                hasRow = False
-    finally:
-        producer.join()
+    rowQueue = _createRowQueue(queueSize)
+    producer = _ExcelRowProducerThread(readable, rowQueue, sheetIndex, batchSize)
+    for row in _producedRows(producer, rowQueue, isThreaded):
+        yield row
 
 
-def odsReader(readable, sheetIndex=1):
+def odsReader(readable, sheetIndex=1, isThreaded=True, batchSize=DEFAULT_BATCH_SIZE, queueSize=DEFAULT_QUEUE_SIZE):
     """
     Generator yielding the Open Document spreadsheet stored in ``readable`` in sheet number ``sheetIndex``
-    starting with 1.
+    starting with 1. For ``isThreaded``, ``batchSize`` and ``queueSize`` see `delimitedReader()`.
+    Without a thread, all rows of the sheet are read before the first one is yielded.
     """
     assert readable is not None
     assert sheetIndex is not None
     assert sheetIndex >= 1
 
-    rowQueue = _createRowQueue()
     contentXmlReadable = _ods.odsContent(readable)
     try:
-        producer = _ods.ProducerThread(contentXmlReadable, rowQueue, sheetIndex)
-        producer.start()
-        try:
-            hasRow = True
-            while hasRow:
-                row = rowQueue.get()
-                if row is not None:
-                    yield row
-                else:
-                    hasRow = False
-        finally:
-            producer.join()
+        if isThreaded:
+            rowQueue = _createRowQueue(queueSize)
+            producer = _ods.ProducerThread(contentXmlReadable, rowQueue, sheetIndex, batchSize)
+            for row in _queuedRows(producer, rowQueue):
+                yield row
+        else:
+            rowListHandler = _ods.RowListContentHandler(sheetIndex)
+            xml.sax.parse(contentXmlReadable, rowListHandler)
+            for row in rowListHandler.rows:
+                yield row
     finally:
         contentXmlReadable.close()
 
@@ -293,12 +361,12 @@ class ParserSyntaxError(tools.CutplaceError):
 
 
 class _DelimitedRowProducerThread(_AbstractRowProducerThread):
-    def __init__(self, readable, targetQueue, dialect, encoding="ascii"):
+    def __init__(self, readable, targetQueue, dialect, encoding="ascii", batchSize=DEFAULT_BATCH_SIZE):
         assert dialect is not None
         assert dialect.lineDelimiter is not None
         assert dialect.itemDelimiter is not None
         assert encoding is not None
-        super(_DelimitedRowProducerThread, self).__init__(readable, targetQueue)
+        super(_DelimitedRowProducerThread, self).__init__(readable, targetQueue, batchSize)
 
         self._log = logging.getLogger("cutplace.parsers")
 
@@ -338,89 +406,228 @@ class _DelimitedRowProducerThread(_AbstractRowProducerThread):
                 yield row
 
 
-class _FixedParser(object):
-    def __init__(self, readable, fieldLengths):
+# Number of bytes or characters to read at once from fixed data.
+DEFAULT_FIXED_BLOCK_SIZE = 64 * 1024
+
+
+def _isSingleByteEncoding(encoding):
+    """
+    True if each byte encoded with ``encoding`` represents exactly one character, so slices
+    of encoded bytes can be decoded on their own.
+
+    >>> _isSingleByteEncoding("iso-8859-15")
+    True
+    >>> _isSingleByteEncoding("cp1140")
+    True
+    >>> _isSingleByteEncoding("utf-8")
+    False
+    """
+    assert encoding is not None
+
+    decoder = codecs.getincrementaldecoder(encoding)("replace")
+    result = True
+    code = 0
+    while result and (code < 256):
+        try:
+            result = (len(decoder.decode(chr(code))) == 1)
+        except UnicodeError:
+            result = False
+        code += 1
+    return result
+
+
+class _FixedReader(object):
+    """
+    Reader for fixed data in ``readable`` yielding rows with items of ``fieldLengths`` characters.
+
+    Instead of reading item by item, the data are read in blocks of ``blockSize`` and rows are
+    sliced from them using offsets computed in advance. If ``readable`` yields bytes,
+    ``encoding`` specifies how to decode them. For single byte encodings, the blocks are
+    searched and sliced as bytes and only the rows are decoded. In this case, an ``mmap`` as
+    ``readable`` is sliced directly without reading blocks. If ``lineDelimiter`` is not
+    ``None``, it must follow each row except possibly the last one.
+    """
+    def __init__(self, readable, fieldLengths, encoding=None, lineDelimiter=None, blockSize=DEFAULT_FIXED_BLOCK_SIZE):
         assert readable is not None
-        assert fieldLengths is not None
-        assert len(fieldLengths) > 0
+        assert fieldLengths
+        assert lineDelimiter in (None, CR, CRLF, LF), u"lineDelimiter=%r" % lineDelimiter
+        assert blockSize is not None
+        assert blockSize >= 1
 
         self.readable = readable
         self.fieldLengths = fieldLengths
-        self.itemNumberInRow = - 1
-        self.columnNumberInRow = 0
+        self.encoding = encoding
+        self.lineDelimiter = lineDelimiter
+        self.blockSize = blockSize
+        self.offsets = []
+        rowLength = 0
+        for fieldLength in fieldLengths:
+            assert fieldLength >= 1
+            self.offsets.append((rowLength, rowLength + fieldLength))
+            rowLength += fieldLength
+        self.rowLength = rowLength
         self.rowNumber = 0
-        self.atEndOfLine = False
-        self.atEndOfFile = False
-        self.item = 0
-        self.advance()
-
-    def _raiseSyntaxError(self, message):
-        assert message is not None
-        raise ParserSyntaxError(message, self.rowNumber, self.itemNumberInRow, self.columnNumberInRow)
-
-    def advance(self):
-        assert not self.atEndOfFile
-
-        if self.atEndOfLine:
-            self.itemNumberInRow = 0
-            self.columnNumberInRow = 0
-            self.rowNumber += 1
-            self.atEndOfLine = False
+        self._decoder = None
+        self._decode = None
+        self._isDecodingRows = False
+        self._atEndOfFile = False
+
+    def _raiseUnicodeError(self, error):
+        raise tools.CutplaceUnicodeError(u"cannot decode input: %s" % error, cause=error)
+
+    def _readBlock(self):
+        """
+        The next block of data as it should be sliced: unicode text, or bytes if only the rows
+        have to be decoded.
+        """
+        assert not self._atEndOfFile
+
+        result = self.readable.read(self.blockSize)
+        self._atEndOfFile = not result
+        if isinstance(result, str):
+            if self._decoder is None:
+                self._setUpDecoding()
+            if not self._isDecodingRows:
+                try:
+                    result = self._decoder.decode(result, self._atEndOfFile)
+                except UnicodeError, error:
+                    self._raiseUnicodeError(error)
+        return result
+
+    def _setUpDecoding(self):
+        assert self._decoder is None
+
+        if self.encoding is None:
+            raise UnicodeError(
+                u"filelike object for fixed data set must be opened using codecs.open() or encoding must be specified")
+        if _isSingleByteEncoding(self.encoding):
+            self._isDecodingRows = True
+            self._decode = codecs.getdecoder(self.encoding)
+            if self.lineDelimiter is not None:
+                self.lineDelimiter = self.lineDelimiter.encode(self.encoding)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+
+    def _firstBuffer(self):
+        """
+        Tuple ``(buffer, position)`` to start slicing rows from. For a memory map with single
+        byte encoding, this is the whole map so it can be sliced directly without reading it in
+        blocks first.
+        """
+        if isinstance(self.readable, mmap.mmap) and (self.encoding is not None) \
+                and _isSingleByteEncoding(self.encoding):
+            self._setUpDecoding()
+            self._atEndOfFile = True
+            result = (self.readable, self.readable.tell())
+        else:
+            result = (self._readBlock(), 0)
+        return result
+
+    def _rowAt(self, buffer, position):
+        if self._isDecodingRows:
+            try:
+                rowText = self._decode(buffer[position:position + self.rowLength])[0]
+            except UnicodeError, error:
+                self._raiseUnicodeError(error)
+            result = [rowText[start:end] for start, end in self.offsets]
         else:
-            self.itemNumberInRow += 1
-        expectedLength = self.fieldLengths[self.itemNumberInRow]
-        self.item = self.readable.read(expectedLength)
-        if not isinstance(self.item, unicode):
-            raise UnicodeEncodeError(u"filelike object for fixed data set must be opened using codecs.open() instead of open()")
-        if (self.item == "") and (self.itemNumberInRow == 0):
-            self.item = None
-            self.atEndOfLine = True
-            self.atEndOfFile = True
+            result = [buffer[position + start:position + end] for start, end in self.offsets]
+        return result
+
+    def _raiseRowLengthError(self, rowText):
+        """
+        Raise a `ParserSyntaxError` pointing at the item in which ``rowText`` ends too soon or
+        after the last item if ``rowText`` is too long.
+        """
+        assert len(rowText) != self.rowLength
+
+        if self._isDecodingRows:
+            rowText = unicode(rowText, self.encoding, "replace")
+        actualRowLength = len(rowText)
+        if actualRowLength > self.rowLength:
+            raise ParserSyntaxError(u"row must end after %d characters but continues with: %r"
+                % (self.rowLength, rowText[self.rowLength:]), self.rowNumber, len(self.fieldLengths), self.rowLength)
+        itemNumber = 0
+        start, end = self.offsets[itemNumber]
+        while end <= actualRowLength:
+            itemNumber += 1
+            start, end = self.offsets[itemNumber]
+        item = rowText[start:]
+        raise ParserSyntaxError(u"item must have %d characters but data already end after %d yielding: %r"
+            % (end - start, len(item), item), self.rowNumber, itemNumber, start)
+
+    def _undelimitedRows(self):
+        rowLength = self.rowLength
+        buffer, position = self._firstBuffer()
+        while True:
+            while len(buffer) - position >= rowLength:
+                yield self._rowAt(buffer, position)
+                position += rowLength
+                self.rowNumber += 1
+            if self._atEndOfFile:
+                break
+            buffer = buffer[position:] + self._readBlock()
+            position = 0
+        if position < len(buffer):
+            self._raiseRowLengthError(buffer[position:])
+
+    def _delimitedRows(self):
+        rowLength = self.rowLength
+        buffer, position = self._firstBuffer()
+        lineDelimiter = self.lineDelimiter
+        lineDelimiterLength = len(lineDelimiter)
+        while not self._atEndOfFile or (position < len(buffer)):
+            endPosition = buffer.find(lineDelimiter, position)
+            if endPosition != -1:
+                nextPosition = endPosition + lineDelimiterLength
+            elif self._atEndOfFile:
+                # The last row does not need a line delimiter.
+                endPosition = len(buffer)
+                nextPosition = endPosition
+            else:
+                buffer = buffer[position:] + self._readBlock()
+                position = 0
+            if endPosition != -1:
+                if endPosition - position != rowLength:
+                    self._raiseRowLengthError(buffer[position:endPosition])
+                yield self._rowAt(buffer, position)
+                self.rowNumber += 1
+                position = nextPosition
+
+    def rows(self):
+        """
+        Generator yielding all rows in ``readable``.
+        """
+        if self.lineDelimiter is None:
+            result = self._undelimitedRows()
         else:
-            actualLength = len(self.item)
-            if actualLength != expectedLength:
-                self._raiseSyntaxError(
-                    u"item must have %d characters but data already end after %d yielding: %r"
-                    % (expectedLength, actualLength, self.item)
-                )
-            self.columnNumberInRow += actualLength
-            if self.itemNumberInRow == len(self.fieldLengths) - 1:
-                self.atEndOfLine = True
+            result = self._delimitedRows()
+        return result
 
 
 class _FixedRowProducerThread(_AbstractRowProducerThread):
-    def __init__(self, readable, targetQueue, fieldLengths):
+    def __init__(self, readable, targetQueue, fieldLengths, encoding=None, lineDelimiter=None,
+            batchSize=DEFAULT_BATCH_SIZE):
         assert fieldLengths
         assert len(fieldLengths) > 0
-        super(_FixedRowProducerThread, self).__init__(readable, targetQueue)
+        super(_FixedRowProducerThread, self).__init__(readable, targetQueue, batchSize)
         self.fieldLengths = fieldLengths
+        self.encoding = encoding
+        self.lineDelimiter = lineDelimiter
 
     def reader(self):
-        parser = _FixedParser(self.readable, self.fieldLengths)
-        columns = []
-        while not parser.atEndOfFile:
-            if parser.item is not None:
-                columns.append(parser.item)
-            if parser.atEndOfLine:
-                yield columns
-                columns = []
-            parser.advance()
-
-
-def fixedReader(readable, fieldLengths):
+        return _FixedReader(self.readable, self.fieldLengths, self.encoding, self.lineDelimiter).rows()
+
+
+def fixedReader(readable, fieldLengths, encoding=None, lineDelimiter=None, blockSize=DEFAULT_FIXED_BLOCK_SIZE):
     """
     Generator yielding the ``readable`` row by row using ``fieldLengths``.
+
+    If ``readable`` yields bytes instead of unicode text, ``encoding`` specifies how to decode
+    them. Unless ``lineDelimiter`` is ``None``, each row must be followed by it except possibly
+    the last one. Data are read in blocks of ``blockSize`` bytes or characters.
     """
     assert readable is not None
     assert fieldLengths
     assert len(fieldLengths) > 0
 
-    parser = _FixedParser(readable, fieldLengths)
-    columns = []
-    while not parser.atEndOfFile:
-        if parser.item is not None:
-            columns.append(parser.item)
-        if parser.atEndOfLine:
-            yield columns
-            columns = []
-        parser.advance()
+    return _FixedReader(readable, fieldLengths, encoding, lineDelimiter, blockSize).rows()
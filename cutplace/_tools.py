@@ -19,16 +19,22 @@ from the Python documentation.
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import codecs
+import cPickle
 import csv
 import decimal
 import errno
+import hashlib
 import keyword
 import logging
+import math
+import mmap
 import optparse
 import os
 import platform
 import re
+import sqlite3
 import StringIO
+import struct
 import token
 import tokenize
 import threading
@@ -69,19 +75,78 @@ class UTF8Recoder:
         return result
 
 
+# Number of bytes to read at once when splitting data at line delimiters.
+_LINE_BLOCK_SIZE = 64 * 1024
+
+
+def isAsciiCompatibleEncoding(encoding):
+    """
+    ``True`` if ``encoding`` can be split at ASCII line delimiters, item delimiters and quotes
+    without breaking characters consisting of multiple bytes.
+
+    >>> isAsciiCompatibleEncoding("UTF-8")
+    True
+    >>> isAsciiCompatibleEncoding("latin-1")
+    True
+    >>> isAsciiCompatibleEncoding("utf-16")
+    False
+    """
+    assert encoding is not None
+    codecName = codecs.lookup(encoding).name
+    return (codecName in ("ascii", "utf-8")) or codecName.startswith("iso8859-") or codecName.startswith("cp125")
+
+
+def _encodedLines(readable, lineDelimiter=None):
+    """
+    Generator yielding the lines in ``readable`` including their line delimiter without decoding
+    them. If ``lineDelimiter`` is ``"\\r"``, lines are split at it, otherwise at ``"\\n"``.
+    """
+    assert readable is not None
+
+    if lineDelimiter == "\r":
+        def crLines():
+            buffer = ""
+            block = readable.read(_LINE_BLOCK_SIZE)
+            while block:
+                lines = (buffer + block).split("\r")
+                buffer = lines.pop()
+                for line in lines:
+                    yield line + "\r"
+                block = readable.read(_LINE_BLOCK_SIZE)
+            if buffer:
+                yield buffer
+        result = crLines()
+    else:
+        result = iter(readable.readline, "")
+    return result
+
+
 class UnicodeCsvReader:
     """
     A CSV reader which will iterate over lines in the CSV file "f",
     which is encoded in the given encoding.
+
+    For encodings where `isAsciiCompatibleEncoding()` holds, the data are parsed as they
+    are and only the items are decoded, so each byte is decoded exactly once. Other encodings
+    are recoded to UTF-8 before parsing them.
     """
 
     def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
-        f = UTF8Recoder(f, encoding)
+        if isAsciiCompatibleEncoding(encoding):
+            self._encoding = encoding
+            f = _encodedLines(f, kwds.get("lineterminator"))
+        else:
+            self._encoding = "utf-8"
+            f = UTF8Recoder(f, encoding)
         self.reader = csv.reader(f, dialect=dialect, **kwds)
 
     def next(self):  # @ReservedAssignment
-        row = self.reader.next()
-        return [unicode(s, "utf-8") for s in row]
+        try:
+            row = [unicode(s, self._encoding) for s in self.reader.next()]
+        except UnicodeError, error:
+            from tools import CutplaceUnicodeError
+            raise CutplaceUnicodeError(u"cannot decode input: %s" % error, cause=error)
+        return row
 
     def __iter__(self):
         return self
@@ -219,6 +284,431 @@ def attemptToRemove(filePath):
             raise
 
 
+def mappedFile(filePath):
+    """
+    Read only ``mmap`` of the whole file at ``filePath``, or ``None`` if the file cannot be mapped,
+    for example because it is empty or too large for the address space. The operating system
+    shares the pages of the map between all processes that map the same file.
+    """
+    assert filePath is not None
+
+    result = None
+    fileToMap = open(filePath, "rb")
+    try:
+        try:
+            result = mmap.mmap(fileToMap.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, OverflowError, ValueError), error:
+            logging.getLogger("cutplace").info(u"cannot map file %r into memory: %s", filePath, error)
+    finally:
+        # The map remains valid after closing the file.
+        fileToMap.close()
+    return result
+
+
+class MappedRange(object):
+    """
+    Read only file like object for the bytes from ``start`` to ``end`` in the memory map
+    ``mapped`` that, unlike ``StringIO``, does not need a copy of the data. Closing it does
+    not close ``mapped``.
+    """
+    def __init__(self, mapped, start=0, end=None):
+        assert mapped is not None
+        assert start >= 0
+        if end is None:
+            end = len(mapped)
+        assert start <= end <= len(mapped), u"start=%d, end=%d, len(mapped)=%d" % (start, end, len(mapped))
+        self._mapped = mapped
+        self._start = start
+        self._end = end
+        self._position = start
+
+    def read(self, size=-1):
+        if (size is None) or (size < 0):
+            newPosition = self._end
+        else:
+            newPosition = min(self._position + size, self._end)
+        result = self._mapped[self._position:newPosition]
+        self._position = newPosition
+        return result
+
+    def readline(self, size=-1):
+        lineEnd = self._mapped.find("\n", self._position, self._end)
+        if lineEnd == -1:
+            lineEnd = self._end
+        else:
+            lineEnd += 1
+        if (size is not None) and (size >= 0):
+            lineEnd = min(lineEnd, self._position + size)
+        return self.read(lineEnd - self._position)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            newPosition = self._start + offset
+        elif whence == os.SEEK_CUR:
+            newPosition = self._position + offset
+        else:
+            assert whence == os.SEEK_END, u"whence=%r" % whence
+            newPosition = self._end + offset
+        self._position = max(self._start, min(newPosition, self._end))
+
+    def tell(self):
+        return self._position - self._start
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return self
+
+    def next(self):  # @ReservedAssignment
+        result = self.readline()
+        if not result:
+            raise StopIteration()
+        return result
+
+
+class BoundedCache(object):
+    """
+    Cache mapping keys to values that holds at most ``maxSize`` entries and counts ``hits``,
+    ``misses`` and ``evictions``.
+
+    Tracking the exact order in which entries are used would slow down every hit. Instead, the
+    entries are kept in two generations of up to half of ``maxSize`` entries each. New entries
+    and entries found in the previous generation are added to the current generation. Once it
+    is full, it becomes the previous generation and the entries of the former previous
+    generation are evicted. So entries used at least once per generation remain in the cache,
+    similar to a least recently used cache.
+
+    >>> cache = BoundedCache(4)
+    >>> cache.put("a", 1)
+    >>> cache.put("b", 2)
+    >>> cache.get("a")
+    1
+    >>> cache.put("c", 3)
+    >>> cache.get("b") is None
+    False
+    >>> cache.put("d", 4)
+    >>> cache.put("e", 5)
+    >>> cache.get("a") is None
+    True
+    >>> cache
+    BoundedCache(4, hits=2, misses=1, evictions=1)
+    """
+    _MISSING = object()
+
+    def __init__(self, maxSize):
+        assert maxSize is not None
+        assert maxSize >= 1
+        self.maxSize = maxSize
+        self._generationSize = max(1, maxSize // 2)
+        self._current = {}
+        self._previous = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def _add(self, key, value):
+        if len(self._current) >= self._generationSize:
+            self.evictions += len(self._previous)
+            if self.maxSize > self._generationSize:
+                self._previous = self._current
+            else:
+                self.evictions += len(self._current)
+                self._previous = {}
+            self._current = {}
+        self._current[key] = value
+
+    def get(self, key, default=None):
+        """
+        The value cached for ``key`` or ``default`` if there is none.
+        """
+        result = self._current.get(key, BoundedCache._MISSING)
+        if result is BoundedCache._MISSING:
+            result = self._previous.pop(key, BoundedCache._MISSING)
+            if result is BoundedCache._MISSING:
+                self.misses += 1
+                result = default
+            else:
+                self.hits += 1
+                self._add(key, result)
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key, value):
+        """
+        Cache ``value`` for ``key``, possibly evicting other entries.
+        """
+        if key in self._current:
+            self._current[key] = value
+        else:
+            self._previous.pop(key, None)
+            self._add(key, value)
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics.
+        """
+        self._current = {}
+        self._previous = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hitRate(self):
+        """
+        Share of hits among all lookups between 0.0 and 1.0.
+        """
+        lookupCount = self.hits + self.misses
+        if lookupCount:
+            result = float(self.hits) / lookupCount
+        else:
+            result = 0.0
+        return result
+
+    def __repr__(self):
+        return "BoundedCache(%d, hits=%d, misses=%d, evictions=%d)" % (self.maxSize, self.hits, self.misses, self.evictions)
+
+
+class TemporaryKeyStore(object):
+    """
+    Map of keys to line numbers stored in a temporary database file to hold more keys than fit
+    in memory. The file is removed automatically once the store is closed. SQLite creates it in
+    the folder specified by the environment variable ``SQLITE_TMPDIR`` or ``TMPDIR``.
+
+    Keys can be anything that can be pickled and has a ``repr()`` that identifies it.
+
+    >>> store = TemporaryKeyStore()
+    >>> store.update({(1, u"a"): 3, (2, u"b"): 5})
+    >>> store.get((1, u"a"))
+    3
+    >>> store.get((1, u"b")) is None
+    True
+    >>> len(store)
+    2
+    >>> sorted(store.items())
+    [((1, u'a'), 3), ((2, u'b'), 5)]
+    >>> store.close()
+    """
+    def __init__(self):
+        # Note: An empty database name makes SQLite use a temporary file that is removed on close.
+        self._connection = sqlite3.connect("")
+        self._connection.execute("pragma journal_mode = off")
+        self._connection.execute("pragma synchronous = off")
+        self._connection.execute("create table key_line (key text primary key, pickled_key blob, line integer)")
+        self._cursor = self._connection.cursor()
+        self._length = 0
+
+    def update(self, keyToLineMap):
+        """
+        Add all keys and line numbers in ``keyToLineMap``. None of the keys must be in the store
+        already.
+        """
+        assert keyToLineMap is not None
+        self._connection.executemany("insert into key_line values (?, ?, ?)",
+                ((repr(key), sqlite3.Binary(cPickle.dumps(key, 2)), line) for key, line in keyToLineMap.iteritems()))
+        self._connection.commit()
+        self._length += len(keyToLineMap)
+
+    def get(self, key):
+        """
+        The line number stored for ``key`` or ``None`` if the store does not contain it.
+        """
+        self._cursor.execute("select line from key_line where key = ?", (repr(key),))
+        row = self._cursor.fetchone()
+        if row is not None:
+            result = row[0]
+        else:
+            result = None
+        return result
+
+    def items(self):
+        """
+        Iterator over pairs with each key and its line number.
+        """
+        for pickledKey, line in self._connection.execute("select pickled_key, line from key_line"):
+            yield (cPickle.loads(str(pickledKey)), line)
+
+    def __len__(self):
+        return self._length
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class PersistentKeyStore(object):
+    """
+    Set of keys stored in a database file at ``path`` that remain there for later validations,
+    for example to detect keys delivered again after several days. Several stores can share the
+    same file as long as each uses its own ``name``, which must be a valid identifier.
+
+    To keep the number of disk accesses low even for billions of keys, `find()` looks up
+    keys in batches. Changes only become permanent with `commit()`.
+
+    Keys can be anything that has a ``repr()`` that identifies it. The store indexes a 64 bit
+    hash of it but also compares the ``repr()`` itself, so different keys with the same hash
+    are not mistaken for each other.
+
+    >>> import tempfile
+    >>> storePath = os.path.join(tempfile.mkdtemp(), "keys.db")
+    >>> store = PersistentKeyStore(storePath, "customer")
+    >>> store.find([(1, u"a"), (2, u"b")])
+    []
+    >>> store.add([(1, u"a"), (2, u"b")])
+    >>> store.commit()
+    >>> store.close()
+    >>> store = PersistentKeyStore(storePath, "customer")
+    >>> store.find([(2, u"b"), (3, u"c")])
+    [(2, u'b')]
+    >>> store.close()
+    """
+    def __init__(self, path, name):
+        assert path is not None
+        assert name is not None
+        assert re.match(r"^[a-zA-Z_][a-zA-Z0-9_]*$", name), u"name=%r" % name
+
+        self._tableName = "key_" + name
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("pragma temp_store = memory")
+        self._connection.execute("create table if not exists %s (key_hash integer not null, key text not null)" % self._tableName)
+        self._connection.execute("create index if not exists %s_hash on %s (key_hash)" % (self._tableName, self._tableName))
+        self._connection.execute("create temp table batch_key (key_hash integer not null, key text not null)")
+        self._connection.commit()
+
+    def _hash(self, keyText):
+        return struct.unpack("<q", hashlib.md5(keyText).digest()[:8])[0]
+
+    def _setBatch(self, keys):
+        """
+        Map of ``repr()`` to key for all ``keys`` which are also stored in the temporary table
+        ``batch_key`` ordered by their hash so the lookups access the index in order.
+        """
+        result = dict((repr(key), key) for key in keys)
+        self._connection.execute("delete from batch_key")
+        self._connection.executemany("insert into batch_key values (?, ?)",
+                sorted((self._hash(keyText), keyText) for keyText in result))
+        return result
+
+    def find(self, keys):
+        """
+        List of the ``keys`` that are already in the store, looked up in a single query.
+        """
+        assert keys is not None
+        textToKeyMap = self._setBatch(keys)
+        query = "select batch_key.key from batch_key join %s on %s.key_hash = batch_key.key_hash and %s.key = batch_key.key" \
+                % (self._tableName, self._tableName, self._tableName)
+        return [textToKeyMap[keyText] for keyText, in self._connection.execute(query)]
+
+    def add(self, keys):
+        """
+        Add all ``keys``, which must not be in the store already.
+        """
+        assert keys is not None
+        self._setBatch(keys)
+        self._connection.execute("insert into %s select key_hash, key from batch_key" % self._tableName)
+
+    def commit(self):
+        """
+        Make all keys added since the store was opened or last committed permanent.
+        """
+        self._connection.commit()
+
+    def rollback(self):
+        """
+        Remove all keys added since the store was opened or last committed.
+        """
+        self._connection.rollback()
+
+    def close(self):
+        """
+        Close the store, discarding keys added since the last `commit()`.
+        """
+        if self._connection is not None:
+            self._connection.rollback()
+            self._connection.close()
+            self._connection = None
+
+
+class CardinalitySketch(object):
+    """
+    HyperLogLog sketch to estimate the number of different values added to it with a standard
+    error of about ``relativeError`` using only a few kilobytes of memory.
+
+    Values must be hashable. Their ``hash()`` must be the same in all processes that add values
+    to sketches merged with `update()`, which is the case for numbers and strings.
+
+    >>> sketch = CardinalitySketch(0.01)
+    >>> for number in xrange(20000):
+    ...     sketch.add(number % 5000)
+    >>> abs(sketch.count() - 5000) < 200
+    True
+    """
+    _HASH_MASK = 0xffffffffffffffff
+
+    def __init__(self, relativeError):
+        assert relativeError is not None
+        assert 0.0 < relativeError < 1.0, u"relativeError=%r" % relativeError
+        self.relativeError = relativeError
+        # The standard error for m registers is 1.04 / sqrt(m).
+        registerCount = (1.04 / relativeError) ** 2
+        self._registerBits = min(max(int(math.ceil(math.log(registerCount, 2))), 4), 18)
+        self._registerCount = 1 << self._registerBits
+        self._registerMask = self._registerCount - 1
+        self._rankBits = 64 - self._registerBits
+        self._registers = bytearray(self._registerCount)
+
+    @property
+    def registerCount(self):
+        """
+        The number of registers, each of them taking one byte of memory.
+        """
+        return self._registerCount
+
+    def add(self, value):
+        # Mix the bits of the hash because for example numbers are their own hash.
+        hashCode = hash(value) & CardinalitySketch._HASH_MASK
+        hashCode ^= hashCode >> 33
+        hashCode = (hashCode * 0xff51afd7ed558ccd) & CardinalitySketch._HASH_MASK
+        hashCode ^= hashCode >> 33
+        hashCode = (hashCode * 0xc4ceb9fe1a85ec53) & CardinalitySketch._HASH_MASK
+        hashCode ^= hashCode >> 33
+        registerIndex = hashCode & self._registerMask
+        rank = self._rankBits - (hashCode >> self._registerBits).bit_length() + 1
+        if rank > self._registers[registerIndex]:
+            self._registers[registerIndex] = rank
+
+    def update(self, other):
+        """
+        Add all values added to the sketch ``other``, which must have the same `relativeError`.
+        """
+        assert other is not None
+        assert other.registerCount == self.registerCount
+        for registerIndex, rank in enumerate(other._registers):
+            if rank > self._registers[registerIndex]:
+                self._registers[registerIndex] = rank
+
+    def count(self):
+        """
+        Estimated number of different values added so far.
+        """
+        registerCount = self._registerCount
+        alpha = 0.7213 / (1.0 + 1.079 / registerCount)
+        rawEstimate = alpha * registerCount * registerCount / sum(2.0 ** -rank for rank in self._registers)
+        emptyRegisterCount = self._registers.count("\x00")
+        if (rawEstimate <= 2.5 * registerCount) and emptyRegisterCount:
+            # Use linear counting for small counts.
+            result = registerCount * math.log(float(registerCount) / emptyRegisterCount)
+        else:
+            result = rawEstimate
+        return int(round(result))
+
+
 def validatedPythonName(name, value):
     """
     Validated and cleaned up `value` that represents a Python name with any whitespace removed.
@@ -15,14 +15,35 @@ Standard checks that can cover a whole row or data set.
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import ast
 import copy
+import errno
+import hashlib
+import json
+import logging
+import math
+import os
+import stat
 import StringIO
+import tempfile
+import token
 import tokenize
 
 import fields
 import tools
 import _tools
 
+_log = logging.getLogger("cutplace.checks")
+
+# Default for `IsUniqueCheck.maxKeysInMemory`.
+DEFAULT_MAX_UNIQUE_KEYS_IN_MEMORY = 2000000
+
+# Number of keys `IsUniqueCheck` looks up and adds to its `keyStorePath` at once.
+_KEY_STORE_BATCH_SIZE = 10000
+
+# Number of keys found in `IsUniqueCheck.keyStorePath` to show in the error message.
+_MAX_STORED_KEYS_TO_SHOW = 3
+
 
 class CheckError(tools.CutplaceError):
     """
@@ -75,14 +96,42 @@ class AbstractCheck(object):
         """
         pass
 
+    @property
+    def requiredFieldNames(self):
+        """
+        Names of the fields `checkValues()` needs the values of, or ``None`` if the check
+        implements `checkRow()` instead. By default ``None``.
+
+        Checks that provide the field names spare the validation from building a ``rowMap``
+        for each row, which matters for data with many fields.
+        """
+        return None
+
+    def checkValues(self, values, location):
+        """
+        Check the values of a row and in case they are invalid raise `CheckError`.
+
+        ``Values`` is a tuple with the native values of the fields in `requiredFieldNames` in
+        the same order, ``location`` is the `tools.InputLocation` where the row started in the
+        input.
+
+        This is only called for checks with `requiredFieldNames`, which have to implement it.
+        """
+        raise NotImplementedError(u"checkValues() must be implemented for checks with requiredFieldNames")
+
     def checkRow(self, rowMap, location):
         """
-        Check row and in case it is invalid raise `CheckError`. By default do nothing.
+        Check row and in case it is invalid raise `CheckError`.
 
         ``RowMap`` is maps all field names to their respective value for this row, ``location`` is
         the `tools.InputLocation` where the row started in the input.
+
+        For checks with `requiredFieldNames`, pass the values of these fields to `checkValues()`.
+        Otherwise do nothing by default.
         """
-        pass
+        requiredFieldNames = self.requiredFieldNames
+        if requiredFieldNames is not None:
+            self.checkValues(tuple([rowMap[fieldName] for fieldName in requiredFieldNames]), location)
 
     def checkAtEnd(self, location):
         """
@@ -93,6 +142,38 @@ class AbstractCheck(object):
         """
         pass
 
+    def partialState(self):
+        """
+        The state collected by `checkValues()` or `checkRow()` since the last `reset()` in a form
+        that can be pickled, for example to pass it from a process that validated only a part of
+        the data to another process that combines the states of all parts using
+        `mergePartialState()`. The result may share data with the check, so the caller must not
+        modify it.
+
+        Checks that do not keep any state between rows can simply return ``None``. By default
+        raise `NotImplementedError` to indicate that the check cannot be used to validate data
+        split in several parts.
+        """
+        raise NotImplementedError(u"partialState() must be implemented to validate data in several parts")
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        """
+        Merge ``partialState`` as returned by `partialState()` of the same check after
+        validating another part of the data into the state of this check, so that `checkAtEnd()`
+        can act on all data merged so far. Parts have to be merged in the same order as they are
+        stored in the data. The line numbers of locations in ``partialState`` are relative to the
+        beginning of its part, and ``lineOffset`` is the number of rows in all previous parts.
+
+        The result is a list of `CheckError`s for rows in ``partialState`` that conflict with
+        rows merged earlier, for example because the rows share a key that must be unique. The
+        ``location`` of each error refers to the conflicting row with ``lineOffset`` already
+        applied.
+
+        Checks that do not keep any state between rows can simply return an empty list. By default
+        raise `NotImplementedError`.
+        """
+        raise NotImplementedError(u"mergePartialState() must be implemented to validate data in several parts")
+
     def cleanup(self):
         """Clean up any resources allocated to perform the checks."""
         pass
@@ -134,64 +215,772 @@ class AbstractCheck(object):
         return self._location
 
 
+def _fieldNamesInRule(rule, availableFieldNames, checkKind, purpose):
+    """
+    List of field names in ``rule`` separated by commas, which must all be in
+    ``availableFieldNames``. The ``checkKind`` and ``purpose`` of the check are used in error
+    messages, for example "unique" and "uniqueness".
+    """
+    result = []
+    ruleReadLine = StringIO.StringIO(rule).readline
+    toky = tokenize.generate_tokens(ruleReadLine)
+    afterComma = True
+    nextToken = toky.next()
+    foundFieldNames = set()
+    while not _tools.isEofToken(nextToken):
+        tokenType = nextToken[0]
+        tokenValue = nextToken[1]
+        if afterComma:
+            if tokenType != tokenize.NAME:
+                raise CheckSyntaxError(u"field name must contain only ASCII letters, numbers and underscores (_) "
+                                       + "but found: %r [token type=%r]" % (tokenValue, tokenType))
+            try:
+                fields.getFieldNameIndex(tokenValue, availableFieldNames)
+                if tokenValue in foundFieldNames:
+                    raise CheckSyntaxError(u"duplicate field name for %s check must be removed: %s" % (checkKind, tokenValue))
+                foundFieldNames.add(tokenValue)
+            except fields.FieldLookupError, error:
+                raise CheckSyntaxError(unicode(error))
+            result.append(tokenValue)
+        elif not _tools.isCommaToken(nextToken):
+            raise CheckSyntaxError(u"after field name a comma (,) must follow but found: %r" % (tokenValue))
+        afterComma = not afterComma
+        nextToken = toky.next()
+    if not len(result):
+        raise CheckSyntaxError(u"rule must contain at least one field name to check for %s" % purpose)
+    return result
+
+
+def _locationAtLine(firstLocation, line):
+    """
+    Copy of ``firstLocation`` pointing at ``line``, which must not be before ``firstLocation``.
+    """
+    assert firstLocation is not None
+    assert line >= firstLocation.line, u"line=%d, firstLocation=%s" % (line, firstLocation)
+    result = copy.copy(firstLocation)
+    result.moveLine(line - firstLocation.line)
+    return result
+
+
 class IsUniqueCheck(AbstractCheck):
     """
     Check to ensure that all rows are unique concerning certain key fields.
+
+    To keep the memory needed for large data small, `uniqueValues` maps the keys to the line
+    number where they occurred first. For keys consisting of a single field, the key is the
+    value of this field, otherwise a tuple with the values of all key fields. A complete
+    location is only created in case a duplicate key has been found.
+
+    Once `uniqueValues` holds more than `maxKeysInMemory` keys, they are moved to a
+    `_tools.TemporaryKeyStore` on disk, and `uniqueValues` starts collecting keys again. This
+    makes validation slower, but data with more keys than fit in memory can still be validated.
+    Once keys have been moved to disk, `partialState()` raises `NotImplementedError`, so the
+    remaining data are validated by a single process.
+
+    If the data are sorted by the key fields as verified by an `IsSortedCheck`, `sortedFieldNames`
+    holds the field names the data are sorted by. Duplicate keys then follow each other, so
+    the check only needs to remember the previous key instead of all keys.
+
+    If `keyStorePath` is set, the check also ensures that none of the keys occurred in
+    previously validated data stored in a `_tools.PersistentKeyStore` in this file. Different
+    checks can share the same file. To keep disk accesses low, the keys are looked up in
+    batches of `_KEY_STORE_BATCH_SIZE` while checking the rows. Because the rows of a batch
+    already are accepted when it is looked up, keys found in the store do not reject rows but
+    make `checkAtEnd()` fail with a reference to the first of them. The keys of the data are
+    only added to the store permanently by `checkAtEnd()` if none of them was found. With a
+    key store, the check cannot validate parts of the data in parallel.
     """
     def __init__(self, description, rule, availableFieldNames, location=None):
         super(IsUniqueCheck, self).__init__(description, rule, availableFieldNames, location)
 
-        self.fieldNamesToCheck = []
+        self.fieldNamesToCheck = _fieldNamesInRule(rule, availableFieldNames, "unique", "uniqueness")
+        self.maxKeysInMemory = DEFAULT_MAX_UNIQUE_KEYS_IN_MEMORY
+        self.keyStorePath = None
+        self._storedKeys = None
+        self._keyStore = None
+        self._sortedFieldNames = None
+        self._sortedValueIndices = None
+        self.reset()
 
-        # Extract field names to check from rule.
-        ruleReadLine = StringIO.StringIO(rule).readline
-        toky = tokenize.generate_tokens(ruleReadLine)
+    def reset(self):
+        self.cleanup()
+        self.uniqueValues = {}
+        # Keys and lines not yet looked up in `keyStorePath`, the number of keys found there and
+        # the first few of them as pairs of line and key.
+        self._keyStoreBatch = {}
+        self._storedKeyCount = 0
+        self._firstStoredLinesAndKeys = []
+        # Copy of the first location checked, which serves as template for the locations of
+        # duplicate keys.
+        self._firstLocation = None
+        # Key in the order of `sortedFieldNames` and line of the first and previous row checked.
+        self._firstSortedKey = None
+        self._firstSortedLine = None
+        self._previousSortedKey = None
+        self._previousSortedLine = None
+
+    def isSortedBy(self, sortedFieldNames):
+        """
+        ``True`` if data sorted by ``sortedFieldNames`` are also sorted by the key fields of this
+        check, which is the case if the first key fields are the key fields in any order.
+        """
+        assert sortedFieldNames is not None
+        keyFieldCount = len(self.fieldNamesToCheck)
+        return set(sortedFieldNames[:keyFieldCount]) == set(self.fieldNamesToCheck)
+
+    def _getSortedFieldNames(self):
+        return self._sortedFieldNames
+
+    def _setSortedFieldNames(self, newSortedFieldNames):
+        assert (newSortedFieldNames is None) or self.isSortedBy(newSortedFieldNames), \
+                u"newSortedFieldNames=%r, fieldNamesToCheck=%r" % (newSortedFieldNames, self.fieldNamesToCheck)
+        if newSortedFieldNames is not None:
+            self._sortedFieldNames = list(newSortedFieldNames[:len(self.fieldNamesToCheck)])
+            self._sortedValueIndices = [self.fieldNamesToCheck.index(fieldName) for fieldName in self._sortedFieldNames]
+        else:
+            self._sortedFieldNames = None
+            self._sortedValueIndices = None
+        self.reset()
+
+    sortedFieldNames = property(_getSortedFieldNames, _setSortedFieldNames, doc="""
+        Names of the fields the data are sorted by according to an `IsSortedCheck`, or ``None``
+        if the data are not known to be sorted. Setting it resets the check.""")
+
+    @property
+    def requiredFieldNames(self):
+        return self.fieldNamesToCheck
+
+    def _sortedKey(self, values):
+        return tuple([values[valueIndex] for valueIndex in self._sortedValueIndices])
+
+    def _keyOfSortedKey(self, sortedKey):
+        """
+        The key as used by `uniqueValues` for ``sortedKey``.
+        """
+        values = [None] * len(sortedKey)
+        for sortedIndex, valueIndex in enumerate(self._sortedValueIndices):
+            values[valueIndex] = sortedKey[sortedIndex]
+        return self._key(values)
+
+    def _key(self, values):
+        """
+        The key of ``values`` to store in `uniqueValues`.
+        """
+        if len(values) == 1:
+            result = values[0]
+        else:
+            result = tuple(values)
+        return result
+
+    def _keyText(self, key):
+        if len(self.fieldNamesToCheck) == 1:
+            result = repr([key])
+        else:
+            result = repr(list(key))
+        return result
+
+    def _locationAtLine(self, line):
+        """
+        Location pointing at ``line`` in the same input as the first location checked.
+        """
+        return _locationAtLine(self._firstLocation, line)
+
+    def _lineOfKey(self, key):
+        """
+        The line where ``key`` occurred first or ``None`` if it did not occur yet.
+        """
+        result = self.uniqueValues.get(key)
+        if (result is None) and (self._storedKeys is not None):
+            result = self._storedKeys.get(key)
+        return result
+
+    def _addKey(self, key, line):
+        self.uniqueValues[key] = line
+        if len(self.uniqueValues) > self.maxKeysInMemory:
+            if self._storedKeys is None:
+                self._storedKeys = _tools.TemporaryKeyStore()
+            self._storedKeys.update(self.uniqueValues)
+            self.uniqueValues = {}
+
+    def _checkSortedValues(self, values, location):
+        sortedKey = self._sortedKey(values)
+        if self._previousSortedKey is None:
+            self._firstLocation = copy.copy(location)
+            self._firstSortedKey = sortedKey
+            self._firstSortedLine = location.line
+            self._previousSortedKey = sortedKey
+            self._previousSortedLine = location.line
+        elif sortedKey == self._previousSortedKey:
+            raise self._createDuplicateKeyError(self._keyOfSortedKey(sortedKey), location,
+                    self._locationAtLine(self._previousSortedLine))
+        elif sortedKey > self._previousSortedKey:
+            self._previousSortedKey = sortedKey
+            self._previousSortedLine = location.line
+        # Otherwise the row is out of order, which the `IsSortedCheck` reports.
+
+    def checkValues(self, values, location):
+        if self._sortedFieldNames is not None:
+            self._checkSortedValues(values, location)
+        else:
+            key = self._key(values)
+            seeAlsoLine = self._lineOfKey(key)
+            if seeAlsoLine is not None:
+                raise self._createDuplicateKeyError(key, location, self._locationAtLine(seeAlsoLine))
+            else:
+                if self._firstLocation is None:
+                    self._firstLocation = copy.copy(location)
+                self._addKey(key, location.line)
+        if self.keyStorePath is not None:
+            self._keyStoreBatch[self._key(values)] = location.line
+            if len(self._keyStoreBatch) >= _KEY_STORE_BATCH_SIZE:
+                self._lookUpKeyStoreBatch()
+
+    def _keyStoreName(self):
+        """
+        Name of the keys of this check in `keyStorePath`, which is derived from the key fields.
+        """
+        return "__".join(self.fieldNamesToCheck)
+
+    def _lookUpKeyStoreBatch(self):
+        """
+        Look up the keys in `_keyStoreBatch` in `keyStorePath`, remember the keys found there
+        for `checkAtEnd()`, and add the other keys without committing them.
+        """
+        if self._keyStore is None:
+            self._keyStore = _tools.PersistentKeyStore(self.keyStorePath, self._keyStoreName())
+        batch = self._keyStoreBatch
+        self._keyStoreBatch = {}
+        storedLinesAndKeys = sorted([(batch.pop(storedKey), storedKey) for storedKey in self._keyStore.find(batch)])
+        self._keyStore.add(batch)
+        self._storedKeyCount += len(storedLinesAndKeys)
+        # Batches are looked up in the order of their rows, so earlier batches have lower lines.
+        missingKeyCount = _MAX_STORED_KEYS_TO_SHOW - len(self._firstStoredLinesAndKeys)
+        self._firstStoredLinesAndKeys.extend(storedLinesAndKeys[:missingKeyCount])
+
+    def checkAtEnd(self, location):
+        if self.keyStorePath is not None:
+            try:
+                if self._keyStoreBatch:
+                    self._lookUpKeyStoreBatch()
+                if self._storedKeyCount > 0:
+                    firstLine, _ = self._firstStoredLinesAndKeys[0]
+                    keysToShow = u", ".join([self._keyText(key) for _, key in self._firstStoredLinesAndKeys])
+                    if self._storedKeyCount > _MAX_STORED_KEYS_TO_SHOW:
+                        keysToShow += u", ..."
+                    raise CheckError(u"unique %r must not have occurred in previous data stored in \"%s\" but %d keys did: %s"
+                            % (self.fieldNamesToCheck, self.keyStorePath, self._storedKeyCount, keysToShow),
+                            location, seeAlsoMessage="location of first previous key",
+                            seeAlsoLocation=self._locationAtLine(firstLine))
+                if self._keyStore is not None:
+                    self._keyStore.commit()
+            finally:
+                if self._keyStore is not None:
+                    self._keyStore.close()
+                    self._keyStore = None
+
+    def partialState(self):
+        if self.keyStorePath is not None:
+            raise NotImplementedError(u"keys must be looked up in key store by a single process: %s" % self.keyStorePath)
+        if self._storedKeys is not None:
+            # Passing the keys stored on disk would require to hold all of them in memory.
+            raise NotImplementedError(u"keys stored on disk must be checked by a single process: %d keys" % len(self._storedKeys))
+        if self._previousSortedKey is not None:
+            sortedKeysAndLines = (self._firstSortedKey, self._firstSortedLine, self._previousSortedKey, self._previousSortedLine)
+        else:
+            sortedKeysAndLines = None
+        return (self._firstLocation, self.uniqueValues, sortedKeysAndLines)
+
+    def _mergeSortedKeys(self, firstMergedLocation, sortedKeysAndLines, lineOffset):
+        """
+        Merge the first and last key of a part of the data sorted by `sortedFieldNames` and
+        return a list with a duplicate key error in case the first key is the same as the
+        previous key.
+        """
+        result = []
+        firstSortedKey, firstSortedLine, lastSortedKey, lastSortedLine = sortedKeysAndLines
+        if self._previousSortedKey is None:
+            self._firstSortedKey = firstSortedKey
+            self._firstSortedLine = firstSortedLine + lineOffset
+        elif firstSortedKey == self._previousSortedKey:
+            result.append(self._createDuplicateKeyError(self._keyOfSortedKey(firstSortedKey), firstMergedLocation,
+                    self._locationAtLine(self._previousSortedLine)))
+        if (self._previousSortedKey is None) or (lastSortedKey > self._previousSortedKey):
+            self._previousSortedKey = lastSortedKey
+            self._previousSortedLine = lastSortedLine + lineOffset
+        return result
+
+    def _partialStateWithoutLines(self, partialState, lines):
+        """
+        Copy of ``partialState`` without the keys that occurred first in ``lines``, which are
+        relative to the beginning of its part like the lines in ``partialState``.
+        """
+        assert partialState is not None
+        assert lines is not None
+        firstLocation, uniqueValues, sortedKeysAndLines = partialState
+        uniqueValues = dict([(key, line) for key, line in uniqueValues.iteritems() if line not in lines])
+        return (firstLocation, uniqueValues, sortedKeysAndLines)
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        assert partialState is not None
+        assert lineOffset >= 0
+        result = []
+        firstLocation, uniqueValues, sortedKeysAndLines = partialState
+        if firstLocation is not None:
+            firstMergedLocation = copy.copy(firstLocation)
+            firstMergedLocation.moveLine(lineOffset)
+            if self._firstLocation is None:
+                self._firstLocation = firstMergedLocation
+            if sortedKeysAndLines is not None:
+                result.extend(self._mergeSortedKeys(firstMergedLocation, sortedKeysAndLines, lineOffset))
+            for key, line in uniqueValues.iteritems():
+                seeAlsoLine = self._lineOfKey(key)
+                if seeAlsoLine is not None:
+                    mergedLocation = copy.copy(firstMergedLocation)
+                    mergedLocation.moveLine(line - firstLocation.line)
+                    result.append(self._createDuplicateKeyError(key, mergedLocation, self._locationAtLine(seeAlsoLine)))
+                else:
+                    self._addKey(key, line + lineOffset)
+        return result
+
+    def cleanup(self):
+        if self._storedKeys is not None:
+            self._storedKeys.close()
+            self._storedKeys = None
+        if self._keyStore is not None:
+            # Discard keys added to the store without `checkAtEnd()` committing them.
+            self._keyStore.close()
+            self._keyStore = None
+
+    def _createDuplicateKeyError(self, key, location, seeAlsoLocation):
+        """
+        `CheckError` to describe that ``key`` at ``location`` has already occurred at
+        ``seeAlsoLocation``.
+        """
+        return CheckError(u"unique %r has already occurred: %s" % (self.fieldNamesToCheck, self._keyText(key)),
+            location, seeAlsoMessage="location of previous occurrence", seeAlsoLocation=seeAlsoLocation)
+
+
+class IsSortedCheck(AbstractCheck):
+    """
+    Check to ensure that rows are sorted in ascending order concerning certain key fields. Rows
+    with the same key are allowed, use an `IsUniqueCheck` to detect them.
+
+    The check only remembers the key of the previous row, so it needs only little memory. An
+    `IsUniqueCheck` with key fields the data are sorted by takes advantage of this, see
+    `IsUniqueCheck.sortedFieldNames`.
+    """
+    def __init__(self, description, rule, availableFieldNames, location=None):
+        super(IsSortedCheck, self).__init__(description, rule, availableFieldNames, location)
+        self.fieldNamesToCheck = _fieldNamesInRule(rule, availableFieldNames, "sorted", "order")
+        self.reset()
+
+    def reset(self):
+        self._firstLocation = None
+        self._firstKey = None
+        self._previousKey = None
+        self._previousLine = None
+
+    @property
+    def requiredFieldNames(self):
+        return self.fieldNamesToCheck
+
+    def _createUnsortedKeyError(self, key, location, seeAlsoLocation):
+        """
+        `CheckError` to describe that ``key`` at ``location`` is less than the key at
+        ``seeAlsoLocation``.
+        """
+        return CheckError(u"sorted %r must be in ascending order but is: %r" % (self.fieldNamesToCheck, list(key)),
+            location, seeAlsoMessage="location of previous key", seeAlsoLocation=seeAlsoLocation)
+
+    def checkValues(self, values, location):
+        key = tuple(values)
+        if self._previousKey is None:
+            self._firstLocation = copy.copy(location)
+            self._firstKey = key
+        elif key < self._previousKey:
+            raise self._createUnsortedKeyError(key, location, _locationAtLine(self._firstLocation, self._previousLine))
+        self._previousKey = key
+        self._previousLine = location.line
+
+    def partialState(self):
+        return (self._firstLocation, self._firstKey, self._previousKey, self._previousLine)
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        assert partialState is not None
+        assert lineOffset >= 0
+        result = []
+        firstLocation, firstKey, lastKey, lastLine = partialState
+        if firstLocation is not None:
+            firstMergedLocation = copy.copy(firstLocation)
+            firstMergedLocation.moveLine(lineOffset)
+            if self._previousKey is None:
+                self._firstLocation = firstMergedLocation
+                self._firstKey = firstKey
+            elif firstKey < self._previousKey:
+                result.append(self._createUnsortedKeyError(firstKey, firstMergedLocation,
+                        _locationAtLine(self._firstLocation, self._previousLine)))
+            self._previousKey = lastKey
+            self._previousLine = lastLine + lineOffset
+        return result
+
+
+# Field formats with values JSON can store and load again as equal values.
+_JSON_STORABLE_FIELD_FORMAT_CLASSES = (fields.ChoiceFieldFormat, fields.IntegerFieldFormat, fields.PatternFieldFormat,
+        fields.RegExFieldFormat, fields.TextFieldFormat)
+
+
+def _privateIndexFolder():
+    """
+    Folder in the temporary folder to store indices of `ReferenceCheck` in that only the current
+    user can access, or ``None`` if there is no such folder and it cannot be created. Other users
+    must not be able to change the index because it decides which references are valid.
+    """
+    hasUserId = hasattr(os, "getuid")
+    if hasUserId:
+        result = os.path.join(tempfile.gettempdir(), "cutplace-%d" % os.getuid())
+    else:
+        # On Windows, the temporary folder already is private to the current user.
+        result = os.path.join(tempfile.gettempdir(), "cutplace")
+    try:
+        os.mkdir(result, 0700)
+    except OSError, error:
+        if error.errno != errno.EEXIST:
+            _log.warning(u"cannot create folder for index of referenced keys: %s", error)
+            result = None
+    if (result is not None) and hasUserId:
+        folderStat = os.lstat(result)
+        if not stat.S_ISDIR(folderStat.st_mode) or (folderStat.st_uid != os.getuid()) \
+                or (stat.S_IMODE(folderStat.st_mode) & 0077):
+            _log.warning(u"ignoring folder for index of referenced keys because other users can access it: %s", result)
+            result = None
+    return result
+
+
+class ReferenceCheck(AbstractCheck):
+    """
+    Check to ensure that the values of certain key fields also occur in the key fields of
+    another data set, for example that each order refers to an existing customer. The rule
+    consists of the key fields, the key fields in the other data, and the paths of the other
+    data and the ICD describing them, for example::
+
+      branch_id, customer_id references branch_id, id in "customers.csv" using "customers_icd.ods"
+
+    Relative paths refer to the folder of the ICD the check is defined in. The key fields must
+    have the same types in both ICDs. Rows of the other data rejected by their ICD are ignored.
+
+    `reset()` builds an index of the keys in the other data, which is stored in `indexFolder`
+    and reused as long as the other data and ICD do not change. The index is a JSON file and
+    only stored if all key fields are integers or texts. If `indexFolder` is ``None``, it is
+    stored in a folder in the temporary folder that only the current user can access. If both
+    data are sorted by the key fields as verified by an `IsSortedCheck` in each ICD, the check
+    instead reads the other data at the same pace as the data to validate and does not need an
+    index.
+    """
+    _REFERENCES = "references"
+    _IN = "in"
+    _USING = "using"
+
+    def __init__(self, description, rule, availableFieldNames, location=None):
+        super(ReferenceCheck, self).__init__(description, rule, availableFieldNames, location)
+        try:
+            tokens = list(_tools.tokenizeWithoutSpace(rule))
+        except tokenize.TokenError, error:
+            raise CheckSyntaxError(u"reference rule must be valid: %s" % error)
+        tokenIndex, self.fieldNamesToCheck = self._fieldNamesUntil(tokens, 0, ReferenceCheck._REFERENCES)
+        tokenIndex, self.referencedFieldNames = self._fieldNamesUntil(tokens, tokenIndex, ReferenceCheck._IN)
+        for fieldName in self.fieldNamesToCheck:
+            fields.getFieldNameIndex(fieldName, availableFieldNames)
+        if len(self.fieldNamesToCheck) != len(self.referencedFieldNames):
+            raise CheckSyntaxError(u"number of referenced fields must match number of key fields %r but is: %r"
+                    % (self.fieldNamesToCheck, self.referencedFieldNames))
+        tokenIndex, referencedDataPath = self._pathAt(tokens, tokenIndex, "data")
+        if (tokens[tokenIndex][0] != token.NAME) or (tokens[tokenIndex][1] != ReferenceCheck._USING):
+            raise CheckSyntaxError(u"after path of referenced data %r must follow but found: %r"
+                    % (ReferenceCheck._USING, tokens[tokenIndex][1]))
+        tokenIndex, referencedIcdPath = self._pathAt(tokens, tokenIndex + 1, "ICD")
+        if not _tools.isEofToken(tokens[tokenIndex]):
+            raise CheckSyntaxError(u"after path of referenced ICD the rule must end but found: %r" % tokens[tokenIndex][1])
+        self.referencedDataPath = self._resolvedPath(referencedDataPath)
+        self.referencedIcdPath = self._resolvedPath(referencedIcdPath)
+        self.indexFolder = None
+
+        # Import here to prevent circular import.
+        import interface
+        self._referencedIcd = interface.InterfaceControlDocument()
+        try:
+            self._referencedIcd.read(self.referencedIcdPath)
+        except (EnvironmentError, tools.CutplaceError), error:
+            raise CheckSyntaxError(u"referenced ICD \"%s\" must be readable and valid: %s" % (self.referencedIcdPath, error),
+                    cause=error)
+        self._referencedFieldIndices = []
+        for fieldName in self.referencedFieldNames:
+            try:
+                self._referencedFieldIndices.append(self._referencedIcd.getFieldNameIndex(fieldName))
+            except fields.FieldLookupError, error:
+                raise CheckSyntaxError(u"referenced field must be defined in %r: %s" % (self.referencedIcdPath, error))
+        self._isIndexStorable = True
+        for fieldName in self.referencedFieldNames:
+            fieldFormat = self._referencedIcd.getFieldFormat(fieldName)
+            if not isinstance(fieldFormat, _JSON_STORABLE_FIELD_FORMAT_CLASSES):
+                self._isIndexStorable = False
+        self._isReferencedSorted = False
+        for checkName in self._referencedIcd.checkNames:
+            check = self._referencedIcd.getCheck(checkName)
+            if isinstance(check, IsSortedCheck) \
+                    and (check.fieldNamesToCheck[:len(self.referencedFieldNames)] == self.referencedFieldNames):
+                self._isReferencedSorted = True
+        self._sortedFieldNames = None
+        self._keys = None
+        self._keysSignature = None
+        self._referencedKeys = None
+        self._isStreaming = False
+
+    def _fieldNamesUntil(self, tokens, tokenIndex, keyword):
+        """
+        Pair with the index of the token after ``keyword`` and the list of field names
+        separated by commas from ``tokenIndex`` up to ``keyword``.
+        """
+        fieldNames = []
         afterComma = True
-        nextToken = toky.next()
-        uniqueFieldNames = set()
-        while not _tools.isEofToken(nextToken):
-            tokenType = nextToken[0]
-            tokenValue = nextToken[1]
-            if afterComma:
-                if tokenType != tokenize.NAME:
+        while True:
+            tokenType, tokenValue = tokens[tokenIndex][:2]
+            if _tools.isEofToken(tokens[tokenIndex]):
+                raise CheckSyntaxError(u"reference rule must contain %r" % keyword)
+            elif afterComma:
+                if (tokenType != tokenize.NAME) or (tokenValue == keyword):
                     raise CheckSyntaxError(u"field name must contain only ASCII letters, numbers and underscores (_) "
-                                           + "but found: %r [token type=%r]" % (tokenValue, tokenType))
-                try:
-                    fields.getFieldNameIndex(tokenValue, availableFieldNames)
-                    if tokenValue in uniqueFieldNames:
-                        raise CheckSyntaxError(u"duplicate field name for unique check must be removed: %s" % tokenValue)
-                    uniqueFieldNames.add(tokenValue)
-                except fields.FieldLookupError, error:
-                    raise CheckSyntaxError(unicode(error))
-                self.fieldNamesToCheck.append(tokenValue)
-            elif not _tools.isCommaToken(nextToken):
-                raise CheckSyntaxError(u"after field name a comma (,) must follow but found: %r" % (tokenValue))
+                                           + "but found: %r" % tokenValue)
+                fieldNames.append(tokenValue)
+            elif (tokenType == tokenize.NAME) and (tokenValue == keyword):
+                break
+            elif not _tools.isCommaToken(tokens[tokenIndex]):
+                raise CheckSyntaxError(u"after field name a comma (,) or %r must follow but found: %r" % (keyword, tokenValue))
             afterComma = not afterComma
-            nextToken = toky.next()
-        if not len(self.fieldNamesToCheck):
-            raise CheckSyntaxError(u"rule must contain at least one field name to check for uniqueness")
-        self.reset()
+            tokenIndex += 1
+        return (tokenIndex + 1, fieldNames)
+
+    def _pathAt(self, tokens, tokenIndex, pathName):
+        if tokens[tokenIndex][0] != token.STRING:
+            raise CheckSyntaxError(u"path of referenced %s must be a string in quotes but found: %r" % (pathName, tokens[tokenIndex][1]))
+        return (tokenIndex + 1, _tools.tokenText(tokens[tokenIndex]))
+
+    def _resolvedPath(self, path):
+        if os.path.isabs(path):
+            result = path
+        else:
+            result = os.path.join(os.path.dirname(self.location.filePath), path)
+        return result
+
+    def isSortedBy(self, sortedFieldNames):
+        """
+        ``True`` if data sorted by ``sortedFieldNames`` are also sorted by the key fields of this
+        check in the order the rule lists them.
+        """
+        assert sortedFieldNames is not None
+        return list(sortedFieldNames[:len(self.fieldNamesToCheck)]) == self.fieldNamesToCheck
+
+    def _getSortedFieldNames(self):
+        return self._sortedFieldNames
+
+    def _setSortedFieldNames(self, newSortedFieldNames):
+        assert (newSortedFieldNames is None) or self.isSortedBy(newSortedFieldNames), \
+                u"newSortedFieldNames=%r, fieldNamesToCheck=%r" % (newSortedFieldNames, self.fieldNamesToCheck)
+        if newSortedFieldNames is not None:
+            self._sortedFieldNames = list(newSortedFieldNames[:len(self.fieldNamesToCheck)])
+        else:
+            self._sortedFieldNames = None
+
+    sortedFieldNames = property(_getSortedFieldNames, _setSortedFieldNames, doc="""
+        Names of the fields the data to validate are sorted by according to an `IsSortedCheck`,
+        or ``None`` if the data are not known to be sorted.""")
+
+    @property
+    def isStreaming(self):
+        """
+        ``True`` if the check reads the referenced data along with the data to validate instead
+        of using an index, which is decided by `reset()`.
+        """
+        return self._isStreaming
+
+    @property
+    def requiredFieldNames(self):
+        return self.fieldNamesToCheck
+
+    def _key(self, values):
+        if len(values) == 1:
+            result = values[0]
+        else:
+            result = tuple(values)
+        return result
+
+    def _keysOfReferencedData(self):
+        """
+        Generator for the keys of all accepted rows in the referenced data.
+        """
+        fieldIndices = self._referencedFieldIndices
+        for values in self._referencedIcd.validatedRows(self.referencedDataPath, errors="ignore", output="tuple"):
+            yield self._key([values[fieldIndex] for fieldIndex in fieldIndices])
+
+    def _signature(self):
+        """
+        Data to detect if a stored index is still up to date.
+        """
+        result = [self.referencedFieldNames]
+        for path in (self.referencedDataPath, self.referencedIcdPath):
+            pathStat = os.stat(path)
+            # Use lists so the signature remains the same when stored as JSON.
+            result.append([pathStat.st_size, pathStat.st_mtime])
+        return result
+
+    def indexPath(self):
+        """
+        Path of the file to store the index of referenced keys in, or ``None`` if the index
+        cannot be stored.
+        """
+        if self.indexFolder is not None:
+            folder = self.indexFolder
+        else:
+            folder = _privateIndexFolder()
+        if (folder is not None) and self._isIndexStorable:
+            pathsAndFieldNames = repr((os.path.abspath(self.referencedDataPath), os.path.abspath(self.referencedIcdPath),
+                    self.referencedFieldNames))
+            result = os.path.join(folder, "cutplace_reference_%s.json" % hashlib.md5(pathsAndFieldNames).hexdigest())
+        else:
+            result = None
+        return result
+
+    def _storedKeys(self, indexPath, signature):
+        """
+        The keys stored in the index at ``indexPath`` or ``None`` if there is no such index or it
+        is outdated.
+        """
+        result = None
+        try:
+            indexFile = open(indexPath, "rb")
+            try:
+                storedIndex = json.load(indexFile)
+            finally:
+                indexFile.close()
+            if storedIndex["signature"] == signature:
+                if len(self.referencedFieldNames) == 1:
+                    result = frozenset(storedIndex["keys"])
+                else:
+                    result = frozenset(tuple(key) for key in storedIndex["keys"])
+            else:
+                _log.info(u"rebuild outdated index of referenced keys: %s", indexPath)
+        except (EnvironmentError, KeyError, TypeError, ValueError), error:
+            _log.debug(u"cannot read index of referenced keys: %s", error)
+        return result
+
+    def _storeKeys(self, indexPath, signature, keys):
+        temporaryIndexPath = "%s.%d.tmp" % (indexPath, os.getpid())
+        try:
+            indexFile = open(temporaryIndexPath, "wb")
+            try:
+                json.dump({"signature": signature, "keys": sorted(keys)}, indexFile)
+            finally:
+                indexFile.close()
+            if os.path.exists(indexPath):
+                # Remove old index first because `os.rename()` cannot replace files on Windows.
+                os.remove(indexPath)
+            os.rename(temporaryIndexPath, indexPath)
+        except EnvironmentError, error:
+            _log.warning(u"cannot store index of referenced keys: %s", error)
+            if os.path.exists(temporaryIndexPath):
+                os.remove(temporaryIndexPath)
+
+    def _updateKeys(self):
+        signature = self._signature()
+        if (self._keys is None) or (signature != self._keysSignature):
+            indexPath = self.indexPath()
+            if indexPath is not None:
+                keys = self._storedKeys(indexPath, signature)
+            else:
+                keys = None
+            if keys is None:
+                _log.info(u"build index of referenced keys %r in \"%s\"", self.referencedFieldNames, self.referencedDataPath)
+                keys = frozenset(self._keysOfReferencedData())
+                if indexPath is not None:
+                    self._storeKeys(indexPath, signature, keys)
+            self._keys = keys
+            self._keysSignature = signature
 
     def reset(self):
-        self.uniqueValues = {}
+        self.cleanup()
+        self._isStreaming = (self._sortedFieldNames is not None) and self._isReferencedSorted
+        if self._isStreaming:
+            self._referencedKeys = self._keysOfReferencedData()
+            self._referencedKey = None
+            self._hasReferencedKey = False
+            self._previousKey = None
+            self._hasPreviousKey = False
+        else:
+            self._updateKeys()
 
-    def checkRow(self, rowMap, location):
-        key = []
-        for fieldName in self.fieldNamesToCheck:
-            item = rowMap[fieldName]
-            key.append(item)
-        keyText = repr(key)
-        seeAlsoLocation = self.uniqueValues.get(keyText)
-        if seeAlsoLocation is not None:
-            raise CheckError(u"unique %r has already occurred: %s" % (self.fieldNamesToCheck, keyText),
-                location, seeAlsoMessage="location of previous occurrence", seeAlsoLocation=seeAlsoLocation)
+    def _isStreamedKey(self, key):
+        """
+        ``True`` if ``key`` is in the referenced data, ``False`` if not, and ``None`` if this
+        cannot be decided because ``key`` is out of order.
+        """
+        if self._hasPreviousKey and (key < self._previousKey):
+            # Leave it to the `IsSortedCheck` to reject the row.
+            result = None
+        else:
+            self._previousKey = key
+            self._hasPreviousKey = True
+            while (self._referencedKeys is not None) and (not self._hasReferencedKey or (self._referencedKey < key)):
+                try:
+                    self._referencedKey = self._referencedKeys.next()
+                    self._hasReferencedKey = True
+                except StopIteration:
+                    self._referencedKeys = None
+            result = self._hasReferencedKey and (self._referencedKey == key)
+        return result
+
+    def checkValues(self, values, location):
+        key = self._key(values)
+        if self._isStreaming:
+            isReferenced = self._isStreamedKey(key)
         else:
-            self.uniqueValues[keyText] = copy.copy(location)
+            assert self._keys is not None, u"reset() must be called before checkValues()"
+            isReferenced = key in self._keys
+        if isReferenced is False:
+            if len(self.fieldNamesToCheck) == 1:
+                keyText = repr([key])
+            else:
+                keyText = repr(list(key))
+            raise CheckError(u"reference %r must occur in %r of \"%s\" but is: %s"
+                    % (self.fieldNamesToCheck, self.referencedFieldNames, self.referencedDataPath, keyText), location)
+
+    def partialState(self):
+        # Each row is checked independently from other rows.
+        return None
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        return []
+
+    def cleanup(self):
+        if self._referencedKeys is not None:
+            self._referencedKeys.close()
+            self._referencedKeys = None
 
 
 class DistinctCountCheck(AbstractCheck):
     """
     Check to ensure that the number of different values in a field matches an expression.
+
+    By default, the check remembers all different values in `distinctValues`. If
+    `approximationError` is set, it remembers at most as many values as a
+    `_tools.CardinalitySketch` with this relative error has registers and then switches to the
+    sketch, which needs only a few kilobytes of memory but only estimates the count.
+
+    For expressions of the form ``count < limit``, ``count <= limit`` and ``count == limit``
+    the result is known as soon as the count exceeds the limit. In this case the row with the
+    value exceeding the limit is rejected, the check ignores all further values and
+    `checkAtEnd()` fails with a reference to the location where this happened. Once switched to
+    the sketch, the estimated count is compared with the limit after each `registerCount` values,
+    so the row rejected might be a little later than the exact one. When validating in parallel,
+    a count exceeding the limit only when merging the parts of the data is reported at the end.
     """
     _COUNT_NAME = "count"
 
@@ -212,14 +1001,84 @@ class DistinctCountCheck(AbstractCheck):
 
         # Build and test Python expression for validation.
         self.expression = DistinctCountCheck._COUNT_NAME + rule[columnWhereFieldNameEnds:]
+        self._approximationError = None
         self.reset()
         self._eval()
+        self._maxCount = self._maxCountOfExpression()
+
+    def _maxCountOfExpression(self):
+        """
+        The maximum count `expression` can be ``True`` for, or ``None`` if larger counts might
+        still result in ``True``.
+        """
+        result = None
+        try:
+            compare = ast.parse(self.expression, mode="eval").body
+        except SyntaxError:
+            # Expressions that can be evaluated but not parsed, for example because of trailing
+            # white space, are fine but cannot be decided early.
+            compare = None
+        if isinstance(compare, ast.Compare) and (len(compare.ops) == 1) \
+                and isinstance(compare.left, ast.Name) and (compare.left.id == DistinctCountCheck._COUNT_NAME):
+            limitNode = compare.comparators[0]
+            limitNames = [node.id for node in ast.walk(limitNode) if isinstance(node, ast.Name)]
+            if DistinctCountCheck._COUNT_NAME not in limitNames:
+                limit = eval(compile(ast.Expression(limitNode), "<limit>", "eval"), {}, {})
+                if isinstance(limit, (int, long, float)):
+                    operator = compare.ops[0]
+                    if isinstance(operator, ast.Lt):
+                        result = int(math.ceil(limit)) - 1
+                    elif isinstance(operator, (ast.LtE, ast.Eq)):
+                        result = int(math.floor(limit))
+        return result
+
+    def _getApproximationError(self):
+        return self._approximationError
+
+    def _setApproximationError(self, newApproximationError):
+        assert (newApproximationError is None) or (0.0 < newApproximationError < 1.0), \
+                u"newApproximationError=%r" % newApproximationError
+        self._approximationError = newApproximationError
+        self.reset()
+
+    approximationError = property(_getApproximationError, _setApproximationError, doc="""
+        Relative error allowed for the distinct count in order to remember at most a fixed
+        number of values, or ``None`` to count exactly. Setting it resets the check.""")
 
     def reset(self):
-        self.distinctValuesToCountMap = {}
+        self.distinctValues = set()
+        if self._approximationError is not None:
+            self._sketch = _tools.CardinalitySketch(self._approximationError)
+        else:
+            self._sketch = None
+        self._isApproximate = False
+        # Location where the count exceeded `_maxCount` if known.
+        self._exceededLocation = None
+        self._isExceeded = False
+        # Number of values added to the sketch since its count was compared with `_maxCount`.
+        self._uncountedSketchValueCount = 0
 
     def _distinctCount(self):
-        return len(self.distinctValuesToCountMap)
+        if self._isExceeded:
+            result = self._maxCount + 1
+        elif self._isApproximate:
+            result = self._sketch.count()
+        else:
+            result = len(self.distinctValues)
+        return result
+
+    def _exceed(self, location):
+        self._isExceeded = True
+        self._exceededLocation = copy.copy(location)
+        self.distinctValues = set()
+        self._sketch = None
+        self._isApproximate = False
+
+    def _switchToSketch(self):
+        for value in self.distinctValues:
+            self._sketch.add(value)
+        self.distinctValues = set()
+        self._isApproximate = True
 
     def _eval(self):
         localVariables = {DistinctCountCheck._COUNT_NAME: self._distinctCount()}
@@ -231,13 +1090,88 @@ class DistinctCountCheck(AbstractCheck):
             raise CheckSyntaxError(u"count expression %r must result in %r or %r, but test resulted in: %r" % (self.expression, True, False, result))
         return result
 
-    def checkRow(self, rowMap, location):
-        value = rowMap[self.fieldNameToCount]
-        try:
-            self.distinctValuesToCountMap[value] += 1
-        except KeyError:
-            self.distinctValuesToCountMap[value] = 1
+    def _raiseExceededError(self, location):
+        raise CheckError(u"distinct count of %r is at least %d but check requires: %r"
+                % (self.fieldNameToCount, self._maxCount + 1, self.expression), location)
+
+    def _checkCount(self, location):
+        """
+        Switch to the sketch if `distinctValues` has grown too large for it. If the count
+        exceeded `_maxCount`, stop counting and raise a `CheckError` unless ``location`` is
+        ``None``.
+        """
+        if (self._maxCount is not None) and (len(self.distinctValues) > self._maxCount):
+            self._exceed(location)
+            if location is not None:
+                self._raiseExceededError(location)
+        elif (self._sketch is not None) and (len(self.distinctValues) > self._sketch.registerCount):
+            self._switchToSketch()
+
+    def _checkSketchCount(self, location):
+        """
+        Like `_checkCount()` but for the estimated count of the sketch, which is only computed
+        after `_tools.CardinalitySketch.registerCount` values have been added since last time.
+        """
+        self._uncountedSketchValueCount += 1
+        if (self._maxCount is not None) and (self._uncountedSketchValueCount >= self._sketch.registerCount):
+            self._uncountedSketchValueCount = 0
+            if self._sketch.count() > self._maxCount:
+                self._exceed(location)
+                self._raiseExceededError(location)
+
+    @property
+    def requiredFieldNames(self):
+        return [self.fieldNameToCount]
+
+    def checkValues(self, values, location):
+        if self._isApproximate:
+            self._sketch.add(values[0])
+            self._checkSketchCount(location)
+        elif not self._isExceeded:
+            value = values[0]
+            if value not in self.distinctValues:
+                self.distinctValues.add(value)
+                self._checkCount(location)
+
+    def partialState(self):
+        # Pass the sketch only if it is used so exact counts remain exact when merged.
+        if self._isApproximate:
+            sketch = self._sketch
+        else:
+            sketch = None
+        return (self._isExceeded, self._exceededLocation, self.distinctValues, sketch)
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        assert partialState is not None
+        assert lineOffset >= 0
+        isExceeded, exceededLocation, distinctValues, sketch = partialState
+        if not self._isExceeded:
+            if isExceeded:
+                self._exceed(exceededLocation)
+                if exceededLocation is not None:
+                    self._exceededLocation.moveLine(lineOffset)
+            else:
+                if sketch is not None:
+                    if not self._isApproximate:
+                        self._switchToSketch()
+                    self._sketch.update(sketch)
+                if self._isApproximate:
+                    for value in distinctValues:
+                        self._sketch.add(value)
+                else:
+                    self.distinctValues.update(distinctValues)
+                    self._checkCount(None)
+        return []
 
     def checkAtEnd(self, location):
         if not self._eval():
-            raise CheckError(u"distinct count is %d but check requires: %r" % (self._distinctCount(), self.expression), location)
+            if self._isExceeded:
+                countText = u"at least %d" % self._distinctCount()
+            else:
+                countText = u"%d" % self._distinctCount()
+            if self._exceededLocation is not None:
+                seeAlsoMessage = u"location where count exceeded limit"
+            else:
+                seeAlsoMessage = None
+            raise CheckError(u"distinct count is %s but check requires: %r" % (countText, self.expression), location,
+                    seeAlsoMessage=seeAlsoMessage, seeAlsoLocation=self._exceededLocation)
@@ -0,0 +1,343 @@
+"""
+Batches of validated rows organized in columns, for example to load them into analytics stores
+without having to transpose the rows first.
+
+Integer values are stored in an ``array.array`` of 64 bit integers or, if NumPy is installed,
+a NumPy array. Other values are stored in a list or a NumPy array of objects. For each column,
+a mask tells which rows have a value and which are empty.
+
+Batches can be saved to ``.npy`` and ``.npz`` files as used by NumPy. This does not require
+NumPy to be installed.
+"""
+# Copyright (C) 2009-2012 Thomas Aglassinger
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import array
+import datetime
+import os
+import struct
+import time
+import zipfile
+
+import fields
+import tools
+
+try:
+    import numpy
+except ImportError:
+    # Use ``array.array`` and lists instead.
+    numpy = None
+
+#: Default number of rows in a `ColumnBatch`.
+DEFAULT_BATCH_SIZE = 10000
+
+# Limits of the integers that can be stored in a column of integers.
+_MIN_INTEGER = -2 ** 63
+_MAX_INTEGER = 2 ** 63 - 1
+
+# Column of integers (stored as 64 bit integers) or any other values (stored as objects).
+_KIND_INTEGER = "integer"
+_KIND_OBJECT = "object"
+
+# Type code of ``array.array`` for 64 bit integers, or ``None`` if the platform has none, in
+# which case integers are stored in a list.
+if array.array("l").itemsize == 8:
+    _INTEGER_TYPE_CODE = "l"
+else:  # pragma: no cover
+    _INTEGER_TYPE_CODE = None
+
+# Suffix of the name of a mask in `.npy` and `.npz` files.
+_MASK_SUFFIX = ".mask"
+
+_NPY_MAGIC = "\x93NUMPY\x01\x00"
+_NPY_HEADER_ALIGNMENT = 64
+
+
+class ColumnBatch(object):
+    """
+    A batch of validated rows organized in columns.
+    """
+    def __init__(self, fieldNames, kinds, columns, masks, rowCount):
+        assert fieldNames is not None
+        assert kinds is not None
+        assert columns is not None
+        assert masks is not None
+        assert len(fieldNames) == len(kinds)
+        assert len(fieldNames) == len(columns)
+        assert len(fieldNames) == len(masks)
+        assert rowCount >= 0
+
+        self._fieldNames = list(fieldNames)
+        self._kinds = kinds
+        self._columns = columns
+        self._masks = masks
+        self._rowCount = rowCount
+        self._fieldNameToIndexMap = dict([(fieldName, fieldIndex) for fieldIndex, fieldName in enumerate(self._fieldNames)])
+
+    @property
+    def fieldNames(self):
+        """
+        Names of the fields in the same order as `columns`.
+        """
+        return self._fieldNames
+
+    @property
+    def columns(self):
+        """
+        List with the values of each field in the same order as `fieldNames`. Empty integers
+        are stored as 0, other empty values as the `fields.AbstractFieldFormat.emptyValue` of
+        the field; use `masks` to tell them apart from actual values.
+        """
+        return self._columns
+
+    @property
+    def masks(self):
+        """
+        List with a mask for each column, which holds a true value for each row that has a
+        value and a false value for each row where the field is empty.
+        """
+        return self._masks
+
+    @property
+    def rowCount(self):
+        """
+        Number of rows in the batch.
+        """
+        return self._rowCount
+
+    def _fieldIndex(self, fieldName):
+        try:
+            result = self._fieldNameToIndexMap[fieldName]
+        except KeyError:
+            raise fields.FieldLookupError(u"field name must be one of %r but is: %r" % (self._fieldNames, fieldName))
+        return result
+
+    def column(self, fieldName):
+        """
+        The values of the field named ``fieldName``.
+        """
+        return self._columns[self._fieldIndex(fieldName)]
+
+    def mask(self, fieldName):
+        """
+        The mask of the field named ``fieldName``.
+        """
+        return self._masks[self._fieldIndex(fieldName)]
+
+    def _namesAndNpyDatas(self):
+        """
+        Pairs of names and ``.npy`` data of all columns and masks. The name of a mask is the
+        field name followed by ".mask".
+        """
+        for fieldName, kind, column, mask in zip(self._fieldNames, self._kinds, self._columns, self._masks):
+            if kind == _KIND_INTEGER:
+                columnNpyData = _npyData("<i8", struct.pack("<%dq" % self._rowCount, *column), self._rowCount)
+            else:
+                columnNpyData = _textNpyData(column, mask)
+            yield (fieldName, columnNpyData)
+            yield (fieldName + _MASK_SUFFIX, _npyData("|b1", struct.pack("%d?" % self._rowCount, *mask), self._rowCount))
+
+    def saveNpy(self, targetFolder):
+        """
+        Save each column to a file in ``targetFolder`` named after the field with the suffix
+        ".npy", and each mask to a file with the suffix ".mask.npy". Existing files are
+        replaced.
+
+        Integer columns are saved as 64 bit integers and masks as booleans. All other columns
+        are saved as Unicode text so they can be loaded without unpickling any objects: empty
+        values become an empty text, dates and times use the ISO 8601 format and all other
+        values use ``unicode()``.
+        """
+        assert targetFolder is not None
+        for name, npyData in self._namesAndNpyDatas():
+            targetFile = open(os.path.join(targetFolder, name + ".npy"), "wb")
+            try:
+                targetFile.write(npyData)
+            finally:
+                targetFile.close()
+
+    def saveNpz(self, targetPath, compressed=False):
+        """
+        Save all columns and masks to the ``.npz`` archive ``targetPath`` using the same names
+        and formats as `saveNpy()`. If ``compressed`` is ``True``, the archive is compressed
+        like ``numpy.savez_compressed()`` does.
+        """
+        assert targetPath is not None
+        if compressed:
+            compression = zipfile.ZIP_DEFLATED
+        else:
+            compression = zipfile.ZIP_STORED
+        targetZip = zipfile.ZipFile(targetPath, "w", compression)
+        try:
+            for name, npyData in self._namesAndNpyDatas():
+                targetZip.writestr(name + ".npy", npyData)
+        finally:
+            targetZip.close()
+
+
+def _columnKind(fieldFormat):
+    """
+    The kind of column to store the values of ``fieldFormat`` in.
+    """
+    result = _KIND_OBJECT
+    if isinstance(fieldFormat, fields.IntegerFieldFormat):
+        rangeItems = fieldFormat.rangeRule.items
+        if rangeItems:
+            hasInteger64Range = True
+            for lower, upper in rangeItems:
+                if (lower is None) or (upper is None) or (lower < _MIN_INTEGER) or (upper > _MAX_INTEGER):
+                    hasInteger64Range = False
+            if hasInteger64Range:
+                result = _KIND_INTEGER
+    elif isinstance(fieldFormat, fields.DateTimeFieldFormat):
+        if fieldFormat.resultType == fields.DATE_TIME_RESULT_ORDINAL:
+            result = _KIND_INTEGER
+    return result
+
+
+def _createColumnAndMask(kind, emptyValue, values, useNumPy):
+    """
+    Pair of the column and mask for ``values`` of a field as stored in a `ColumnBatch`.
+    """
+    assert kind in (_KIND_INTEGER, _KIND_OBJECT), u"kind=%r" % kind
+    assert values is not None
+
+    if emptyValue is None:
+        mask = [value is not None for value in values]
+    else:
+        mask = [value != emptyValue for value in values]
+    if kind == _KIND_INTEGER:
+        if not all(mask):
+            values = [value if hasValue else 0 for value, hasValue in zip(values, mask)]
+        if useNumPy:
+            column = numpy.array(values, dtype=numpy.int64)
+        elif _INTEGER_TYPE_CODE is not None:
+            column = array.array(_INTEGER_TYPE_CODE, values)
+        else:  # pragma: no cover
+            column = list(values)
+    elif useNumPy:
+        # Assign the values one by one to prevent NumPy from turning tuples such as a
+        # `time.struct_time` into another dimension.
+        column = numpy.empty(len(values), dtype=object)
+        for valueIndex, value in enumerate(values):
+            column[valueIndex] = value
+    else:
+        column = list(values)
+    if useNumPy:
+        mask = numpy.array(mask, dtype=bool)
+    else:
+        mask = array.array("b", mask)
+    return (column, mask)
+
+
+def validatedColumnBatches(icd, dataFileToValidatePath, batchSize=DEFAULT_BATCH_SIZE, errors="strict", useNumPy=None):
+    """
+    Generator for `ColumnBatch`es with up to ``batchSize`` accepted rows described using
+    ``icd`` in the data set found at ``dataFileToValidatePath``. Only the last batch can have
+    fewer rows, and there is no empty batch.
+
+    The ``errors`` parameter takes the same values as for
+    `interface.InterfaceControlDocument.validatedRows()`. With ``errors="yield"``, errors are
+    yielded as soon as they are detected, so they can precede a batch with rows that were
+    read before them.
+
+    If ``useNumPy`` is ``True``, columns and masks are NumPy arrays, if it is ``False``, they
+    are arrays from the standard library and lists. By default NumPy is used if it is installed.
+    """
+    assert icd is not None
+    assert dataFileToValidatePath is not None
+    assert batchSize > 0
+
+    if useNumPy is None:
+        useNumPy = (numpy is not None)
+    elif useNumPy and (numpy is None):
+        raise tools.CutplaceError(u"to obtain NumPy arrays the numpy package must be installed, see <http://numpy.scipy.org/> for more information")
+    fieldNames = list(icd.fieldNames)
+    fieldFormats = [icd.getFieldFormat(fieldName) for fieldName in fieldNames]
+    kinds = [_columnKind(fieldFormat) for fieldFormat in fieldFormats]
+    emptyValues = [fieldFormat.emptyValue for fieldFormat in fieldFormats]
+    ErrorInfo = tools.ErrorInfo
+
+    def columnBatch(rows):
+        columns = []
+        masks = []
+        # Transpose the rows at once instead of appending each value to its column.
+        for kind, emptyValue, values in zip(kinds, emptyValues, zip(*rows)):
+            column, mask = _createColumnAndMask(kind, emptyValue, values, useNumPy)
+            columns.append(column)
+            masks.append(mask)
+        return ColumnBatch(fieldNames, kinds, columns, masks, len(rows))
+
+    rows = []
+    for rowOrError in icd.validatedRows(dataFileToValidatePath, errors, output="tuple"):
+        if isinstance(rowOrError, ErrorInfo):
+            yield rowOrError
+        else:
+            rows.append(rowOrError)
+            if len(rows) == batchSize:
+                yield columnBatch(rows)
+                rows = []
+    if rows:
+        yield columnBatch(rows)
+
+
+def _textOf(value):
+    """
+    Text representation of ``value`` to save it in a column of Unicode text.
+    """
+    if value is None:
+        result = u""
+    elif isinstance(value, unicode):
+        result = value
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        result = unicode(value.isoformat())
+    elif isinstance(value, time.struct_time):
+        # Unlike `time.strftime()`, this also works for years before 1900 and keeps two digit years.
+        result = u"%04d-%02d-%02dT%02d:%02d:%02d" % tuple(value[:6])
+    else:
+        result = unicode(value)
+    return result
+
+
+def _npyData(descr, data, length):
+    """
+    The content of an ``.npy`` file in format version 1.0 for a one dimensional array with
+    ``length`` items of type ``descr``, for example "<i8", stored in ``data``.
+    """
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    # Pad the header with blanks so the data start at an aligned position.
+    unpaddedSize = len(_NPY_MAGIC) + 2 + len(header) + 1
+    paddingSize = (_NPY_HEADER_ALIGNMENT - unpaddedSize % _NPY_HEADER_ALIGNMENT) % _NPY_HEADER_ALIGNMENT
+    header += " " * paddingSize + "\n"
+    return _NPY_MAGIC + struct.pack("<H", len(header)) + header + data
+
+
+def _textNpyData(column, mask):
+    """
+    The content of an ``.npy`` file with the values of ``column`` as Unicode text as described
+    in `ColumnBatch.saveNpy()`.
+    """
+    assert column is not None
+    assert mask is not None
+
+    encodedTexts = []
+    for value, hasValue in zip(column, mask):
+        if hasValue:
+            encodedTexts.append(_textOf(value).encode("utf-32-le"))
+        else:
+            encodedTexts.append("")
+    # NumPy does not support texts without any characters, so use at least one.
+    maxEncodedTextSize = max([len(encodedText) for encodedText in encodedTexts] + [4])
+    data = "".join([encodedText + "\x00" * (maxEncodedTextSize - len(encodedText)) for encodedText in encodedTexts])
+    return _npyData("<U%d" % (maxEncodedTextSize // 4), data, len(encodedTexts))
@@ -65,6 +65,7 @@ KEY_SHEET = "sheet"
 KEY_SPACE_AROUND_DELIMITER = "blanks around delimiter"
 KEY_DECIMAL_SEPARATOR = "decimal separator"
 KEY_THOUSANDS_SEPARATOR = "thousands separator"
+KEY_VALUE_CACHE_SIZE = "value cache size"
 
 
 def createDataFormat(name):
@@ -136,7 +137,8 @@ class _BaseDataFormat(object):
             KEY_ALLOWED_CHARACTERS: None,
             KEY_DECIMAL_SEPARATOR: ".",
             KEY_THOUSANDS_SEPARATOR: ",",
-            KEY_HEADER: 0
+            KEY_HEADER: 0,
+            KEY_VALUE_CACHE_SIZE: 0
         }
         if requiredKeys is not None:
             self.requiredKeys.extend(requiredKeys)
@@ -217,6 +219,8 @@ class _BaseDataFormat(object):
                 result = ranges.Range(value)
             except ranges.RangeSyntaxError, error:
                 raise DataFormatValueError(u"value for property %r must be a valid range: %s" % (key, error))
+            # Compile the range now instead of when validating the first value.
+            result.compileCharacters()
         elif key == KEY_DECIMAL_SEPARATOR:
             result = self._validatedChoice(key, value, _VALID_DECIMAL_SEPARATORS)
             thousandsSeparatorSoFar = self.get(KEY_THOUSANDS_SEPARATOR, False)
@@ -229,6 +233,8 @@ class _BaseDataFormat(object):
             decimalSeparatorSetSoFar = self.get(KEY_DECIMAL_SEPARATOR, False)
             if result == decimalSeparatorSetSoFar:
                 self._raiseDecimalThousandsSeparatorClash(KEY_THOUSANDS_SEPARATOR, KEY_DECIMAL_SEPARATOR, result)
+        elif key == KEY_VALUE_CACHE_SIZE:
+            result = self._validatedLong(key, value, 0)
         else:  # pragma: no cover
             assert False, "_normalizedKey() must detect broken property name %r" % key
         return result
@@ -15,9 +15,11 @@ Standard field formats supported by cutplace.
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import datetime
 import decimal
 import fnmatch
 import keyword
+import os
 import re
 import sys
 import time
@@ -31,6 +33,27 @@ import _tools
 # Expected suffix for classes that describe filed formats.
 _FieldFormatClassSuffix = "FieldFormat"
 
+# Marker for values not found in `AbstractFieldFormat.valueCache`.
+_NOT_CACHED = object()
+
+# Maximum number of choices `ChoiceFieldFormat` lists in error messages.
+_MAX_CHOICES_TO_SHOW = 20
+
+# Map of absolute paths of files with choices to pairs of the size and modification time of
+# the file and the choices read from it, so they need to be read only once.
+_externalChoicesCache = {}
+
+# Possible values for `DateTimeFieldFormat.resultType`.
+DATE_TIME_RESULT_STRUCT_TIME = "struct_time"
+DATE_TIME_RESULT_DATE = "date"
+DATE_TIME_RESULT_DATETIME = "datetime"
+DATE_TIME_RESULT_ORDINAL = "ordinal"
+_DATE_TIME_RESULT_TYPES = [DATE_TIME_RESULT_STRUCT_TIME, DATE_TIME_RESULT_DATE, DATE_TIME_RESULT_DATETIME, DATE_TIME_RESULT_ORDINAL]
+
+# Regular expression matching each line that holds a decimal number `decimal.Decimal` can
+# process without an exponent.
+_DecimalNumbersRegEx = re.compile(u"^[+-]?(?:[0-9]+(?:\\.[0-9]*)?|\\.[0-9]+)$", re.MULTILINE)
+
 
 class FieldValueError(tools.CutplaceError):
     """
@@ -57,6 +80,11 @@ class AbstractFieldFormat(object):
 
       1. Overload `__init__()` but call ``super(..., self).__init__(...)`` from it.
       2. Implement `validatedValue()`.
+
+    If `valueCacheSize` is greater than 0, `validated()` remembers the results for up to this
+    number of different values in `valueCache`, which speeds up validation of fields with only
+    few different values such as codes or flags. Therefore `validatedValue()` must return the
+    same result or raise the same error for the same value each time.
     """
     def __init__(self, fieldName, isAllowedToBeEmpty, lengthText, rule, dataFormat, emptyValue=None):
         assert fieldName is not None
@@ -72,6 +100,8 @@ class AbstractFieldFormat(object):
         self._dataFormat = dataFormat
         self._emptyValue = emptyValue
         self._example = None
+        self._valueCacheSize = None
+        self._valueCache = None
 
     @property
     def fieldName(self):
@@ -115,6 +145,33 @@ class AbstractFieldFormat(object):
         """
         return self._emptyValue
 
+    def _getValueCacheSize(self):
+        if self._valueCacheSize is not None:
+            result = self._valueCacheSize
+        else:
+            result = self.dataFormat.get(data.KEY_VALUE_CACHE_SIZE)
+        return result
+
+    def _setValueCacheSize(self, newValueCacheSize):
+        assert (newValueCacheSize is None) or (newValueCacheSize >= 0), u"newValueCacheSize=%r" % newValueCacheSize
+        self._valueCacheSize = newValueCacheSize
+        self._valueCache = None
+
+    valueCacheSize = property(_getValueCacheSize, _setValueCacheSize, doc="""
+        Maximum number of different values `validated()` remembers the result for; 0 means
+        no caching at all. Unless set explicitly this is `data.KEY_VALUE_CACHE_SIZE` of the
+        `dataFormat`. Setting it discards all values cached so far.""")
+
+    @property
+    def valueCache(self):
+        """
+        The `_tools.BoundedCache` holding the results of `validated()` including its statistics,
+        or ``None`` if no results are cached.
+        """
+        if (self._valueCache is None) and self.valueCacheSize:
+            self._valueCache = _tools.BoundedCache(self.valueCacheSize)
+        return self._valueCache
+
     def _example(self):
         return self._example
 
@@ -128,12 +185,11 @@ class AbstractFieldFormat(object):
     def validateCharacters(self, value):
         validCharacterRange = self.dataFormat.get(data.KEY_ALLOWED_CHARACTERS)
         if validCharacterRange is not None:
-            for character in value:
-                try:
-                    validCharacterRange.validate("character", ord(character))
-                except ranges.RangeValueError, error:
-                    raise FieldValueError(u"value for fields %r must contain only valid characters: %s"
-                                                 % (self.fieldName, error))
+            try:
+                validCharacterRange.validateCharacters("character", value)
+            except ranges.RangeValueError, error:
+                raise FieldValueError(u"value for fields %r must contain only valid characters: %s"
+                                             % (self.fieldName, error))
 
     def validateEmpty(self, value):
         if not self.isAllowedToBeEmpty:
@@ -143,10 +199,16 @@ class AbstractFieldFormat(object):
     def validateLength(self, value):
         # Do we have some data at all?
         if self.length is not None and not (self.isAllowedToBeEmpty and value == ""):
-            try:
-                self.length.validate("length of '%s' with value %r" % (self.fieldName, value), len(value))
-            except ranges.RangeValueError, error:
-                raise FieldValueError(unicode(error))
+            valueLength = len(value)
+            # Describe the value only if its length actually is broken.
+            if not self.length.isWithin(valueLength):
+                raise self._lengthError(value)
+
+    def _lengthError(self, value):
+        """
+        `FieldValueError` describing that the length of ``value`` is outside of `length`.
+        """
+        return FieldValueError(unicode(self.length.error("length of '%s' with value %r" % (self.fieldName, value), len(value))))
 
     def validatedValue(self, value):
         """
@@ -170,6 +232,22 @@ class AbstractFieldFormat(object):
         Validate that value complies with field description and return the value in its "native"
         type. If not, raise FieldValueError.
         """
+        valueCache = self.valueCache
+        if valueCache is None:
+            result = self._uncachedValidated(value)
+        else:
+            result = valueCache.get(value, _NOT_CACHED)
+            if result is _NOT_CACHED:
+                try:
+                    result = self._uncachedValidated(value)
+                except FieldValueError, error:
+                    result = error
+                valueCache.put(value, result)
+            if isinstance(result, FieldValueError):
+                raise result
+        return result
+
+    def _uncachedValidated(self, value):
         self.validateCharacters(value)
         if self.dataFormat.name == data.FORMAT_FIXED:
             result = self.dataFormat.strippedOfBlanks(value)
@@ -185,6 +263,100 @@ class AbstractFieldFormat(object):
             result = self.emptyValue
         return result
 
+    def isValidValue(self, value):
+        """
+        ``True`` if `validatedValue()` accepts ``value``, which has passed the same validations
+        as a value passed to `validatedValue()`.
+
+        The default implementation calls `validatedValue()`, which builds a message describing
+        a broken value for nothing. Concrete field formats should override this if they can
+        tell more cheaply.
+        """
+        assert value
+
+        try:
+            self.validatedValue(value)
+            result = True
+        except FieldValueError:
+            result = False
+        return result
+
+    def isValid(self, value):
+        """
+        ``True`` if `validated()` accepts ``value``. Unlike `validated()`, this does not raise a
+        `FieldValueError` for a broken value, so callers only interested in whether a value is
+        broken do not have to pay for a message describing it.
+        """
+        valueCache = self.valueCache
+        cachedValue = _NOT_CACHED
+        if valueCache is not None:
+            cachedValue = valueCache.get(value, _NOT_CACHED)
+        if cachedValue is not _NOT_CACHED:
+            result = not isinstance(cachedValue, FieldValueError)
+        else:
+            validCharacterRange = self.dataFormat.get(data.KEY_ALLOWED_CHARACTERS)
+            if (validCharacterRange is not None) and not validCharacterRange.isEachCharacterWithin(value):
+                result = False
+            else:
+                if self.dataFormat.name == data.FORMAT_FIXED:
+                    value = self.dataFormat.strippedOfBlanks(value)
+                    isValidLength = True
+                else:
+                    isValidLength = (not value) or (self.length is None) or self.length.isWithin(len(value))
+                if not isValidLength:
+                    result = False
+                elif value:
+                    result = self.isValidValue(value)
+                else:
+                    result = self.isAllowedToBeEmpty
+        return result
+
+    def validatedValues(self, values):
+        """
+        List with the `validatedValue()` of each of ``values``, which have passed the same
+        validations as a single value passed to `validatedValue()`. If any value is broken,
+        raise a `FieldValueError`.
+
+        The default implementation simply calls `validatedValue()` for each value. Field formats
+        that can convert many values at once considerably faster may override this.
+        """
+        assert values is not None
+
+        return map(self.validatedValue, values)
+
+    def validatedColumn(self, values):
+        """
+        List with the results of `validated()` for each of ``values``, for example the items of
+        a field in several rows. If any value is broken, raise a `FieldValueError`, which does
+        not necessarily describe the first broken value; use `validated()` to find it.
+
+        Instead of validating one value after another, the characters and lengths of all values
+        are validated at once and all non empty values are passed to `validatedValues()`. With
+        fixed format data or a `valueCache` this simply calls `validated()` for each value.
+        """
+        assert values is not None
+
+        if (self.valueCache is not None) or (self.dataFormat.name == data.FORMAT_FIXED):
+            result = [self.validated(value) for value in values]
+        else:
+            self.validateCharacters(u"".join(values))
+            nonEmptyValues = [value for value in values if value]
+            hasEmptyValues = (len(nonEmptyValues) < len(values))
+            if hasEmptyValues:
+                self.validateEmpty(u"")
+            for valueLength in set(map(len, nonEmptyValues)):
+                if not self.length.isWithin(valueLength):
+                    brokenValues = [value for value in nonEmptyValues if len(value) == valueLength]
+                    raise self._lengthError(brokenValues[0])
+            result = self.validatedValues(nonEmptyValues)
+            assert len(result) == len(nonEmptyValues), \
+                u"len(result)=%d, len(nonEmptyValues)=%d" % (len(result), len(nonEmptyValues))
+            if hasEmptyValues:
+                emptyValue = self.emptyValue
+                nativeValues = iter(result)
+                result = [nativeValues.next() if value else emptyValue for value in values]
+        return result
+
     def asIcdRow(self):
         """
         The description of the field format as row that can be written to an ICD except for the
@@ -219,18 +391,74 @@ class AbstractFieldFormat(object):
         return "%s(%r, %r, %r, %r)" % (self.__class__.__name__, self.fieldName, self.isAllowedToBeEmpty, self.length, self.rule)
 
 
+def _readChoices(choicesPath):
+    """
+    List of the choices in the first column of the UTF-8 encoded CSV file at ``choicesPath``,
+    ignoring empty rows and white space around the choices.
+    """
+    absoluteChoicesPath = os.path.abspath(choicesPath)
+    try:
+        choicesStat = os.stat(absoluteChoicesPath)
+        signature = (choicesStat.st_size, choicesStat.st_mtime)
+        cachedSignature, result = _externalChoicesCache.get(absoluteChoicesPath, (None, None))
+        if signature != cachedSignature:
+            result = []
+            choicesFile = open(absoluteChoicesPath, "rb")
+            try:
+                for row in _tools.UnicodeCsvReader(choicesFile):
+                    if row:
+                        choice = row[0].strip()
+                        if choice:
+                            result.append(choice)
+            finally:
+                choicesFile.close()
+            _externalChoicesCache[absoluteChoicesPath] = (signature, result)
+    except EnvironmentError, error:
+        raise FieldSyntaxError(u"cannot read choices from \"%s\": %s" % (choicesPath, error))
+    except tools.CutplaceUnicodeError, error:
+        raise FieldSyntaxError(u"choices in \"%s\" must be encoded in UTF-8: %s" % (choicesPath, error))
+    return result
+
+
 class ChoiceFieldFormat(AbstractFieldFormat):
     """
     Field format accepting only values from a pool of choices.
+
+    The rule either lists the choices separated by commas or has the form ``from "path"``,
+    in which case the choices are read from the first column of the CSV file at ``path``.
+    Relative paths refer to ``icdFolder``, which `interface.InterfaceControlDocument` sets to
+    the folder of the ICD. Files are read only once as long as they do not change, even if
+    several ICDs refer to them.
+
+    `choices` holds the choices in the order of the rule, while `validatedValue()` looks them
+    up in a set.
     """
-    def __init__(self, fieldName, isAllowedToBeEmpty, length, rule, dataFormat):
+    _FROM = "from"
+
+    def __init__(self, fieldName, isAllowedToBeEmpty, length, rule, dataFormat, icdFolder=None):
         super(ChoiceFieldFormat, self).__init__(fieldName, isAllowedToBeEmpty, length, rule, dataFormat, emptyValue="")
         self.choices = []
+        self.choicesPath = None
 
         # Split rule into tokens, ignoring white space.
-        tokens = _tools.tokenizeWithoutSpace(rule)
+        tokens = list(_tools.tokenizeWithoutSpace(rule))
+
+        if (len(tokens) == 3) and (tokens[0][:2] == (token.NAME, ChoiceFieldFormat._FROM)) and (tokens[1][0] == token.STRING):
+            self.choicesPath = _tools.tokenText(tokens[1])
+            if (icdFolder is not None) and not os.path.isabs(self.choicesPath):
+                self.choicesPath = os.path.join(icdFolder, self.choicesPath)
+            # Copy the choices so changing them does not change the cached choices.
+            self.choices = list(_readChoices(self.choicesPath))
+        else:
+            self._extractChoices(iter(tokens))
+        if not self.isAllowedToBeEmpty and not self.choices:
+            raise FieldSyntaxError(u"choice field without any choices must be allowed to be empty")
+        self._choiceSet = frozenset(self.choices)
 
-        # Extract choices from rule tokens.
+    def _extractChoices(self, tokens):
+        """
+        Extract `choices` from rule ``tokens``.
+        """
         previousToky = None
         toky = tokens.next()
         while not _tools.isEofToken(toky):
@@ -253,36 +481,158 @@ class ChoiceFieldFormat(AbstractFieldFormat):
                 toky = tokens.next()
                 if _tools.isEofToken(toky):
                     raise FieldSyntaxError(u"trailing comma (,) must be removed")
-        if not self.isAllowedToBeEmpty and not self.choices:
-            raise FieldSyntaxError(u"choice field without any choices must be allowed to be empty")
 
     def validatedValue(self, value):
         assert value
 
-        if value not in self.choices:
-            raise FieldValueError(u"value is %r but must be one of: %s"
-                                   % (value, _tools.humanReadableList(self.choices)))
+        if value not in self._choiceSet:
+            if len(self.choices) <= _MAX_CHOICES_TO_SHOW:
+                choicesText = _tools.humanReadableList(self.choices)
+            else:
+                choicesText = u"%s, ... (%d choices in total)" % (
+                        u", ".join(["%r" % choice for choice in self.choices[:_MAX_CHOICES_TO_SHOW]]), len(self.choices))
+            raise FieldValueError(u"value is %r but must be one of: %s" % (value, choicesText))
         return value
 
+    def isValidValue(self, value):
+        assert value
+        return value in self._choiceSet
+
+
+def _scaledLong(number, zeros):
+    """
+    The decimal ``number`` consisting of an optional sign, digits and an optional "." followed
+    by digits as `long` multiplied by 10 to the power of ``len(zeros)``. Digits after the
+    decimal separator that exceed ``zeros`` are dropped.
+    """
+    integerPart, _, fractionPart = number.partition(u".")
+    if integerPart in (u"", u"+", u"-"):
+        integerPart += u"0"
+    return long(integerPart + (fractionPart + zeros)[:len(zeros)])
+
 
 class DecimalFieldFormat(AbstractFieldFormat):
     """
     Field format accepting decimal numeric values, taking the data format properties
     `data.KEY_DECIMAL_SEPARATOR` and `data.KEY_THOUSANDS_SEPARATOR` into account.
+
+    The rule can limit the number of digits to a ``precision`` and the number of digits after
+    the decimal separator to a ``scale`` using the syntax "precision, scale", for example "10, 2"
+    for amounts up to 99999999.99. With only "precision", the value must not have a fractional
+    part. Trailing zeros after the decimal separator do not count.
+
+    Values consisting only of an optional sign, digits and separators are translated with a
+    single regular expression and validated without constructing a `decimal.Decimal`. Other
+    values, for example using an exponent, are validated by `decimal.Decimal` itself.
+
+    If `isScaledInteger` is ``True``, the validated value is a `long` with the value
+    multiplied by 10 to the power of ``scale`` instead of a `decimal.Decimal`, so "17.3" with a
+    scale of 2 results in 1730.
     """
     def __init__(self, fieldName, isAllowedToBeEmpty, length, rule, dataFormat, emptyValue=None):
         super(DecimalFieldFormat, self).__init__(fieldName, isAllowedToBeEmpty, length, rule, dataFormat, emptyValue)
+        self.precision = None
+        self.scale = None
         if rule.strip():
-            raise FieldSyntaxError(u"decimal rule must be empty")
+            ruleItems = [item.strip() for item in rule.split(",")]
+            if len(ruleItems) > 2:
+                raise FieldSyntaxError(u"decimal rule must be empty or have the form \"precision, scale\" but is: %r" % rule)
+            try:
+                ruleNumbers = [long(item) for item in ruleItems]
+            except ValueError:
+                raise FieldSyntaxError(u"precision and scale of decimal rule must be integer numbers but rule is: %r" % rule)
+            self.precision = ruleNumbers[0]
+            if len(ruleNumbers) == 2:
+                self.scale = ruleNumbers[1]
+            else:
+                self.scale = 0
+            if self.precision < 1:
+                raise FieldSyntaxError(u"precision of decimal rule is %d but must be at least 1" % self.precision)
+            if not (0 <= self.scale <= self.precision):
+                raise FieldSyntaxError(u"scale of decimal rule is %d but must be between 0 and the precision %d"
+                        % (self.scale, self.precision))
         self.decimalSeparator = dataFormat.get(data.KEY_DECIMAL_SEPARATOR)
         self.thousandsSeparator = dataFormat.get(data.KEY_THOUSANDS_SEPARATOR)
+        self._isScaledInteger = False
 
         # TODO: In module data, check for same decimal/thousandsSeparator.
         assert self.decimalSeparator != self.thousandsSeparator
 
-    def validatedValue(self, value):
-        assert value
+        # Regular expression to match simple decimal numbers with the groups sign, integer part
+        # possibly containing thousands separators, and fractional part.
+        if self.thousandsSeparator:
+            integerPattern = u"[0-9%s]*" % re.escape(self.thousandsSeparator)
+        else:
+            integerPattern = u"[0-9]*"
+        self._simpleDecimalRegEx = re.compile(u"^([+-]?)(%s)(?:%s([0-9]*))?$"
+                % (integerPattern, re.escape(self.decimalSeparator)))
+        # Regular expressions to validate many values joined by line breaks at once; see
+        # `validatedValues()`.
+        self._simpleDecimalsRegEx = re.compile(u"^[+-]?%s(?:%s[0-9]*)?$"
+                % (integerPattern, re.escape(self.decimalSeparator)), re.MULTILINE)
+        if self.precision is not None:
+            self._digitCountsRegEx = re.compile(u"^[+-]?0*[0-9]{0,%d}(?:\\.[0-9]{0,%d}0*)?$"
+                    % (self.precision - self.scale, self.scale), re.MULTILINE)
+        else:
+            self._digitCountsRegEx = None
+
+    def _getIsScaledInteger(self):
+        return self._isScaledInteger
+
+    def _setIsScaledInteger(self, newIsScaledInteger):
+        if newIsScaledInteger and (self.scale is None):
+            raise FieldSyntaxError(u"decimal rule must specify a scale to validate to scaled integers")
+        self._isScaledInteger = newIsScaledInteger
+        # Discard values cached using the previous type.
+        self._valueCache = None
+
+    isScaledInteger = property(_getIsScaledInteger, _setIsScaledInteger, doc="""
+        If ``True``, validated values are of type `long` and scaled by 10 to the power of `scale`
+        instead of being a `decimal.Decimal`. This requires the rule to specify the scale.""")
+
+    def _validateDigitCounts(self, value, integerDigitCount, fractionDigitCount):
+        """
+        Validate that a number with ``integerDigitCount`` digits before and ``fractionDigitCount``
+        digits after the decimal separator, not counting leading and trailing zeros, conforms to
+        `precision` and `scale`.
+        """
+        if fractionDigitCount > self.scale:
+            raise FieldValueError(u"decimal value must have at most %d digits after the decimal separator but has %d: %r"
+                    % (self.scale, fractionDigitCount, value))
+        maxIntegerDigitCount = self.precision - self.scale
+        if integerDigitCount > maxIntegerDigitCount:
+            raise FieldValueError(u"decimal value must have at most %d digits before the decimal separator but has %d: %r"
+                    % (maxIntegerDigitCount, integerDigitCount, value))
+
+    def _validatedSimpleValue(self, value, sign, integerPart, fractionPart):
+        """
+        Validated value for ``value`` which `_simpleDecimalRegEx` split into ``sign``,
+        ``integerPart`` and ``fractionPart``, which may be ``None``.
+        """
+        if self.thousandsSeparator:
+            integerPart = integerPart.replace(self.thousandsSeparator, u"")
+        if fractionPart is None:
+            fractionPart = u""
+        if not (integerPart or fractionPart):
+            # Let `_validatedOtherValue()` describe the error.
+            result = self._validatedOtherValue(value)
+        else:
+            if self.precision is not None:
+                self._validateDigitCounts(value, len(integerPart.lstrip(u"0")), len(fractionPart.rstrip(u"0")))
+            if self._isScaledInteger:
+                scaledDigits = integerPart + fractionPart.rstrip(u"0").ljust(self.scale, u"0")
+                result = long(sign + (scaledDigits or u"0"))
+            elif fractionPart:
+                result = decimal.Decimal(sign + integerPart + u"." + fractionPart)
+            else:
+                result = decimal.Decimal(sign + integerPart)
+        return result
 
+    def _validatedOtherValue(self, value):
+        """
+        Validated value for ``value`` which does not match `_simpleDecimalRegEx` and consequently
+        is processed by `decimal.Decimal`.
+        """
         translatedValue = ""
         foundDecimalSeparator = False
         for valueIndex in range(len(value)):
@@ -304,6 +654,93 @@ class DecimalFieldFormat(AbstractFieldFormat):
             message = u"value is %r but must be a decimal number: %s" % (value, error)
             raise FieldValueError(message)
 
+        if self.precision is not None:
+            if not result.is_finite():
+                raise FieldValueError(u"decimal value with precision must be a finite number: %r" % value)
+            _, digits, exponent = result.normalize().as_tuple()
+            if result:
+                integerDigitCount = max(0, len(digits) + exponent)
+            else:
+                integerDigitCount = 0
+            self._validateDigitCounts(value, integerDigitCount, max(0, -exponent))
+        if self._isScaledInteger:
+            result = long(result.scaleb(self.scale))
+        return result
+
+    def validatedValue(self, value):
+        assert value
+
+        simpleMatch = self._simpleDecimalRegEx.match(value)
+        if simpleMatch is not None:
+            result = self._validatedSimpleValue(value, *simpleMatch.groups())
+        else:
+            result = self._validatedOtherValue(value)
+        return result
+
+    def isValidValue(self, value):
+        """
+        Same as `AbstractFieldFormat.isValidValue()` but decide about simple decimal numbers and
+        values with separators in the wrong place without a `FieldValueError`. Other values
+        still are validated by `validatedValue()`.
+        """
+        assert value
+
+        simpleMatch = self._simpleDecimalRegEx.match(value)
+        decimalSeparatorIndex = value.find(self.decimalSeparator)
+        if (simpleMatch is None) and (decimalSeparatorIndex >= 0):
+            # Same as `_validatedOtherValue()` for separators after the decimal separator.
+            fractionPart = value[decimalSeparatorIndex + 1:]
+            hasBrokenSeparators = (self.decimalSeparator in fractionPart) \
+                    or (bool(self.thousandsSeparator) and (self.thousandsSeparator in fractionPart))
+        else:
+            hasBrokenSeparators = False
+        if hasBrokenSeparators:
+            result = False
+        elif simpleMatch is not None:
+            _, integerPart, fractionPart = simpleMatch.groups()
+            if self.thousandsSeparator:
+                integerPart = integerPart.replace(self.thousandsSeparator, u"")
+            if fractionPart is None:
+                fractionPart = u""
+            if not (integerPart or fractionPart):
+                result = False
+            elif self.precision is not None:
+                result = (len(fractionPart.rstrip(u"0")) <= self.scale) \
+                        and (len(integerPart.lstrip(u"0")) <= self.precision - self.scale)
+            else:
+                result = True
+        else:
+            result = super(DecimalFieldFormat, self).isValidValue(value)
+        return result
+
+    def validatedValues(self, values):
+        """
+        Same as `AbstractFieldFormat.validatedValues()` but if all ``values`` are simple decimal
+        numbers with valid digit counts, translate and validate them at once by joining them
+        with line breaks and applying regular expressions to the result. Otherwise validate
+        them one by one to describe the broken value.
+        """
+        assert values is not None
+
+        result = None
+        valueCount = len(values)
+        joinedValues = u"\n".join(values)
+        if (joinedValues.count(u"\n") == valueCount - 1) \
+                and (len(self._simpleDecimalsRegEx.findall(joinedValues)) == valueCount):
+            if self.thousandsSeparator:
+                joinedValues = joinedValues.replace(self.thousandsSeparator, u"")
+            if self.decimalSeparator != u".":
+                joinedValues = joinedValues.replace(self.decimalSeparator, u".")
+            if (len(_DecimalNumbersRegEx.findall(joinedValues)) == valueCount) \
+                    and ((self._digitCountsRegEx is None) or (len(self._digitCountsRegEx.findall(joinedValues)) == valueCount)):
+                numbers = joinedValues.split(u"\n")
+                if self._isScaledInteger:
+                    zeros = u"0" * self.scale
+                    result = [_scaledLong(number, zeros) for number in numbers]
+                else:
+                    result = map(decimal.Decimal, numbers)
+        if result is None:
+            result = super(DecimalFieldFormat, self).validatedValues(values)
         return result
 
 
@@ -327,21 +764,63 @@ class IntegerFieldFormat(AbstractFieldFormat):
             longValue = long(value)
         except ValueError:
             raise FieldValueError(u"value must be an integer number: %r" % value)
-        try:
-            self.rangeRule.validate("value", longValue)
-        except ranges.RangeValueError, error:
-            raise FieldValueError(unicode(error))
+        if not self.rangeRule.isWithin(longValue):
+            raise FieldValueError(unicode(self.rangeRule.error("value", longValue)))
         return longValue
 
+    def isValidValue(self, value):
+        assert value
+
+        try:
+            result = self.rangeRule.isWithin(long(value))
+        except ValueError:
+            result = False
+        return result
+
+    def validatedValues(self, values):
+        """
+        Same as `AbstractFieldFormat.validatedValues()` but convert all ``values`` and validate
+        their range at once. Only if this fails, validate them one by one to describe the broken
+        value.
+        """
+        assert values is not None
+
+        try:
+            result = map(long, values)
+        except ValueError:
+            result = None
+        if (result is None) or not self.rangeRule.isEachWithin(result):
+            result = super(IntegerFieldFormat, self).validatedValues(values)
+        return result
+
 
 class DateTimeFieldFormat(AbstractFieldFormat):
     """
     Field format accepting values that represent dates or times.
+
+    Rules consisting only of the placeholders "YYYY", "MM", "DD", "hh", "mm" and "ss" and
+    other characters except "%" and the letters of placeholders, for example "DD.MM.YYYY",
+    are compiled to a regular expression for values with exactly two digits per placeholder
+    except four for the year and exactly the other characters of the rule. Values matching
+    it are converted without `time.strptime()`, which is slow and holds a global lock. All
+    other values, for example with only one digit for the day or several blanks where the
+    rule has one, are passed to `time.strptime()` so the results and error messages are the
+    same as before.
+
+    The type of the validated values depends on `resultType`.
     """
     # We can't use a dictionary here because checks for patterns need to be in order. In
     # particular, "%" need to be checked first, and "YYYY" needs to be checked before "YY".
     _humanReadableToStrptimeMap = ["%:%%", "DD:%d", "MM:%m", "YYYY:%Y", "YY:%y", "hh:%H", "mm:%M", "ss:%S"]
 
+    # Placeholders that can be compiled with the number of digits and the index of the
+    # respective value in the arguments of `datetime.datetime()`.
+    _compilablePlaceholders = [("YYYY", 4, 0), ("MM", 2, 1), ("DD", 2, 2), ("hh", 2, 3), ("mm", 2, 4), ("ss", 2, 5)]
+
+    # Characters that must not be used as separators in compilable rules because
+    # `_humanReadableToStrptimeMap` could combine them with placeholders.
+    _uncompilableCharacters = "%YMDhms"
+
     def __init__(self, fieldName, isAllowedToBeEmpty, length, rule, dataFormat, emptyValue=None):
         super(DateTimeFieldFormat, self).__init__(fieldName, isAllowedToBeEmpty, length, rule, dataFormat, emptyValue)
         self.humanReadableFormat = rule
@@ -352,14 +831,136 @@ class DateTimeFieldFormat(AbstractFieldFormat):
             (key, value) = patternKeyValue.split(":")
             strptimeFormat = strptimeFormat.replace(key, value)
         self.strptimeFormat = strptimeFormat
+        self._compileRule()
+        self._resultType = DATE_TIME_RESULT_STRUCT_TIME
+
+    def _compileRule(self):
+        """
+        Set `_compiledRegEx` to a regular expression matching values of the rule and
+        `_compiledValueIndices` to the index in the arguments of `datetime.datetime()` each
+        group of it represents, or both to ``None`` if the rule cannot be compiled.
+        `_isCompiledInOrder` tells whether the groups already are in the order of these
+        arguments.
+        """
+        pattern = u"^"
+        valueIndices = []
+        ruleIndex = 0
+        rule = self.humanReadableFormat
+        isCompilable = True
+        while isCompilable and (ruleIndex < len(rule)):
+            placeholderFound = False
+            for placeholder, digitCount, valueIndex in DateTimeFieldFormat._compilablePlaceholders:
+                if rule.startswith(placeholder, ruleIndex):
+                    # Placeholders must not be used more than once.
+                    isCompilable = valueIndex not in valueIndices
+                    pattern += u"([0-9]{%d})" % digitCount
+                    valueIndices.append(valueIndex)
+                    ruleIndex += len(placeholder)
+                    placeholderFound = True
+                    break
+            if not placeholderFound:
+                ruleCharacter = rule[ruleIndex]
+                isCompilable = ruleCharacter not in DateTimeFieldFormat._uncompilableCharacters
+                pattern += re.escape(ruleCharacter)
+                ruleIndex += 1
+        if isCompilable:
+            self._compiledRegEx = re.compile(pattern + u"$")
+            self._compiledValueIndices = valueIndices
+            # With at least year, month and day in the order of the `datetime.datetime()`
+            # arguments, the values can be passed without rearranging them.
+            self._isCompiledInOrder = (len(valueIndices) >= 3) and (valueIndices == range(len(valueIndices)))
+        else:
+            self._compiledRegEx = None
+            self._compiledValueIndices = None
+            self._isCompiledInOrder = False
+
+    @property
+    def isCompiled(self):
+        """
+        ``True`` if the rule could be compiled so most values can be validated without
+        `time.strptime()`.
+        """
+        return self._compiledRegEx is not None
+
+    def _getResultType(self):
+        return self._resultType
+
+    def _setResultType(self, newResultType):
+        if newResultType not in _DATE_TIME_RESULT_TYPES:
+            raise FieldSyntaxError(u"date time result type is %r but must be one of: %s"
+                    % (newResultType, _tools.humanReadableList(_DATE_TIME_RESULT_TYPES)))
+        self._resultType = newResultType
+        # Discard values cached using the previous type.
+        self._valueCache = None
+
+    resultType = property(_getResultType, _setResultType, doc="""
+        Type of validated values: `DATE_TIME_RESULT_STRUCT_TIME` for a `time.struct_time`
+        like `time.strptime()` returns (the default), `DATE_TIME_RESULT_DATE` for a
+        `datetime.date`, `DATE_TIME_RESULT_DATETIME` for a `datetime.datetime` or
+        `DATE_TIME_RESULT_ORDINAL` for the number of days since 0001-01-01 plus 1 as returned
+        by `datetime.date.toordinal()`.""")
+
+    def _compiledDateTime(self, value):
+        """
+        The `datetime.datetime` ``value`` represents according to `_compiledRegEx` or
+        ``None`` if it does not match or a part of it is out of range.
+        """
+        result = None
+        match = self._compiledRegEx.match(value)
+        if match is not None:
+            if self._isCompiledInOrder:
+                dateTimeArguments = map(int, match.groups())
+            else:
+                # Use the same defaults as `time.strptime()`.
+                dateTimeArguments = [1900, 1, 1, 0, 0, 0]
+                for valueIndex, valueText in zip(self._compiledValueIndices, match.groups()):
+                    dateTimeArguments[valueIndex] = int(valueText)
+            try:
+                result = datetime.datetime(*dateTimeArguments)
+            except ValueError:
+                # Let `time.strptime()` describe the error.
+                pass
+        return result
+
+    def _convertedDateTime(self, dateTime):
+        """
+        ``dateTime`` converted to `resultType`.
+        """
+        resultType = self._resultType
+        if resultType == DATE_TIME_RESULT_STRUCT_TIME:
+            result = dateTime.timetuple()
+        elif resultType == DATE_TIME_RESULT_DATE:
+            result = dateTime.date()
+        elif resultType == DATE_TIME_RESULT_DATETIME:
+            result = dateTime
+        else:
+            assert resultType == DATE_TIME_RESULT_ORDINAL, u"resultType=%r" % resultType
+            result = dateTime.toordinal()
+        return result
 
     def validatedValue(self, value):
         assert value
 
-        try:
-            result = time.strptime(value, self.strptimeFormat)
-        except ValueError:
-            raise FieldValueError(u"date must match format %s (%s) but is: %r (%s)" % (self.humanReadableFormat, self.strptimeFormat, value, sys.exc_info()[1]))
+        if self._compiledRegEx is not None:
+            dateTime = self._compiledDateTime(value)
+        else:
+            dateTime = None
+        if dateTime is not None:
+            result = self._convertedDateTime(dateTime)
+        else:
+            try:
+                structTime = time.strptime(value, self.strptimeFormat)
+            except ValueError:
+                raise FieldValueError(u"date must match format %s (%s) but is: %r (%s)" % (self.humanReadableFormat, self.strptimeFormat, value, sys.exc_info()[1]))
+            if self._resultType == DATE_TIME_RESULT_STRUCT_TIME:
+                result = structTime
+            else:
+                try:
+                    dateTime = datetime.datetime(*structTime[:6])
+                except ValueError, error:
+                    # For example leap seconds, which `time.strptime()` accepts.
+                    raise FieldValueError(u"date must be representable as %s but is: %r (%s)" % (self._resultType, value, error))
+                result = self._convertedDateTime(dateTime)
         return result
 
 
@@ -378,6 +979,10 @@ class RegExFieldFormat(AbstractFieldFormat):
             raise FieldValueError(u"value %r must match regular expression: %r" % (value, self.rule))
         return value
 
+    def isValidValue(self, value):
+        assert value
+        return self.regex.match(value) is not None
+
 
 class PatternFieldFormat(AbstractFieldFormat):
     """
@@ -395,6 +1000,10 @@ class PatternFieldFormat(AbstractFieldFormat):
             raise FieldValueError(u"value %r must match pattern: %r (regex %r)" % (value, self.rule, self.pattern))
         return value
 
+    def isValidValue(self, value):
+        assert value
+        return self.regex.match(value) is not None
+
 
 class TextFieldFormat(AbstractFieldFormat):
     """
@@ -408,6 +1017,10 @@ class TextFieldFormat(AbstractFieldFormat):
         # TODO: Validate Text with rules like: 32..., a...z and so on.
         return value
 
+    def isValidValue(self, value):
+        assert value
+        return True
+
 
 def getFieldNameIndex(supposedFieldName, availableFieldNames):
     """
@@ -15,14 +15,13 @@ Interface control document (ICD) describing all aspects of a data driven interfa
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import codecs
 import copy
 import glob
 import imp
 import inspect
 import logging
+import operator
 import os
-import proconex
 import types
 
 import checks
@@ -36,6 +35,17 @@ import sys
 
 _log = logging.getLogger("cutplace")
 
+# Number of rows for which the values of each field are validated at once.
+_VALIDATION_CHUNK_SIZE = 256
+
+# Marker for items that still have to be validated by the function created by
+# `InterfaceControlDocument._createRowValidator()`.
+_NOT_VALIDATED = object()
+
+# Default limits for `RejectionSummary`.
+DEFAULT_MAX_ERRORS = 100
+DEFAULT_MAX_EXAMPLE_LOCATIONS = 5
+
 
 class BaseValidationListener(object):
     """
@@ -86,6 +96,123 @@ class BaseValidationListener(object):
     # TODO: Ponder: Would there be any point in `dataFormatFailed(self, error)`?
 
 
+class RejectionGroup(object):
+    """
+    Rows rejected during `InterfaceControlDocument.validate()` for the same reason, as collected
+    by `RejectionSummary`.
+    """
+    def __init__(self, name, errorClass):
+        assert errorClass is not None
+
+        self._name = name
+        self._errorClass = errorClass
+        self.count = 0
+        self.exampleLocations = []
+
+    @property
+    def name(self):
+        """
+        The name of the broken field, the description of the failed row check or ``None`` if
+        the whole row is broken, for example because it has the wrong number of items.
+        """
+        return self._name
+
+    @property
+    def errorClass(self):
+        """The class of the error that caused the rows to be rejected."""
+        return self._errorClass
+
+    def __unicode__(self):
+        if self._name is None:
+            result = u"(row)"
+        else:
+            result = self._name
+        result += u": %s: %d rows" % (self._errorClass.__name__, self.count)
+        if self.exampleLocations:
+            result += u", for example " + u", ".join([unicode(location) for location in self.exampleLocations])
+        return result
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+class RejectionSummary(object):
+    """
+    Summary of the rows rejected during `InterfaceControlDocument.validate()` grouped by field
+    or row check and error class, intended for heavily broken data.
+
+    Each `RejectionGroup` keeps the number of rejected rows and the locations of up to
+    ``maxExampleLocations`` of them. Only the first ``maxErrors`` rejected rows result in a
+    full error which is passed to the validation listeners. Further rows are merely counted,
+    so neither an error message is built nor the location copied for them.
+
+    To summarize the rejected rows, set `InterfaceControlDocument.rejectionSummary`:
+
+    >>> icd = InterfaceControlDocument()
+    >>> icd.rejectionSummary = RejectionSummary(maxErrors=10)
+    >>> # Add data format and field formats and call `icd.validate()`, then examine
+    >>> # `icd.rejectionSummary.groups`.
+    """
+    def __init__(self, maxErrors=DEFAULT_MAX_ERRORS, maxExampleLocations=DEFAULT_MAX_EXAMPLE_LOCATIONS):
+        assert maxErrors is not None
+        assert maxErrors >= 0
+        assert maxExampleLocations is not None
+        assert maxExampleLocations >= 0
+
+        self._maxErrors = maxErrors
+        self._maxExampleLocations = maxExampleLocations
+        self.reset()
+
+    @property
+    def maxErrors(self):
+        """Number of rejected rows that result in a full error passed to the listeners."""
+        return self._maxErrors
+
+    @property
+    def maxExampleLocations(self):
+        """Maximum number of example locations each `RejectionGroup` keeps."""
+        return self._maxExampleLocations
+
+    @property
+    def rejectedCount(self):
+        """The number of rejected rows in all groups."""
+        return self._rejectedCount
+
+    @property
+    def groups(self):
+        """
+        List of `RejectionGroup` with the groups having the most rejected rows first and groups
+        with the same number of rows in the order they were found.
+        """
+        return sorted(self._groups, key=lambda group: group.count, reverse=True)
+
+    def reset(self):
+        """Discard all rejected rows added so far."""
+        self._rejectedCount = 0
+        self._groups = []
+        self._keyToGroupMap = {}
+
+    def add(self, name, errorClass, location):
+        """
+        Add a row at ``location`` rejected due to an ``errorClass`` for the field or row check
+        ``name`` and return ``True`` if a full error still should be created for it.
+        """
+        assert errorClass is not None
+        assert location is not None
+
+        key = (name, errorClass)
+        group = self._keyToGroupMap.get(key)
+        if group is None:
+            group = RejectionGroup(name, errorClass)
+            self._keyToGroupMap[key] = group
+            self._groups.append(group)
+        group.count += 1
+        if len(group.exampleLocations) < self._maxExampleLocations:
+            group.exampleLocations.append(copy.copy(location))
+        self._rejectedCount += 1
+        return self._rejectedCount <= self._maxErrors
+
+
 class IcdSyntaxError(tools.CutplaceError):
     """
     General syntax error in the specification of the ICD.
@@ -108,6 +235,13 @@ class InterfaceControlDocument(object):
     _ERRORS_YIELD = "yield"
     _ALL_ERRORS_VALUES = [_ERRORS_STRICT, _ERRORS_IGNORE, _ERRORS_YIELD]
 
+    # Possible values for ``output`` parameter of `validatedRows()`.
+    _OUTPUT_ROW = "row"
+    _OUTPUT_TUPLE = "tuple"
+    _OUTPUT_RECORD = "record"
+    _OUTPUT_DICT = "dict"
+    _ALL_OUTPUT_VALUES = [_OUTPUT_ROW, _OUTPUT_TUPLE, _OUTPUT_RECORD, _OUTPUT_DICT]
+
     def __init__(self):
         """
         Create an empty ICD. To set a data format and add fields and checks,
@@ -122,6 +256,8 @@ class InterfaceControlDocument(object):
         self._checkNameToCheckMap = {}
         self._validationListeners = []
         self._logTrace = False
+        self._useMemoryMap = False
+        self._rejectionSummary = None
         self._resetCounts()
         self._location = None
         self. _checkNameToClassMap = self._createNameToClassMap(checks.AbstractCheck)
@@ -294,7 +430,12 @@ class InterfaceControlDocument(object):
             fieldClass = self._createFieldFormatClass(fieldType)
             _log.debug(u"create field: %s(%r, %r, %r)", fieldClass.__name__, fieldName, fieldType, fieldRule)
             fieldFormat = fieldClass.__new__(fieldClass, fieldName, fieldIsAllowedToBeEmpty, fieldLength, fieldRule)
-            fieldFormat.__init__(fieldName, fieldIsAllowedToBeEmpty, fieldLength, fieldRule, self._dataFormat)
+            if issubclass(fieldClass, fields.ChoiceFieldFormat):
+                # Read external choices relative to the ICD.
+                icdFolder = os.path.dirname(self._location.filePath)
+                fieldFormat.__init__(fieldName, fieldIsAllowedToBeEmpty, fieldLength, fieldRule, self._dataFormat, icdFolder)
+            else:
+                fieldFormat.__init__(fieldName, fieldIsAllowedToBeEmpty, fieldLength, fieldRule, self._dataFormat)
 
             # Validate that field name is unique.
             if fieldName in self._fieldNameToFormatMap:
@@ -368,6 +509,25 @@ class InterfaceControlDocument(object):
         self._checkNameToCheckMap[checkDescription] = check
         self._checkNames.append(checkDescription)
         assert len(self.checkNames) == len(self._checkNameToCheckMap)
+        self._setSortedFieldNamesOfChecks()
+
+    def _setSortedFieldNamesOfChecks(self):
+        """
+        Set the `sortedFieldNames` of each `checks.IsUniqueCheck` and `checks.ReferenceCheck` with
+        key fields the data are sorted by according to a `checks.IsSortedCheck`.
+        """
+        allChecks = [self._checkNameToCheckMap[checkName] for checkName in self._checkNames]
+        sortedChecks = [check for check in allChecks if isinstance(check, checks.IsSortedCheck)]
+        for keyCheck in allChecks:
+            if isinstance(keyCheck, (checks.IsUniqueCheck, checks.ReferenceCheck)):
+                sortedFieldNames = None
+                for sortedCheck in sortedChecks:
+                    if keyCheck.isSortedBy(sortedCheck.fieldNamesToCheck):
+                        sortedFieldNames = sortedCheck.fieldNamesToCheck[:len(keyCheck.fieldNamesToCheck)]
+                        break
+                if sortedFieldNames != keyCheck.sortedFieldNames:
+                    _log.info(u"%s: check %r uses order of fields: %s", self._location, keyCheck.description, sortedFieldNames)
+                    keyCheck.sortedFieldNames = sortedFieldNames
 
     def _processIcdRow(self, icdRowToProcess):
         """
@@ -480,19 +640,20 @@ class InterfaceControlDocument(object):
             needsOpen = isinstance(dataFileToValidatePath, types.StringTypes)
             hasSheet = (self._dataFormat.name not in (data.FORMAT_CSV, data.FORMAT_DELIMITED))
             location = tools.InputLocation(dataFileToValidatePath, hasCell=True, hasSheet=hasSheet)
-            if needsOpen:
-                dataFile = open(dataFileToValidatePath, "rb")
-            else:
-                dataFile = dataFileToValidatePath
         elif self._dataFormat.name == data.FORMAT_FIXED:
             needsOpen = isinstance(dataFileToValidatePath, types.StringTypes)
             location = tools.InputLocation(dataFileToValidatePath, hasColumn=True, hasCell=True)
-            if needsOpen:
-                dataFile = codecs.open(dataFileToValidatePath, "rb", self._dataFormat.encoding)
-            else:
-                dataFile = dataFileToValidatePath
         else:  # pragma: no cover
             raise NotImplementedError(u"data format: %r" % self._dataFormat.name)
+        if needsOpen:
+            dataFile = None
+            if self.useMemoryMap and (self._dataFormat.name in (data.FORMAT_CSV, data.FORMAT_DELIMITED, data.FORMAT_FIXED)):
+                dataFile = _tools.mappedFile(dataFileToValidatePath)
+            if dataFile is None:
+                # Open fixed data as bytes too so `_parsers.fixedReader` can read and decode it in blocks.
+                dataFile = open(dataFileToValidatePath, "rb")
+        else:
+            dataFile = dataFileToValidatePath
 
         return (dataFile, location, needsOpen)
 
@@ -535,7 +696,11 @@ class InterfaceControlDocument(object):
                 assert fixedLength == firstLengthItem[1]
                 longFixedLength = long(fixedLength)
                 fieldLengths.append(longFixedLength)
-            reader = _parsers.fixedReader(dataFile, fieldLengths)
+            lineDelimiter = self.dataFormat.get(data.KEY_LINE_DELIMITER)
+            if lineDelimiter == data.ANY:
+                # Without an actual line delimiter, rows simply follow each other.
+                lineDelimiter = None
+            reader = _parsers.fixedReader(dataFile, fieldLengths, self.dataFormat.encoding, lineDelimiter)
         elif self.dataFormat.name == data.FORMAT_ODS:
             sheet = self.dataFormat.get(data.KEY_SHEET)
             reader = _parsers.odsReader(dataFile, sheet)
@@ -543,7 +708,7 @@ class InterfaceControlDocument(object):
             raise NotImplementedError(u"data format: %r" % self.dataFormat.name)
         return reader
 
-    def  validatedRows(self, dataFileToValidatePath, errors="strict"):
+    def  validatedRows(self, dataFileToValidatePath, errors="strict", output="row"):
         """
         Generator for rows described using ``icd`` in the data set found at ``dataFileToValidatePath``.
         This provides a convenient way to read and process data without having to implement an own
@@ -555,112 +720,72 @@ class InterfaceControlDocument(object):
         * "ignore" - silently ignore errors and keep processing data.
         * "yield" - yield the error (inheriting from ``Exception``) instead of a rowOrError array; its up to
           the caller to check the return type before deciding how to process the result.
+
+        The ``output`` parameter defines what to yield for valid rows and takes the following values:
+
+        * "row" - the list of Unicode strings as read from the data.
+        * "tuple" - a tuple with the native values of the fields as computed by the field formats,
+          for example a ``long`` for an Integer field.
+        * "record" - an object with an attribute for each field holding its native value, see
+          `createRecordClass()`.
+        * "dict" - a dictionary mapping the field names to their native values.
         """
         assert dataFileToValidatePath is not None
         assert errors in InterfaceControlDocument._ALL_ERRORS_VALUES, \
             "errors=%r but must be one of: %s" % (errors, InterfaceControlDocument._ALL_ERRORS_VALUES)
-
-        class ValidatingProducer(proconex.Producer):
-            def __init__(self, reader, location, dataFormat):
-                assert reader is not None
-                assert location is not None
-                assert dataFormat is not None
-
-                super(ValidatingProducer, self).__init__("producer")
-                self._reader = reader
-                self._location = location
-                self._dataFormat = dataFormat
-
-            def items(self):
-                # Obtain values from the data format that will be used by various checks.
-                firstRowToValidateFieldsIn = self._dataFormat.get(data.KEY_HEADER)
-                assert firstRowToValidateFieldsIn is not None
-                assert firstRowToValidateFieldsIn >= 0
-
-                # Read data row by row.
-                # FIXME: Set location.sheet to actual sheet to validate
-                try:
-                    for rowOrError in self._reader:
-                        if location.line >= firstRowToValidateFieldsIn:
-                            yield rowOrError, copy.copy(location)
-                        location.advanceLine()
-                except tools.CutplaceUnicodeError, error:
-                    errorInfo = tools.ErrorInfo(data.DataFormatValueError(u"cannot read row %d: %s" % (location.line + 1, error)))
-                    errorInfo.reraise()
-
-        class ValidatingConsumer(proconex.ConvertingConsumer):
-            def __init__(self, icd):
-                assert icd is not None
-                super(ValidatingConsumer, self).__init__("consumer")
-                self._icd = icd
-
-            def consume(self, rowAndLocation):
-                assert rowAndLocation is not None
-                rowOrError, location = rowAndLocation
-                try:
-                    fieldFormats = self._icd._fieldFormats
-                    fieldFormatCount = len(fieldFormats)
-                    # Validate all items of the current row and collect their values in `rowMap`.
-                    maxItemCount = min(len(rowOrError), len(fieldFormats))
-                    rowMap = {}
-                    while location.cell < maxItemCount:
-                        item = rowOrError[location.cell]
-                        assert not isinstance(item, str), u"%s: item must be Unicode string instead of plain string: %r" % (location, item)
-                        fieldFormat = fieldFormats[location.cell]
-                        if __debug__:
-                            _log.debug(u"validate item %d/%d: %r with %s <- %r", location.cell + 1, fieldFormatCount, item, fieldFormat, rowOrError)
-                        rowMap[fieldFormat.fieldName] = fieldFormat.validated(item)
-                        location.advanceCell()
-                    if location.cell != len(rowOrError):
-                        raise checks.CheckError(u"unexpected data must be removed after item %d" % (location.cell), location)
-                    elif len(rowOrError) < fieldFormatCount:
-                        missingFieldNames = self._fieldNames[(len(rowOrError) - 1):]
-                        raise checks.CheckError(u"row must contain items for the following fields: %r" % missingFieldNames, location)
-
-                    # Validate rowOrError checks.
-                    for checkName in self._icd.checkNames:
-                        check = self._icd.getCheck(checkName)
-                        try:
-                            if __debug__:
-                                _log.debug(u"check row: %r", check)
-                            check.checkRow(rowMap, location)
-                        except checks.CheckError, error:
-                            raise checks.CheckError(u"row check failed: %r: %s" % (check.description, error), location)
-                    self.addItem(rowOrError)
-                except data.DataFormatValueError, error:
-                    raise data.DataFormatValueError(u"cannot process data format", location, cause=error)
-                except tools.CutplaceError, error:
-                    isFieldValueError = isinstance(error, fields.FieldValueError)
-                    if isFieldValueError:
-                        fieldName = self._icd._fieldNames[location.cell]
-                        reason = "field %r must match format: %s" % (fieldName, error)
-                        error = fields.FieldValueError(reason, location)
-                    self.addItem(tools.ErrorInfo(error))
+        assert output in InterfaceControlDocument._ALL_OUTPUT_VALUES, \
+            "output=%r but must be one of: %s" % (output, InterfaceControlDocument._ALL_OUTPUT_VALUES)
 
         self._resetCounts()
         for checkName in self.checkNames:
             check = self.getCheck(checkName)
             check.reset()
 
+        # Obtain values from the data format that will be used by various checks.
+        firstRowToValidateFieldsIn = self.dataFormat.get(data.KEY_HEADER)
+        assert firstRowToValidateFieldsIn is not None
+        assert firstRowToValidateFieldsIn >= 0
+
+        validatedValues = self._createRowValidator()
+        outputOfValues = self._createOutputOfValues(output)
+        isDebug = _log.isEnabledFor(logging.DEBUG)
         (dataFile, location, needsOpen) = self._obtainReadable(dataFileToValidatePath)
         try:
+            # Read data row by row. Rows are validated in the same thread as they are consumed
+            # because the readers already read the data in a separate thread.
+            # FIXME: Set location.sheet to actual sheet to validate
             reader = self._reader(dataFile)
-            producer = ValidatingProducer(reader, location, self._dataFormat)
-            consumer = ValidatingConsumer(self)
-            with proconex.Converter(producer, consumer) as converter:
-                for rowOrError in converter.items():
-                    if isinstance(rowOrError, tools.ErrorInfo):
-                        _log.debug(u"rejected: %s", rowOrError)
-                        if errors == "strict":
-                            rowOrError.reraise()
-                        elif errors == "yield":
-                            yield rowOrError
+            try:
+                for row, knownValues in self._rowsAndKnownValues(reader, location, firstRowToValidateFieldsIn):
+                    if location.line >= firstRowToValidateFieldsIn:
+                        errorInfo = None
+                        try:
+                            # Errors copy the location themselves, so there is no need to
+                            # copy it for each row.
+                            values = validatedValues(row, location, knownValues)
+                        except data.DataFormatValueError:
+                            raise
+                        except tools.CutplaceError, error:
+                            errorInfo = tools.ErrorInfo(error)
+                        if errorInfo is not None:
+                            _log.debug(u"rejected: %s", errorInfo)
+                            if errors == "strict":
+                                errorInfo.reraise()
+                            elif errors == "yield":
+                                yield errorInfo
+                            else:
+                                assert errors == "ignore", "errors=%r" % errors
                         else:
-                            assert errors == "ignore", "errors=%r" % errors
-                    else:
-                        # Yield data.
-                        _log.debug(u"accepted: %s", rowOrError)
-                        yield rowOrError
+                            # Yield data.
+                            if isDebug:
+                                _log.debug(u"accepted: %s", row)
+                            if outputOfValues is None:
+                                yield row
+                            else:
+                                yield outputOfValues(values)
+                    location.advanceLine()
+            except tools.CutplaceUnicodeError, error:
+                raise data.DataFormatValueError(u"cannot read row %d: %s" % (location.line + 1, error))
         finally:
             if needsOpen:
                 dataFile.close()
@@ -683,86 +808,289 @@ class InterfaceControlDocument(object):
                 elif errors == "yield":
                     yield errorInfo
 
-    def validate(self, dataFileToValidatePath):
+    def validate(self, dataFileToValidatePath, jobs=1):
         """
         Validate that all rows and items in ``dataFileToValidatePath`` conform to this interface.
         If a validation listener has been attached using `addValidationListener`, it will be
         notified about any event occurring during validation.
+
+        If ``jobs`` is greater than 1 and ``dataFileToValidatePath`` is the path of a delimited
+        file, split the data in several parts and validate them in ``jobs`` parallel processes.
+        Listeners still receive the rows in the same order as they are stored in the input. In
+        case the data cannot be validated in parallel, for example because the data format is
+        not delimited, validate them the usual way using a single process.
         """
-        # FIXME: Split up `validate()` in several smaller methods.
         assert dataFileToValidatePath is not None
+        assert jobs is not None
+        assert jobs >= 1
 
         _log.info(u"validate \"%s\"", dataFileToValidatePath)
+        # Reset checks first so their partial state does not depend on previous validations.
         self._resetCounts()
+        self._resetChecks()
+        if self._rejectionSummary is not None:
+            self._rejectionSummary.reset()
+        if jobs > 1:
+            # Import here to prevent circular import.
+            import _parallel
+
+            isParallel = _parallel.canValidateInParallel(self, dataFileToValidatePath)
+        else:
+            isParallel = False
+        if isParallel:
+            location = _parallel.validate(self, dataFileToValidatePath, jobs)
+        else:
+            (dataFile, location, needsOpen) = self._obtainReadable(dataFileToValidatePath)
+            try:
+                reader = self._reader(dataFile)
+                # TODO: Replace rowNumber by position in parser.
+
+                # Obtain values from the data format that will be used by various checks.
+                firstRowToValidateFieldsIn = self._dataFormat.get(data.KEY_HEADER)
+                self._validateRows(reader, location, firstRowToValidateFieldsIn)
+            finally:
+                if needsOpen:
+                    dataFile.close()
+        self._validateChecksAtEnd(location)
+        self._logValueCacheStatistics()
+
+    def _logValueCacheStatistics(self):
+        for fieldFormat in self._fieldFormats:
+            valueCache = fieldFormat.valueCache
+            if (valueCache is not None) and (valueCache.hits or valueCache.misses):
+                _log.info(u"value cache of %r: %d hits, %d misses, %d evictions, hit rate %.1f%%",
+                    fieldFormat.fieldName, valueCache.hits, valueCache.misses, valueCache.evictions, 100.0 * valueCache.hitRate)
+
+    def _resetChecks(self):
         for checkName in self.checkNames:
             check = self.getCheck(checkName)
             check.reset()
 
-        (dataFile, location, needsOpen) = self._obtainReadable(dataFileToValidatePath)
-        try:
-            reader = self._reader(dataFile)
-            # TODO: Replace rowNumber by position in parser.
+    def _createRowValidator(self, raisesRejections=False):
+        """
+        Function ``validatedValues(row, location, knownValues=None)`` that validates all items in
+        ``row`` using the field formats and row checks of this ICD, and returns a list with the
+        native values of the items. Items with a value in ``knownValues`` other than
+        `_NOT_VALIDATED` are already validated, see `_rowsAndKnownValues()`.
+
+        In case ``row`` is broken, it raises a `tools.CutplaceError` describing the broken part with
+        the cell of ``location`` pointing to it. A broken data format results in a
+        `data.DataFormatValueError` that should not be treated as a broken row.
+
+        Field formats, checks and their methods are resolved once when creating the function instead
+        of for each row, so it has to be created again after modifying the fields or checks.
+
+        Checks with `checks.AbstractCheck.requiredFieldNames` receive a tuple with the values of
+        these fields. A dictionary mapping the field names to the values is only built for
+        checks that implement `checks.AbstractCheck.checkRow()` instead.
+
+        If ``raisesRejections`` is ``True``, a broken row raises a `_Rejection` instead, which
+        creates the error only on demand. Items are examined with
+        `fields.AbstractFieldFormat.isValid()` before being validated, so broken items do not
+        build a `fields.FieldValueError` either.
+        """
+        fieldNames = tuple(self._fieldNames)
+        fieldCount = len(fieldNames)
+        fieldNamesAndValidateds = [(fieldFormat.fieldName, fieldFormat.validated) for fieldFormat in self._fieldFormats]
+        isValids = [fieldFormat.isValid for fieldFormat in self._fieldFormats]
+        unknownValues = (_NOT_VALIDATED,) * fieldCount
+        checksAndCheckFunctionsAndValueGetters = []
+        needsRowMap = False
+        for checkName in self.checkNames:
+            check = self.getCheck(checkName)
+            requiredFieldNames = check.requiredFieldNames
+            if requiredFieldNames is None:
+                checksAndCheckFunctionsAndValueGetters.append((check, check.checkRow, None))
+                needsRowMap = True
+            else:
+                valueGetter = _createValueGetter([self.getFieldNameIndex(fieldName) for fieldName in requiredFieldNames])
+                checksAndCheckFunctionsAndValueGetters.append((check, check.checkValues, valueGetter))
+        isDebug = _log.isEnabledFor(logging.DEBUG)
+        DataFormatValueError = data.DataFormatValueError
+        FieldValueError = fields.FieldValueError
+        CheckError = checks.CheckError
+
+        def validatedValues(row, location, knownValues=None):
+            assert row is not None
+            assert location is not None
+            if knownValues is None:
+                knownValues = unknownValues
+            result = []
+            cell = 0
+            try:
+                # Validate all items of the row and collect their values.
+                for (fieldName, validated), isValid, item, knownValue in zip(fieldNamesAndValidateds, isValids, row, knownValues):
+                    if knownValue is _NOT_VALIDATED:
+                        assert not isinstance(item, str), u"%s: item must be Unicode string instead of plain string: %r" % (location, item)
+                        if isDebug:
+                            _log.debug(u"validate item %d/%d: %r with %s <- %r", cell + 1, fieldCount, item, fieldName, row)
+                        if raisesRejections and not isValid(item):
+                            location.setCell(cell)
+                            raise _Rejection(fieldName, FieldValueError, _createItemFieldValueError, (fieldName, validated, item))
+                        result.append(validated(item))
+                    else:
+                        result.append(knownValue)
+                    cell += 1
+            except DataFormatValueError, error:
+                location.setCell(cell)
+                raise DataFormatValueError(u"cannot process data format", location, cause=error)
+            except FieldValueError, error:
+                location.setCell(cell)
+                if raisesRejections:
+                    raise _Rejection(fieldName, FieldValueError, _createFieldValueError, (fieldName, error))
+                raise _createFieldValueError(fieldName, error, location)
+            except tools.CutplaceError, error:
+                location.setCell(cell)
+                if raisesRejections:
+                    raise _Rejection(fieldName, error.__class__, _originalError, (error,))
+                raise
+
+            # Validate number of items.
+            itemCount = len(row)
+            if itemCount != fieldCount:
+                location.setCell(cell)
+                if raisesRejections:
+                    raise _Rejection(None, CheckError, _createItemCountError, (fieldNames, itemCount))
+                raise _createItemCountError(fieldNames, itemCount, location)
 
-            # Obtain values from the data format that will be used by various checks.
-            firstRowToValidateFieldsIn = self._dataFormat.get(data.KEY_HEADER)
-            assert firstRowToValidateFieldsIn is not None
-            assert firstRowToValidateFieldsIn >= 0
+            # Validate row checks.
+            if checksAndCheckFunctionsAndValueGetters:
+                location.setCell(0)
+                if needsRowMap:
+                    rowMap = dict(zip(fieldNames, result))
+                for check, checkFunction, valueGetter in checksAndCheckFunctionsAndValueGetters:
+                    try:
+                        if isDebug:
+                            _log.debug(u"check row: %r", check)
+                        if valueGetter is not None:
+                            checkFunction(valueGetter(result), location)
+                        else:
+                            checkFunction(rowMap, location)
+                    except CheckError, error:
+                        if raisesRejections:
+                            raise _Rejection(check.description, CheckError, _createRowCheckError, (check, error))
+                        raise _createRowCheckError(check, error, location)
+            return result
 
-            # Validate data row by row.
-            # FIXME: Set location.sheet to actual sheet to validate
-            try:
-                for row in reader:
-                    if location.line >= firstRowToValidateFieldsIn:
-                        try:
-                            # Validate all items of the current row and collect their values in `rowMap`.
-                            maxItemCount = min(len(row), len(self._fieldFormats))
-                            rowMap = {}
-                            while location.cell < maxItemCount:
-                                item = row[location.cell]
-                                assert not isinstance(item, str), u"%s: item must be Unicode string instead of plain string: %r" % (location, item)
-                                fieldFormat = self._fieldFormats[location.cell]
-                                if __debug__:
-                                    _log.debug(u"validate item %d/%d: %r with %s <- %r", location.cell + 1, len(self._fieldFormats), item, fieldFormat, row)
-                                rowMap[fieldFormat.fieldName] = fieldFormat.validated(item)
-                                location.advanceCell()
-                            if location.cell != len(row):
-                                raise checks.CheckError(u"unexpected data must be removed after item %d" % (location.cell), location)
-                            elif len(row) < len(self._fieldFormats):
-                                missingFieldNames = self._fieldNames[(len(row) - 1):]
-                                raise checks.CheckError(u"row must contain items for the following fields: %r" % missingFieldNames, location)
-
-                            # Validate row checks.
-                            location.setCell(0)
-                            for checkName in self.checkNames:
-                                check = self.getCheck(checkName)
-                                try:
-                                    if __debug__:
-                                        _log.debug(u"check row: %r", check)
-                                    check.checkRow(rowMap, location)
-                                except checks.CheckError, error:
-                                    raise checks.CheckError(u"row check failed: %r: %s" % (check.description, error), location)
+        return validatedValues
+
+    def _rowsAndKnownValues(self, reader, location, firstRowToValidateFieldsIn):
+        """
+        Generator for pairs of each row provided by ``reader`` and the values of its items to be
+        passed as ``knownValues`` to the function created by `_createRowValidator()`.
+
+        Rows are read in chunks of `_VALIDATION_CHUNK_SIZE`, and the items of each field are
+        validated for all rows of a chunk at once using
+        `fields.AbstractFieldFormat.validatedColumn()`. If a field has a broken item in a chunk,
+        its values are `_NOT_VALIDATED`, so the row validator validates them item by item and
+        can describe the broken one. Rows before ``firstRowToValidateFieldsIn`` and rows with
+        the wrong number of items result in ``None``.
+        """
+        assert reader is not None
+        assert location is not None
+        assert firstRowToValidateFieldsIn is not None
+
+        validatedColumns = [fieldFormat.validatedColumn for fieldFormat in self._fieldFormats]
+        fieldCount = len(validatedColumns)
+        line = location.line
+        for rows in _chunksOfRows(reader, _VALIDATION_CHUNK_SIZE):
+            knownValuesOfRows = [None] * len(rows)
+            firstDataRowIndex = max(0, firstRowToValidateFieldsIn - line)
+            rowIndices = [rowIndex for rowIndex in xrange(firstDataRowIndex, len(rows)) if len(rows[rowIndex]) == fieldCount]
+            if rowIndices:
+                columns = zip(*[rows[rowIndex] for rowIndex in rowIndices])
+                knownColumns = []
+                for validatedColumn, column in zip(validatedColumns, columns):
+                    try:
+                        knownColumns.append(validatedColumn(column))
+                    except tools.CutplaceError:
+                        knownColumns.append((_NOT_VALIDATED,) * len(rowIndices))
+                for rowIndex, knownValues in zip(rowIndices, zip(*knownColumns)):
+                    knownValuesOfRows[rowIndex] = knownValues
+            for rowAndKnownValues in zip(rows, knownValuesOfRows):
+                yield rowAndKnownValues
+            line += len(rows)
+
+    def createRecordClass(self):
+        """
+        Class for records with an attribute for each field of this ICD, as yielded by
+        `validatedRows()` with ``output="record"``. Its constructor takes a sequence with the
+        native values of all fields in the same order as `fieldNames`. The attributes are
+        declared as ``__slots__``, so records need little memory and no dictionary.
+
+        The class is created again for each call, so it reflects the current fields.
+        """
+        return type("Record", (_AbstractRecord,), {"__slots__": tuple([str(fieldName) for fieldName in self._fieldNames])})
+
+    def _createOutputOfValues(self, output):
+        """
+        Function that takes the list of native values returned by the function created by
+        `_createRowValidator()` and returns what `validatedRows()` should yield for ``output``,
+        or ``None`` if the original row should be yielded.
+        """
+        assert output in InterfaceControlDocument._ALL_OUTPUT_VALUES, \
+            "output=%r but must be one of: %s" % (output, InterfaceControlDocument._ALL_OUTPUT_VALUES)
+
+        if output == InterfaceControlDocument._OUTPUT_ROW:
+            result = None
+        elif output == InterfaceControlDocument._OUTPUT_TUPLE:
+            result = tuple
+        elif output == InterfaceControlDocument._OUTPUT_RECORD:
+            result = self.createRecordClass()
+        else:
+            assert output == InterfaceControlDocument._OUTPUT_DICT, "output=%r" % output
+            fieldNames = tuple(self._fieldNames)
+            result = lambda values: dict(zip(fieldNames, values))
+        return result
+
+    def _validateRows(self, reader, location, firstRowToValidateFieldsIn):
+        """
+        Validate all rows provided by ``reader`` with ``location`` pointing to the first row
+        and notify listeners about accepted and rejected rows. Rows before
+        ``firstRowToValidateFieldsIn`` are considered to be header rows and skipped.
+        """
+        assert reader is not None
+        assert location is not None
+        assert firstRowToValidateFieldsIn is not None
+        assert firstRowToValidateFieldsIn >= 0
+
+        # Validate data row by row.
+        # FIXME: Set location.sheet to actual sheet to validate
+        rejectionSummary = self._rejectionSummary
+        validatedValues = self._createRowValidator(rejectionSummary is not None)
+        isDebug = _log.isEnabledFor(logging.DEBUG)
+        try:
+            for row, knownValues in self._rowsAndKnownValues(reader, location, firstRowToValidateFieldsIn):
+                if location.line >= firstRowToValidateFieldsIn:
+                    try:
+                        validatedValues(row, location, knownValues)
+                        if isDebug:
                             _log.debug(u"accepted: %s", row)
-                            self.acceptedCount += 1
-                            for listener in self._validationListeners:
-                                listener.acceptedRow(row, location)
-                        except data.DataFormatValueError, error:
-                            raise data.DataFormatValueError(u"cannot process data format", location, cause=error)
-                        except tools.CutplaceError, error:
-                            isFieldValueError = isinstance(error, fields.FieldValueError)
-                            if isFieldValueError:
-                                fieldName = self._fieldNames[location.cell]
-                                reason = "field %r must match format: %s" % (fieldName, error)
-                                error = fields.FieldValueError(reason, location)
-                            self._rejectRow(row, error, location)
-                    location.advanceLine()
-            except tools.CutplaceUnicodeError, error:
-                self._rejectRow([], error, location)
-                # raise data.DataFormatValueError(u"cannot read row %d: %s" % (rowNumber + 2, error))
-        finally:
-            if needsOpen:
-                dataFile.close()
+                        self.acceptedCount += 1
+                        for listener in self._validationListeners:
+                            listener.acceptedRow(row, location)
+                    except data.DataFormatValueError:
+                        raise
+                    except _Rejection, rejection:
+                        if rejectionSummary.add(rejection.name, rejection.errorClass, location):
+                            self._rejectRow(row, rejection.createdError(location), location)
+                        else:
+                            self.rejectedCount += 1
+                    except tools.CutplaceError, error:
+                        self._rejectRow(row, error, location)
+                location.advanceLine()
+        except tools.CutplaceUnicodeError, error:
+            if rejectionSummary is not None:
+                rejectionSummary.add(None, error.__class__, location)
+            self._rejectRow([], error, location)
+            # raise data.DataFormatValueError(u"cannot read row %d: %s" % (rowNumber + 2, error))
+
+    def _validateChecksAtEnd(self, location):
+        """
+        Validate checks at end of data and notify listeners about checks that failed.
+        """
+        assert location is not None
 
-        # Validate checks at end of data.
         # TODO: For checks at end, reset location to beginning of file and sheet
         for checkName in self.checkNames:
             check = self.getCheck(checkName)
@@ -834,6 +1162,18 @@ class InterfaceControlDocument(object):
     def _setLogTrace(self, value):
         self._logTrace = value
 
+    def _getUseMemoryMap(self):
+        return self._useMemoryMap
+
+    def _setUseMemoryMap(self, value):
+        self._useMemoryMap = value
+
+    def _getRejectionSummary(self):
+        return self._rejectionSummary
+
+    def _setRejectionSummary(self, value):
+        self._rejectionSummary = value
+
     def getFieldFormat(self, fieldName):
         """
         The `fields.AbstractFieldFormat` for ``fieldName``. If no such field has been defined,
@@ -888,17 +1228,30 @@ class InterfaceControlDocument(object):
 
     logTrace = property(_getLogTrace, _setLogTrace,
         doc="If ``True``, log stack trace on rejected data items or rows.")
+    useMemoryMap = property(_getUseMemoryMap, _setUseMemoryMap,
+        doc="If ``True``, read delimited and fixed data files using a read only memory map instead of a file.")
+    rejectionSummary = property(_getRejectionSummary, _setRejectionSummary,
+        doc="""`RejectionSummary` to group the rows rejected by `validate()` in or ``None`` to
+        pass a full error for each rejected row to the listeners.""")
 
 
 class Validator(object):
     """
     Validator for tabular data organized in rows described by an `InterfaceControlDocument`.
+
+    The ``output`` parameter defines what `validatedRow()` returns for valid rows and takes the
+    same values as for `InterfaceControlDocument.validatedRows()`.
     """
-    def __init__(self, icd):
+    def __init__(self, icd, output="row"):
         assert icd is not None
+        assert output in InterfaceControlDocument._ALL_OUTPUT_VALUES, \
+            "output=%r but must be one of: %s" % (output, InterfaceControlDocument._ALL_OUTPUT_VALUES)
 
         self._icd = icd
+        self._output = output
         self._location = None
+        self._validatedValues = None
+        self._outputOfValues = None
         self._opened = False
 
     def open(self, location):
@@ -906,6 +1259,9 @@ class Validator(object):
 
         self._location = location
         self._logTrace = False
+        self._validatedValues = self._icd._createRowValidator()
+        self._outputOfValues = self._icd._createOutputOfValues(self._output)
+        self._isDebug = _log.isEnabledFor(logging.DEBUG)
         self.acceptedCount = 0
         self.rejectedCount = 0
         self.failedChecksAtEndCount = 0
@@ -954,53 +1310,22 @@ class Validator(object):
         assert self._opened, "open() must be called before validatedRow()"
         assert row is not None
         try:
-            # Validate all items of the current row and collect their values in `rowMap`.
-            fieldCount = len(self.icd.fieldNames)
-            maxItemCount = min(len(row), fieldCount)
-            rowMap = {}
-            while self.location.cell < maxItemCount:
-                item = row[self.location.cell]
-                assert not isinstance(item, str), u"%s: item must be Unicode string instead of plain string: %r" % (self.location, item)
-                fieldFormat = self.icd.fieldFormatAt(self.location.cell)
-                if __debug__:
-                    _log.debug(u"validate item %d/%d: %r with %s <- %r", self.location.cell + 1, fieldCount, item, fieldFormat, row)
-                rowMap[fieldFormat.fieldName] = fieldFormat.validated(item)
-                self.location.advanceCell()
-
-            # Validate number of rows.
-            if self.location.cell != len(row):
-                raise checks.CheckError(u"unexpected data must be removed after item %d" % (self.location.cell), self.location)
-            elif len(row) < fieldCount:
-                missingFieldNames = self._fieldNames[(len(row) - 1):]
-                raise checks.CheckError(u"row must contain items for the following fields: %r" % missingFieldNames, self.location)
-
-            # Validate row checks.
-            self.location.setCell(0)
-            for checkName in self.icd.checkNames:
-                check = self.icd.checkFor(checkName)
-                try:
-                    if __debug__:
-                        _log.debug(u"check row: %r", check)
-                    check.checkRow(rowMap, self.location)
-                except checks.CheckError, error:
-                    raise checks.CheckError(u"row check failed: %r: %s" % (check.description, error), self.location)
-            _log.debug(u"accepted: %s", row)
+            values = self._validatedValues(row, self.location)
+            if self._isDebug:
+                _log.debug(u"accepted: %s", row)
             self.acceptedCount += 1
-            result = row
-        except data.DataFormatValueError, error:
-            raise data.DataFormatValueError(u"cannot process data format", self.location, cause=error)
+            if self._outputOfValues is None:
+                result = row
+            else:
+                result = self._outputOfValues(values)
+        except data.DataFormatValueError:
+            raise
         except tools.CutplaceError, error:
-            isFieldValueError = isinstance(error, fields.FieldValueError)
-            if isFieldValueError:
-                fieldName = self.icd.fieldNames[self.location.cell]
-                reason = u"field '%s' must match format: %s" % (fieldName, error)
-                error = fields.FieldValueError(reason, self.location)
             errorWithReason = self._errorForRejectedRow(row, error)
             _log.debug(u"rejected: %s", row)
             _log.debug(u"%s", errorWithReason, exc_info=self.logTrace)
             self.rejectedCount += 1
             raise errorWithReason
-        # TODO: If requested, return native row or map.
         return result
 
     def close(self):
@@ -1137,7 +1462,7 @@ def createSniffedInterfaceControlDocument(readable, **keywords):
     return result
 
 
-def  validatedRows(icd, dataFileToValidatePath, errors="strict"):
+def  validatedRows(icd, dataFileToValidatePath, errors="strict", output="row"):
     """
     Generator for rows described using ``icd`` in the data set found at ``dataFileToValidatePath``.
     This provides a convenient way to read and process data without having to implement an own
@@ -1149,13 +1474,166 @@ def  validatedRows(icd, dataFileToValidatePath, errors="strict"):
     * "ignore" - silently ignore errors and keep processing data.
     * "yield" - yield the error (inheriting from ``Exception``) instead of a row array; its up to
       the caller to check the return type before deciding how to process the result.
+
+    The ``output`` parameter defines what to yield for valid rows, see
+    `InterfaceControlDocument.validatedRows()`.
     """
     assert icd is not None
     assert dataFileToValidatePath is not None
     assert errors in InterfaceControlDocument._ALL_ERRORS_VALUES, \
         "errors=%r but must be one of: %s" % (errors, InterfaceControlDocument._ALL_ERRORS_VALUES)
+    assert output in InterfaceControlDocument._ALL_OUTPUT_VALUES, \
+        "output=%r but must be one of: %s" % (output, InterfaceControlDocument._ALL_OUTPUT_VALUES)
+
+    return icd.validatedRows(dataFileToValidatePath, errors, output)
+
+
+class _AbstractRecord(object):
+    """
+    Base class for records created by `InterfaceControlDocument.createRecordClass()`. Child
+    classes declare the field names as ``__slots__``.
+    """
+    __slots__ = ()
+
+    def __init__(self, values):
+        assert values is not None
+        assert len(values) == len(self.__slots__), \
+            u"values must match %d fields but are %d: %r" % (len(self.__slots__), len(values), values)
+        for fieldName, value in zip(self.__slots__, values):
+            setattr(self, fieldName, value)
+
+    def __eq__(self, other):
+        # Use no helper methods because the field names could hide them.
+        return isinstance(other, _AbstractRecord) and (self.__slots__ == other.__slots__) \
+            and all([getattr(self, fieldName) == getattr(other, fieldName) for fieldName in self.__slots__])
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        fieldTexts = ["%s=%r" % (fieldName, getattr(self, fieldName)) for fieldName in self.__slots__]
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(fieldTexts))
 
-    return icd.validatedRows(dataFileToValidatePath, errors)
+
+def _chunksOfRows(reader, chunkSize):
+    """
+    Generator for lists with up to ``chunkSize`` rows provided by ``reader``. If ``reader`` fails,
+    the rows read before are yielded first before the error is raised again.
+    """
+    assert reader is not None
+    assert chunkSize > 0
+
+    chunk = []
+    try:
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunkSize:
+                yield chunk
+                chunk = []
+    except Exception:
+        errorType, error, traceback = sys.exc_info()
+        if chunk:
+            yield chunk
+        raise errorType, error, traceback
+    if chunk:
+        yield chunk
+
+
+def _createValueGetter(valueIndices):
+    """
+    Function that takes a list of values and returns a tuple with the values at
+    ``valueIndices``.
+    """
+    assert valueIndices
+
+    if len(valueIndices) == 1:
+        valueIndex = valueIndices[0]
+        result = lambda values: (values[valueIndex],)
+    else:
+        result = operator.itemgetter(*valueIndices)
+    return result
+
+
+class _Rejection(Exception):
+    """
+    Exception raised instead of the error describing a broken row by the function created by
+    `InterfaceControlDocument._createRowValidator()` with ``raisesRejections=True``. The error
+    is only created when calling `createdError()`.
+    """
+    def __init__(self, name, errorClass, createError, arguments):
+        assert errorClass is not None
+        assert createError is not None
+        assert arguments is not None
+
+        # Note: We cannot use `super` because `Exception` is an old style class.
+        Exception.__init__(self)
+        self.name = name
+        self.errorClass = errorClass
+        self._createError = createError
+        self._arguments = arguments
+
+    def createdError(self, location):
+        """
+        The error describing the broken row at ``location``.
+        """
+        assert location is not None
+        return self._createError(*(self._arguments + (location,)))
+
+
+def _createFieldValueError(fieldName, error, location):
+    """
+    `fields.FieldValueError` to describe that the item at ``location`` does not match the format
+    of field ``fieldName`` because of ``error``.
+    """
+    return fields.FieldValueError(u"field %r must match format: %s" % (fieldName, error), location)
+
+
+def _createItemFieldValueError(fieldName, validated, item, location):
+    """
+    Like `_createFieldValueError()` but for the broken ``item`` of field ``fieldName``, which
+    ``validated`` rejects with the `fields.FieldValueError` describing why.
+    """
+    result = None
+    try:
+        validated(item)
+    except fields.FieldValueError, error:
+        result = _createFieldValueError(fieldName, error, location)
+    assert result is not None, u"item must be broken: %r" % item
+    return result
+
+
+def _createItemCountError(fieldNames, itemCount, location):
+    """
+    `checks.CheckError` to describe that the row at ``location`` has ``itemCount`` items instead
+    of one for each of ``fieldNames``.
+    """
+    fieldCount = len(fieldNames)
+    assert itemCount != fieldCount
+
+    if itemCount > fieldCount:
+        result = checks.CheckError(u"unexpected data must be removed after item %d" % fieldCount, location)
+    else:
+        missingFieldNames = list(fieldNames[itemCount:])
+        result = checks.CheckError(u"row must contain items for the following fields: %r" % missingFieldNames, location)
+    return result
+
+
+def _originalError(error, location):
+    """
+    Simply ``error``, which already describes the problem at ``location`` on its own.
+    """
+    return error
+
+
+def _createRowCheckError(check, error, location):
+    """
+    `checks.CheckError` to describe that ``check`` failed for the row at ``location`` because of
+    ``error``, which is retained as ``cause``.
+    """
+    assert check is not None
+    assert error is not None
+    assert location is not None
+    return checks.CheckError(u"row check failed: %r: %s" % (check.description, error), location, cause=error)
 
 
 def _createDelimitedDialect(icd):
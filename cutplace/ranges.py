@@ -17,7 +17,10 @@ format.
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import bisect
+import re
 import StringIO
+import sys
 import token
 import tokenize
 
@@ -25,6 +28,10 @@ import tools
 import _tools
 
 
+_NEGATIVE_INFINITY = float("-inf")
+_POSITIVE_INFINITY = float("inf")
+
+
 class RangeSyntaxError(tools.CutplaceError):
     """
     Error in Range declaration.
@@ -54,6 +61,8 @@ class Range(object):
         """
         assert default is None or default.strip(), u"default=%r" % default
 
+        self._invalidCharacterRegEx = None
+
         # Find out if a `text` has been specified and if not, use optional `default` instead.
         hasText = (text is not None) and text.strip()
         if not hasText and default is not None:
@@ -162,6 +171,13 @@ class Range(object):
                     self._items.append(result)
                 if _tools.isEofToken(nextToken):
                     endReached = True
+        self._isWithin = self._compiledIsWithin()
+        # Single interval (lower, upper) covering the whole range or ``None``.
+        self._interval = None
+        if self._items is not None:
+            intervals = self._mergedIntervals()
+            if len(intervals) == 1:
+                self._interval = intervals[0]
 
     @property
     def description(self):
@@ -255,6 +271,82 @@ class Range(object):
                 result = (value >= lower) and (value <= upper)
         return result
 
+    def _mergedIntervals(self):
+        """
+        `items` sorted by their lower limit with adjacent items merged, for example "7:9, 1:3,
+        4:5" results in ``[(1, 5), (7, 9)]``. Missing limits are represented by infinite floats,
+        which Python compares correctly with integers of any size.
+        """
+        assert self._items is not None
+
+        result = []
+        for lower, upper in sorted(self._items, key=lambda item: _tools.valueOr(item[0], _NEGATIVE_INFINITY)):
+            lower = _tools.valueOr(lower, _NEGATIVE_INFINITY)
+            upper = _tools.valueOr(upper, _POSITIVE_INFINITY)
+            # Items do not overlap, so they can only be adjacent.
+            if result and (result[-1][1] + 1 == lower):
+                result[-1] = (result[-1][0], upper)
+            else:
+                result.append((lower, upper))
+        return result
+
+    def _compiledIsWithin(self):
+        """
+        Function that takes a value and returns ``True`` if it is within the range. A single
+        interval, which is the most common case, results in a single comparison. Otherwise the
+        interval that might contain the value is located using a binary search.
+        """
+        if self._items is None:
+            result = lambda value: True
+        else:
+            intervals = self._mergedIntervals()
+            if len(intervals) == 1:
+                lower, upper = intervals[0]
+                if lower == _NEGATIVE_INFINITY:
+                    if upper == _POSITIVE_INFINITY:
+                        result = lambda value: True
+                    else:
+                        result = lambda value: value <= upper
+                elif upper == _POSITIVE_INFINITY:
+                    result = lambda value: value >= lower
+                elif lower == upper:
+                    result = lambda value: value == lower
+                else:
+                    result = lambda value: lower <= value <= upper
+            else:
+                lowers = [lower for lower, _ in intervals]
+                uppers = [upper for _, upper in intervals]
+
+                def result(value):
+                    intervalIndex = bisect.bisect_right(lowers, value) - 1
+                    return (intervalIndex >= 0) and (value <= uppers[intervalIndex])
+        return result
+
+    def isWithin(self, value):
+        """
+        ``True`` if ``value`` is within the range. Unlike `validate()`, this does not need a
+        name to describe the value, so callers only have to build one if the value is outside
+        the range.
+        """
+        assert value is not None
+        return self._isWithin(value)
+
+    def isEachWithin(self, values):
+        """
+        ``True`` if each of ``values`` is within the range. For a range with a single interval,
+        only the smallest and largest value have to be compared.
+        """
+        assert values is not None
+
+        if (self._items is None) or not values:
+            result = True
+        elif self._interval is not None:
+            lower, upper = self._interval
+            result = (lower <= min(values)) and (max(values) <= upper)
+        else:
+            result = all(map(self._isWithin, values))
+        return result
+
     def validate(self, name, value):
         """
         Validate that value is within the specified range and in case it is not, raise a `RangeValueError`.
@@ -263,20 +355,77 @@ class Range(object):
         assert name
         assert value is not None
 
+        if not self.isWithin(value):
+            raise self.error(name, value)
+
+    def error(self, name, value):
+        """
+        `RangeValueError` describing that ``value`` described by ``name`` is outside of the
+        range, for callers that already know it is from `isWithin()`.
+        """
+        assert name is not None
+        assert name
+        assert value is not None
+
+        return RangeValueError(u"%s is %r but must be within range: %r" % (name, value, self))
+
+    def _compileInvalidCharacterRegEx(self):
+        """
+        Regular expression matching any character with a code outside of the range.
+        """
+        characterClass = u""
+        for lower, upper in self._items:
+            lower = max(0, _tools.valueOr(lower, 0))
+            upper = min(sys.maxunicode, _tools.valueOr(upper, sys.maxunicode))
+            if lower <= upper:
+                characterClass += re.escape(unichr(lower))
+                if lower < upper:
+                    characterClass += u"-" + re.escape(unichr(upper))
+        if characterClass:
+            result = re.compile(u"[^%s]" % characterClass)
+        else:
+            result = re.compile(u".", re.DOTALL)
+        return result
+
+    def compileCharacters(self):
+        """
+        Compile the range to the regular expression `isEachCharacterWithin()` and
+        `validateCharacters()` use to examine all characters of a text at once, unless this
+        already happened. Otherwise, this happens when examining the first text.
+        """
+        if (self._items is not None) and (self._invalidCharacterRegEx is None):
+            self._invalidCharacterRegEx = self._compileInvalidCharacterRegEx()
+
+    def isEachCharacterWithin(self, text):
+        """
+        ``True`` if the code of each character in ``text`` is within the range. Like
+        `isWithin()`, this does not need a name to describe a broken character.
+        """
+        assert text is not None
+
+        if self._items is None:
+            result = True
+        else:
+            self.compileCharacters()
+            result = (self._invalidCharacterRegEx.search(text) is None)
+        return result
+
+    def validateCharacters(self, name, text):
+        """
+        Validate that the code of each character in ``text`` is within the range and in case one
+        is not, raise a `RangeValueError` for the first such character like `validate()` does.
+
+        Unless `compileCharacters()` has been called already, the first call compiles the range
+        to a regular expression, so all characters of ``text`` are examined at once instead of
+        one by one.
+        """
+        assert name is not None
+        assert name
+        assert text is not None
+
         if self._items is not None:
-            isValid = False
-            itemIndex = 0
-            while not isValid and itemIndex < len(self._items):
-                lower, upper = self._items[itemIndex]
-                if lower is None:
-                    assert upper is not None
-                    if value <= upper:
-                        isValid = True
-                elif upper is None:
-                    if value >= lower:
-                        isValid = True
-                elif (value >= lower) and (value <= upper):
-                    isValid = True
-                itemIndex += 1
-            if not isValid:
-                raise RangeValueError(u"%s is %r but must be within range: %r" % (name, value, self))
+            self.compileCharacters()
+            invalidCharacterMatch = self._invalidCharacterRegEx.search(text)
+            if invalidCharacterMatch is not None:
+                # Raise the same error as for a single character.
+                raise self.error(name, ord(invalidCharacterMatch.group()))
@@ -22,6 +22,7 @@ import sys
 import unittest
 
 import checks
+import columns
 import data
 import fields
 import interface
@@ -30,11 +31,13 @@ import sniff
 import tools
 import version
 import test_checks
+import test_columns
 import test_cutplace
 import test_data
 import test_interface
 import test_fields
 import test_ods
+import test_parallel
 import test_parsers
 import test_ranges
 import test_sniff
@@ -55,14 +58,17 @@ def createTestSuite():
     loader = unittest.TestLoader()
 
     # TODO: Automatically discover doctest cases.
-    for module in checks, data, fields, interface, ranges, sniff, tools, version, _cutplace, _ods, _parsers, _tools, _web:
+    for module in checks, columns, data, fields, interface, ranges, sniff, tools, version, _cutplace, _ods, _parsers, _tools, _web:
         result.addTest(doctest.DocTestSuite(module))
     result.addTest(doctest.DocFileSuite(os.path.join("docs", "api.rst"), module_relative=False))
 
     # TODO: Automatically discover test cases.
     allTests = [
             test_checks.DistinctCountCheckTest,
+            test_checks.IsSortedCheckTest,
             test_checks.IsUniqueCheckTest,
+            test_checks.ReferenceCheckTest,
+            test_columns.ColumnBatchTest,
             test_cutplace.CutplaceTest,
             test_data.DataFormatTest,
             test_interface.InterfaceControlDocumentTest,
@@ -73,12 +79,18 @@ def createTestSuite():
             test_fields.IntegerFieldFormatTest,
             test_fields.PatternFieldFormatTest,
             test_fields.RegExFieldFormatTest,
+            test_fields.ValueCacheTest,
             test_ods.OdsTest,
+            test_parallel.DelimitedSplitterTest,
+            test_parallel.ParallelValidationTest,
             test_parsers.DelimitedParserTest,
             test_parsers.ExcelReaderTest,
             test_parsers.FixedParserTest,
+            test_parsers.OdsReaderTest,
             test_ranges.RangeTest,
             test_sniff.SniffTest,
+            test_tools.BoundedCacheTest,
+            test_tools.MappedFileTest,
             test_tools.ToolsTest
             # FIXME: Stop server and add: test_web.WebTest
             ]
@@ -16,8 +16,11 @@ Tests for `checks` module.
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import checks
+import dev_test
 import fields
+import json
 import logging
+import os
 import unittest
 
 import tools
@@ -62,6 +65,19 @@ class _AbstractCheckTest(unittest.TestCase):
         location = tools.InputLocation(self.testCheckRow, hasCell=True)
         check.checkRow([], location)
 
+    def testFailsOnCheckValuesWithoutImplementation(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.AbstractCheck("test check", "", fieldNames)
+        self.assertEqual(check.requiredFieldNames, None)
+        location = tools.InputLocation(self.testFailsOnCheckValuesWithoutImplementation, hasCell=True)
+        self.assertRaises(NotImplementedError, check.checkValues, (), location)
+
+    def testFailsOnPartialStateWithoutImplementation(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.AbstractCheck("test check", "", fieldNames)
+        self.assertRaises(NotImplementedError, check.partialState)
+        self.assertRaises(NotImplementedError, check.mergePartialState, None)
+
 
 class IsUniqueCheckTest(_AbstractCheckTest):
     def testIsUniqueCheck(self):
@@ -84,6 +100,169 @@ class IsUniqueCheckTest(_AbstractCheckTest):
         check.checkAtEnd(location)
         check.cleanup()
 
+    def testCanMergePartialState(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        location = tools.InputLocation(self.testCanMergePartialState, hasCell=True)
+        check.checkRow(_createFieldMap(fieldNames, [38000, 23, "John", "Doe", "male", "08.03.1957"]), location)
+        location.advanceLine()
+        check.checkRow(_createFieldMap(fieldNames, [38000, 59, "Jane", "Miller", "female", "04.10.1946"]), location)
+        firstPartialState = check.partialState()
+
+        otherCheck = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        otherLocation = tools.InputLocation(self.testCanMergePartialState, hasCell=True)
+        otherCheck.checkRow(_createFieldMap(fieldNames, [38000, 17, "Mike", "Webster", "male", "23.12.1974"]), otherLocation)
+        otherLocation.advanceLine()
+        otherCheck.checkRow(_createFieldMap(fieldNames, [38000, 59, "Jane", "Miller", "female", "04.10.1946"]), otherLocation)
+        secondPartialState = otherCheck.partialState()
+
+        mergedCheck = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        self.assertEqual(mergedCheck.mergePartialState(firstPartialState), [])
+        conflictErrors = mergedCheck.mergePartialState(secondPartialState, 2)
+        self.assertEqual(len(conflictErrors), 1)
+        conflictError = conflictErrors[0]
+        self.assertEqual(conflictError.location.line, 3)
+        self.assertEqual(conflictError.seeAlsoLocation.line, 1)
+        self.assertEqual(len(mergedCheck.uniqueValues), 3)
+
+    def testCanStoreKeysOnDisk(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        check.maxKeysInMemory = 2
+        location = tools.InputLocation(self.testCanStoreKeysOnDisk, hasCell=True)
+        for customerId in range(5):
+            check.checkRow(_createFieldMap(fieldNames, [38000, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+            location.advanceLine()
+        self.assertTrue(len(check.uniqueValues) <= 2)
+        try:
+            check.checkRow(_createFieldMap(fieldNames, [38000, 1, "Jane", "Miller", "female", "04.10.1946"]), location)
+            self.fail("duplicate row must cause CheckError")
+        except checks.CheckError, error:
+            self.assertEqual(error.location.line, 5)
+            self.assertEqual(error.seeAlsoLocation.line, 1)
+            self.assertTrue("[38000, 1]" in unicode(error), u"error=%s" % error)
+
+        self.assertRaises(NotImplementedError, check.partialState)
+        check.cleanup()
+
+    def testCanMergeMoreKeysThanInMemory(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        location = tools.InputLocation(self.testCanMergeMoreKeysThanInMemory, hasCell=True)
+        for customerId in range(5):
+            check.checkRow(_createFieldMap(fieldNames, [38000, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+            location.advanceLine()
+        mergedCheck = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        mergedCheck.maxKeysInMemory = 3
+        self.assertEqual(mergedCheck.mergePartialState(check.partialState()), [])
+        self.assertTrue(len(mergedCheck.uniqueValues) <= 3)
+        conflictErrors = mergedCheck.mergePartialState(check.partialState(), 10)
+        self.assertEqual(len(conflictErrors), 5)
+        self.assertEqual(sorted([error.seeAlsoLocation.line for error in conflictErrors]), range(5))
+        self.assertRaises(NotImplementedError, mergedCheck.partialState)
+        mergedCheck.cleanup()
+
+    def _checkKeysToStore(self, keyStorePath, customerIds, maxKeysInMemory=checks.DEFAULT_MAX_UNIQUE_KEYS_IN_MEMORY):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+        check.keyStorePath = keyStorePath
+        check.maxKeysInMemory = maxKeysInMemory
+        check.sortedFieldNames = ["branch_id", "customer_id"]
+        location = tools.InputLocation(self._checkKeysToStore, hasCell=True)
+        try:
+            for customerId in customerIds:
+                check.checkRow(_createFieldMap(fieldNames, [38000, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+                location.advanceLine()
+            check.checkAtEnd(location)
+        finally:
+            check.cleanup()
+
+    def testCanCheckKeysOfPreviousData(self):
+        keyStorePath = dev_test.getTestOutputPath("unique_keys.db")
+        if os.path.exists(keyStorePath):
+            os.remove(keyStorePath)
+        self._checkKeysToStore(keyStorePath, range(5), 2)
+        self._checkKeysToStore(keyStorePath, range(5, 10))
+        try:
+            self._checkKeysToStore(keyStorePath, [10, 11, 7, 12, 3, 2, 1], 3)
+            self.fail("previous keys must cause CheckError")
+        except checks.CheckError, error:
+            self.assertEqual(error.seeAlsoLocation.line, 2)
+            self.assertTrue("but 4 keys did: [38000, 7], [38000, 3], [38000, 2], ..." in unicode(error), u"error=%s" % error)
+        # Keys of rejected data must not be stored.
+        self._checkKeysToStore(keyStorePath, [10, 11, 12])
+
+    def testCanCheckKeysOfPreviousDataInBatches(self):
+        keyStorePath = dev_test.getTestOutputPath("unique_keys_in_batches.db")
+        if os.path.exists(keyStorePath):
+            os.remove(keyStorePath)
+        self._checkKeysToStore(keyStorePath, [3, 7])
+        fieldNames = _getTestFieldNames()
+        originalKeyStoreBatchSize = checks._KEY_STORE_BATCH_SIZE
+        checks._KEY_STORE_BATCH_SIZE = 2
+        try:
+            check = checks.IsUniqueCheck("test check", "branch_id, customer_id", fieldNames)
+            check.keyStorePath = keyStorePath
+            check.sortedFieldNames = ["branch_id", "customer_id"]
+            location = tools.InputLocation(self.testCanCheckKeysOfPreviousDataInBatches, hasCell=True)
+            try:
+                for customerId in [1, 3, 5, 6, 7, 8]:
+                    # Keys found in the store must not reject the row completing the batch.
+                    check.checkRow(_createFieldMap(fieldNames, [38000, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+                    location.advanceLine()
+                # The sorted data need no keys in memory even with a key store.
+                self.assertEqual(check.uniqueValues, {})
+                self.assertRaises(NotImplementedError, check.partialState)
+                try:
+                    check.checkAtEnd(location)
+                    self.fail("previous keys must cause CheckError")
+                except checks.CheckError, error:
+                    self.assertEqual(error.location.line, 6)
+                    self.assertEqual(error.seeAlsoLocation.line, 1)
+                    self.assertTrue("but 2 keys did: [38000, 3], [38000, 7]" in unicode(error), u"error=%s" % error)
+            finally:
+                check.cleanup()
+        finally:
+            checks._KEY_STORE_BATCH_SIZE = originalKeyStoreBatchSize
+        # Keys of rejected data must not be stored.
+        self._checkKeysToStore(keyStorePath, [1, 5, 6])
+
+    def testCanCheckSortedKeys(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsUniqueCheck("test check", "customer_id, branch_id", fieldNames)
+        self.assertTrue(check.isSortedBy(["branch_id", "customer_id", "surname"]))
+        self.assertFalse(check.isSortedBy(["branch_id"]))
+        self.assertFalse(check.isSortedBy(["branch_id", "surname", "customer_id"]))
+        check.sortedFieldNames = ["branch_id", "customer_id", "surname"]
+        self.assertEqual(check.sortedFieldNames, ["branch_id", "customer_id"])
+        location = tools.InputLocation(self.testCanCheckSortedKeys, hasCell=True)
+        for branchId, customerId in [(38000, 23), (38000, 24), (38001, 17)]:
+            check.checkRow(_createFieldMap(fieldNames, [branchId, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+            location.advanceLine()
+        try:
+            check.checkRow(_createFieldMap(fieldNames, [38001, 17, "Jane", "Miller", "female", "04.10.1946"]), location)
+            self.fail("duplicate row must cause CheckError")
+        except checks.CheckError, error:
+            self.assertEqual(error.location.line, 3)
+            self.assertEqual(error.seeAlsoLocation.line, 2)
+            self.assertTrue("[17, 38001]" in unicode(error), u"error=%s" % error)
+        self.assertEqual(check.uniqueValues, {})
+
+        otherCheck = checks.IsUniqueCheck("test check", "customer_id, branch_id", fieldNames)
+        otherCheck.sortedFieldNames = ["branch_id", "customer_id"]
+        otherLocation = tools.InputLocation(self.testCanCheckSortedKeys, hasCell=True)
+        for branchId, customerId in [(38001, 17), (38002, 1)]:
+            otherCheck.checkRow(_createFieldMap(fieldNames, [branchId, customerId, "John", "Doe", "male", "08.03.1957"]), otherLocation)
+            otherLocation.advanceLine()
+        mergedCheck = checks.IsUniqueCheck("test check", "customer_id, branch_id", fieldNames)
+        mergedCheck.sortedFieldNames = ["branch_id", "customer_id"]
+        self.assertEqual(mergedCheck.mergePartialState(check.partialState()), [])
+        conflictErrors = mergedCheck.mergePartialState(otherCheck.partialState(), 4)
+        self.assertEqual(len(conflictErrors), 1)
+        self.assertEqual(conflictErrors[0].location.line, 4)
+        self.assertEqual(conflictErrors[0].seeAlsoLocation.line, 2)
+        self.assertEqual(mergedCheck.mergePartialState(otherCheck.partialState(), 6), [])
+
     def testBrokenUniqueCheckWithMissingFields(self):
         fieldNames = _getTestFieldNames()
         self.assertRaises(checks.CheckSyntaxError, checks.IsUniqueCheck, "test check", "", fieldNames)
@@ -113,6 +292,186 @@ class IsUniqueCheckTest(_AbstractCheckTest):
         self.assertRaises(checks.CheckSyntaxError, checks.IsUniqueCheck, "test check", brokenUniqueFieldNames, fieldNames)
 
 
+class IsSortedCheckTest(unittest.TestCase):
+    def testIsSortedCheck(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.IsSortedCheck("test check", "branch_id, customer_id", fieldNames)
+        location = tools.InputLocation(self.testIsSortedCheck, hasCell=True)
+        for branchId, customerId in [(38000, 23), (38000, 23), (38000, 59), (38001, 1)]:
+            check.checkRow(_createFieldMap(fieldNames, [branchId, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+            location.advanceLine()
+        try:
+            check.checkRow(_createFieldMap(fieldNames, [38000, 60, "Jane", "Miller", "female", "04.10.1946"]), location)
+            self.fail("unsorted row must cause CheckError")
+        except checks.CheckError, error:
+            self.assertEqual(error.location.line, 4)
+            self.assertEqual(error.seeAlsoLocation.line, 3)
+        location.advanceLine()
+        check.checkRow(_createFieldMap(fieldNames, [38001, 2, "Jane", "Miller", "female", "04.10.1946"]), location)
+
+    def testCanMergePartialState(self):
+        fieldNames = _getTestFieldNames()
+        mergedCheck = checks.IsSortedCheck("test check", "branch_id", fieldNames)
+        self.assertEqual(mergedCheck.mergePartialState(mergedCheck.partialState()), [])
+        lineOffset = 0
+        conflictErrors = []
+        for branchIds in ([38000, 38001], [38001, 38003], [38002, 38004]):
+            check = checks.IsSortedCheck("test check", "branch_id", fieldNames)
+            location = tools.InputLocation(self.testCanMergePartialState, hasCell=True)
+            for branchId in branchIds:
+                check.checkRow(_createFieldMap(fieldNames, [branchId, 23, "John", "Doe", "male", "08.03.1957"]), location)
+                location.advanceLine()
+            conflictErrors.extend(mergedCheck.mergePartialState(check.partialState(), lineOffset))
+            lineOffset += len(branchIds)
+        self.assertEqual(len(conflictErrors), 1)
+        self.assertEqual(conflictErrors[0].location.line, 4)
+        self.assertEqual(conflictErrors[0].seeAlsoLocation.line, 3)
+
+    def testFailsOnDuplicateFieldName(self):
+        fieldNames = _getTestFieldNames()
+        self.assertRaises(checks.CheckSyntaxError, checks.IsSortedCheck, "test check", "branch_id, branch_id", fieldNames)
+        self.assertRaises(checks.CheckSyntaxError, checks.IsSortedCheck, "test check", "", fieldNames)
+
+
+# ICD for referenced customers sorted by branch and customer.
+_REFERENCED_ICD = """,Interface: referenced customers
+D,Format,CSV
+D,Line delimiter,any
+D,Item delimiter,","
+,Name,Example,Empty,Length,Type,Rule
+F,branch_id,38000,,,RegEx,38\\d\\d\\d
+F,customer_id,23,,,Integer,0:99999
+F,name,John,X,,Text,
+C,customers must be sorted,IsSorted,"branch_id, customer_id"
+"""
+
+
+class ReferenceCheckTest(unittest.TestCase):
+    def setUp(self):
+        self._icdPath = dev_test.getTestOutputPath("reference_icd.csv")
+        self._dataPath = dev_test.getTestOutputPath("reference_customers.csv")
+        self._indexFolder = dev_test.getTestOutputPath("reference_indices")
+        if not os.path.exists(self._indexFolder):
+            os.mkdir(self._indexFolder)
+        self._writeText(self._icdPath, _REFERENCED_ICD)
+        self._writeReferencedCustomers([(38000, 23), (38000, 59), (38001, 17), ("broken", 1), (38053, 17)])
+
+    def _writeText(self, path, text):
+        targetFile = open(path, "wb")
+        try:
+            targetFile.write(text)
+        finally:
+            targetFile.close()
+
+    def _writeReferencedCustomers(self, branchAndCustomerIds):
+        self._writeText(self._dataPath, "".join(["%s,%s,John\n" % ids for ids in branchAndCustomerIds]))
+
+    def _createCheck(self, rule=None):
+        if rule is None:
+            rule = u"branch_id, customer_id references branch_id, customer_id in \"%s\" using \"%s\"" \
+                    % (self._dataPath, self._icdPath)
+        result = checks.ReferenceCheck("test check", rule, _getTestFieldNames())
+        result.indexFolder = self._indexFolder
+        return result
+
+    def _assertReferences(self, check, branchAndCustomerIds, expectedMissingLines):
+        fieldNames = _getTestFieldNames()
+        location = tools.InputLocation(self._assertReferences, hasCell=True)
+        missingLines = []
+        for branchId, customerId in branchAndCustomerIds:
+            try:
+                check.checkRow(_createFieldMap(fieldNames, [branchId, customerId, "John", "Doe", "male", "08.03.1957"]), location)
+            except checks.CheckError, error:
+                self.assertTrue("must occur in" in unicode(error), u"error=%s" % error)
+                missingLines.append(error.location.line)
+            location.advanceLine()
+        self.assertEqual(missingLines, expectedMissingLines)
+
+    def testCanCheckReferences(self):
+        check = self._createCheck()
+        check.reset()
+        self.assertFalse(check.isStreaming)
+        self._assertReferences(check, [(u"38000", 23), (u"38000", 24), (u"38053", 17), (u"38001", 23)], [1, 3])
+        self.assertTrue(os.path.exists(check.indexPath()))
+
+    def testCanStoreIndexAsJson(self):
+        check = self._createCheck()
+        check.reset()
+        indexFile = open(check.indexPath(), "rb")
+        try:
+            storedIndex = json.load(indexFile)
+        finally:
+            indexFile.close()
+        self.assertEqual(storedIndex["keys"], [[u"38000", 23], [u"38000", 59], [u"38001", 17], [u"38053", 17]])
+
+    def testCanStoreIndexInPrivateFolder(self):
+        check = self._createCheck()
+        check.indexFolder = None
+        indexFolder = os.path.dirname(check.indexPath())
+        if hasattr(os, "getuid"):
+            self.assertEqual(os.stat(indexFolder).st_mode & 0777, 0700)
+        check.reset()
+        self.assertTrue(os.path.exists(check.indexPath()))
+
+    def testCanReuseIndex(self):
+        check = self._createCheck()
+        check.reset()
+        otherCheck = self._createCheck()
+        otherCheck._keysOfReferencedData = None
+        # Reset must read the stored index instead of calling `_keysOfReferencedData()`.
+        otherCheck.reset()
+        self._assertReferences(otherCheck, [(u"38000", 23), (u"38000", 24)], [1])
+
+        # Changing the referenced data must rebuild the index.
+        self._writeReferencedCustomers([(38000, 23), (38000, 24), (38000, 2400)])
+        newerMtime = os.stat(self._icdPath).st_mtime + 1
+        os.utime(self._dataPath, (newerMtime, newerMtime))
+        check.reset()
+        self._assertReferences(check, [(u"38000", 23), (u"38000", 24)], [])
+
+    def testCanStreamSortedReferences(self):
+        check = self._createCheck()
+        check.sortedFieldNames = ["branch_id", "customer_id", "first_name"]
+        check.reset()
+        self.assertTrue(check.isStreaming)
+        self._assertReferences(check, [(u"38000", 1), (u"38000", 23), (u"38000", 23), (u"38000", 24),
+                (u"38000", 2), (u"38001", 17), (u"38053", 17), (u"38054", 1)], [0, 3, 7])
+        check.reset()
+        self._assertReferences(check, [(u"38000", 59), (u"38053", 17)], [])
+        check.cleanup()
+
+    def testCanReferenceSingleField(self):
+        check = self._createCheck(u"branch_id references branch_id in \"%s\" using \"%s\"" % (self._dataPath, self._icdPath))
+        check.reset()
+        self._assertReferences(check, [(u"38001", 23), (u"38002", 23)], [1])
+
+    def testFailsOnBrokenRule(self):
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck, u"")
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck, u"branch_id")
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck, u"branch_id references")
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck,
+                u"branch_id, customer_id references branch_id in \"%s\" using \"%s\"" % (self._dataPath, self._icdPath))
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck,
+                u"branch_id references no_such_field in \"%s\" using \"%s\"" % (self._dataPath, self._icdPath))
+        self.assertRaises(fields.FieldLookupError, self._createCheck,
+                u"no_such_field references branch_id in \"%s\" using \"%s\"" % (self._dataPath, self._icdPath))
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck, u"branch_id references branch_id in %s" % self._dataPath)
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck,
+                u"branch_id references branch_id in \"%s\" \"%s\"" % (self._dataPath, self._icdPath))
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck,
+                u"branch_id references branch_id in \"%s\" using \"%s\" more" % (self._dataPath, self._icdPath))
+
+    def testFailsOnBrokenReferencedIcd(self):
+        missingIcdPath = dev_test.getTestOutputPath("no_such_icd.csv")
+        try:
+            self._createCheck(u"branch_id references branch_id in \"%s\" using \"%s\"" % (self._dataPath, missingIcdPath))
+            self.fail("referenced ICD must be missing")
+        except checks.CheckSyntaxError, error:
+            self.assertTrue(missingIcdPath in unicode(error), u"error=%s" % error)
+        self.assertRaises(checks.CheckSyntaxError, self._createCheck,
+                u"branch_id references branch_id in \"%s\" using \"%s\"" % (self._dataPath, self._dataPath))
+
+
 class DistinctCountCheckTest(unittest.TestCase):
     def testDistinctCountCheck(self):
         fieldNames = _getTestFieldNames()
@@ -124,7 +483,91 @@ class DistinctCountCheckTest(unittest.TestCase):
         check.checkRow(_createFieldMap(fieldNames, [38001, 59, "Jane", "Miller", "female", "04.10.1946"]), location)
         check.checkAtEnd(location)
         location.advanceLine()
-        check.checkRow(_createFieldMap(fieldNames, [38003, 59, "Jane", "Miller", "female", "04.10.1946"]), location)
+        self.assertRaises(checks.CheckError, check.checkRow,
+                _createFieldMap(fieldNames, [38003, 59, "Jane", "Miller", "female", "04.10.1946"]), location)
+        self.assertRaises(checks.CheckError, check.checkAtEnd, location)
+
+    def testCanMergePartialState(self):
+        fieldNames = _getTestFieldNames()
+        mergedCheck = checks.DistinctCountCheck("test check", "branch_id < 3", fieldNames)
+        location = tools.InputLocation(self.testCanMergePartialState, hasCell=True)
+        for branchIds in ([38000, 38001], [38001], [38002]):
+            check = checks.DistinctCountCheck("test check", "branch_id < 3", fieldNames)
+            for branchId in branchIds:
+                check.checkRow(_createFieldMap(fieldNames, [branchId, 23, "John", "Doe", "male", "08.03.1957"]), location)
+                location.advanceLine()
+            self.assertEqual(mergedCheck.mergePartialState(check.partialState()), [])
+            if branchIds != [38002]:
+                mergedCheck.checkAtEnd(location)
+                self.assertEqual(mergedCheck.distinctValues, set([38000, 38001]))
+        self.assertRaises(checks.CheckError, mergedCheck.checkAtEnd, location)
+
+    def testCanDecideEarly(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.DistinctCountCheck("test check", "branch_id < 3", fieldNames)
+        location = tools.InputLocation(self.testCanDecideEarly, hasCell=True)
+        rejectedLines = []
+        for branchId in [38000, 38001, 38000, 38002, 38003]:
+            try:
+                check.checkRow(_createFieldMap(fieldNames, [branchId, 23, "John", "Doe", "male", "08.03.1957"]), location)
+            except checks.CheckError, error:
+                self.assertEqual(error.location.line, location.line)
+                rejectedLines.append(location.line)
+            location.advanceLine()
+        self.assertEqual(rejectedLines, [3])
+        self.assertEqual(check.distinctValues, set())
+        try:
+            check.checkAtEnd(location)
+            self.fail("distinct count beyond limit must cause CheckError")
+        except checks.CheckError, error:
+            self.assertEqual(error.seeAlsoLocation.line, 3)
+            self.assertTrue("at least 3" in unicode(error), u"error=%s" % error)
+
+    def testCanComputeMaxCount(self):
+        fieldNames = _getTestFieldNames()
+        for rule, expectedMaxCount in [
+                ("branch_id < 3", 2),
+                ("branch_id <= 3", 3),
+                ("branch_id == 3", 3),
+                ("branch_id < 2.5", 2),
+                ("branch_id < 2 * 5", 9),
+                ("branch_id > 3", None),
+                ("branch_id < 3 or True", None),
+                ("branch_id < count + 1", None),
+                ("branch_id % 2 == 0", None)]:
+            check = checks.DistinctCountCheck("test check", rule, fieldNames)
+            self.assertEqual(check._maxCount, expectedMaxCount, u"rule=%r" % rule)
+
+    def testCanApproximateCount(self):
+        fieldNames = _getTestFieldNames()
+        location = tools.InputLocation(self.testCanApproximateCount, hasCell=True)
+        mergedCheck = checks.DistinctCountCheck("test check", "branch_id > 2900", fieldNames)
+        mergedCheck.approximationError = 0.1
+        for firstBranchId in (0, 1000):
+            check = checks.DistinctCountCheck("test check", "branch_id > 2900", fieldNames)
+            check.approximationError = 0.1
+            for branchId in xrange(firstBranchId, firstBranchId + 2000):
+                check.checkRow(_createFieldMap(fieldNames, [branchId, 23, "John", "Doe", "male", "08.03.1957"]), location)
+                location.advanceLine()
+            self.assertEqual(check.distinctValues, set())
+            mergedCheck.mergePartialState(check.partialState())
+        mergedCheck.checkAtEnd(location)
+        self.assertTrue(2700 < mergedCheck._distinctCount() < 3300, u"count=%d" % mergedCheck._distinctCount())
+
+    def testCanDecideEarlyWithApproximateCount(self):
+        fieldNames = _getTestFieldNames()
+        check = checks.DistinctCountCheck("test check", "branch_id < 1000", fieldNames)
+        check.approximationError = 0.1
+        location = tools.InputLocation(self.testCanDecideEarlyWithApproximateCount, hasCell=True)
+        rejectedLines = []
+        for branchId in xrange(5000):
+            try:
+                check.checkRow(_createFieldMap(fieldNames, [branchId, 23, "John", "Doe", "male", "08.03.1957"]), location)
+            except checks.CheckError:
+                rejectedLines.append(location.line)
+            location.advanceLine()
+        self.assertEqual(len(rejectedLines), 1)
+        self.assertTrue(1000 <= rejectedLines[0] < 2000, u"rejectedLines=%r" % rejectedLines)
         self.assertRaises(checks.CheckError, check.checkAtEnd, location)
 
     def testBrokenExpressions(self):
@@ -0,0 +1,171 @@
+"""
+Tests for `columns`.
+"""
+# Copyright (C) 2009-2012 Thomas Aglassinger
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import array
+import ast
+import datetime
+import logging
+import os
+import StringIO
+import struct
+import time
+import unittest
+import zipfile
+
+import columns
+import data
+import dev_test
+import fields
+import test_interface
+import tools
+
+_TEST_DATA = """38000,23,"John","Doe","male","08.03.1957"
+38000,59,,"Miller","female","04.10.1946"
+38000,23,"Mike","Webster","male","23.12.1974"
+38053,17,"Mike","Webster","male","23.12.1974"
+38111,96,"Andrew","Dixon","male","02.10.1913"
+"""
+
+
+def _valuesOfNpyData(npyData):
+    """
+    Pair of the type and list of values stored in the content of an ``.npy`` file.
+    """
+    assert npyData.startswith("\x93NUMPY\x01\x00")
+    headerSize = struct.unpack("<H", npyData[8:10])[0]
+    dataOffset = 10 + headerSize
+    assert dataOffset % 64 == 0, u"dataOffset=%d" % dataOffset
+    header = ast.literal_eval(npyData[10:dataOffset])
+    assert not header["fortran_order"]
+    length = header["shape"][0]
+    descr = header["descr"]
+    content = npyData[dataOffset:]
+    if descr == "<i8":
+        result = list(struct.unpack("<%dq" % length, content))
+    elif descr == "|b1":
+        result = list(struct.unpack("%d?" % length, content))
+    else:
+        assert descr.startswith("<U")
+        textSize = 4 * int(descr[2:])
+        assert len(content) == length * textSize
+        result = []
+        for textIndex in range(length):
+            encodedText = content[textIndex * textSize:(textIndex + 1) * textSize]
+            result.append(encodedText.decode("utf-32-le").rstrip(u"\x00"))
+    return (descr, result)
+
+
+class ColumnBatchTest(unittest.TestCase):
+    def setUp(self):
+        self._icd = test_interface.createDefaultTestIcd(data.FORMAT_CSV)
+
+    def _batches(self, batchSize, errors="ignore"):
+        return list(columns.validatedColumnBatches(self._icd, StringIO.StringIO(_TEST_DATA), batchSize, errors, useNumPy=False))
+
+    def testCanSplitRowsInBatches(self):
+        batches = self._batches(2)
+        self.assertEqual([batch.rowCount for batch in batches], [2, 2])
+        self.assertEqual([batch.rowCount for batch in self._batches(4)], [4])
+        self.assertEqual([batch.rowCount for batch in self._batches(columns.DEFAULT_BATCH_SIZE)], [4])
+        firstBatch, secondBatch = batches
+        self.assertEqual(firstBatch.fieldNames, self._icd.fieldNames)
+        self.assertEqual(firstBatch.column(u"branch_id"), [u"38000", u"38000"])
+        self.assertEqual(secondBatch.column(u"surname"), [u"Webster", u"Dixon"])
+        self.assertEqual(secondBatch.column(u"date_of_birth")[1][:3], (1913, 10, 2))
+        self.assertRaises(fields.FieldLookupError, firstBatch.column, u"no_such_field")
+
+    def testCanStoreIntegersInArray(self):
+        firstBatch = self._batches(2)[0]
+        customerIds = firstBatch.column(u"customer_id")
+        self.assertTrue(isinstance(customerIds, array.array))
+        self.assertEqual(customerIds.itemsize, 8)
+        self.assertEqual(list(customerIds), [23, 59])
+        self.assertEqual(list(firstBatch.mask(u"customer_id")), [True, True])
+
+    def testCanMaskEmptyValues(self):
+        firstBatch = self._batches(2)[0]
+        self.assertEqual(firstBatch.column(u"first_name"), [u"John", u""])
+        self.assertEqual(list(firstBatch.mask(u"first_name")), [True, False])
+
+    def testCanYieldErrors(self):
+        batchesAndErrors = list(columns.validatedColumnBatches(
+                self._icd, StringIO.StringIO(_TEST_DATA), 2, "yield", useNumPy=False))
+        self.assertEqual(len(batchesAndErrors), 3)
+        self.assertEqual(batchesAndErrors[0].rowCount, 2)
+        self.assertTrue(isinstance(batchesAndErrors[1], tools.ErrorInfo))
+        self.assertEqual(batchesAndErrors[2].rowCount, 2)
+        self.assertRaises(tools.CutplaceError, list, columns.validatedColumnBatches(
+                self._icd, StringIO.StringIO(_TEST_DATA), 2, useNumPy=False))
+
+    def testCanSaveNpz(self):
+        firstBatch = self._batches(2)[0]
+        npzPath = dev_test.getTestOutputPath("column_batch.npz")
+        for compressed in (False, True):
+            firstBatch.saveNpz(npzPath, compressed)
+            npzZip = zipfile.ZipFile(npzPath, "r")
+            try:
+                self.assertEqual(len(npzZip.namelist()), 2 * len(self._icd.fieldNames))
+                self.assertEqual(_valuesOfNpyData(npzZip.read(u"customer_id.npy")), ("<i8", [23, 59]))
+                self.assertEqual(_valuesOfNpyData(npzZip.read(u"first_name.npy")), ("<U4", [u"John", u""]))
+                self.assertEqual(_valuesOfNpyData(npzZip.read(u"first_name.mask.npy")), ("|b1", [True, False]))
+                self.assertEqual(_valuesOfNpyData(npzZip.read(u"date_of_birth.npy")),
+                        ("<U19", [u"1957-03-08T00:00:00", u"1946-10-04T00:00:00"]))
+            finally:
+                npzZip.close()
+
+    def testCanSaveNpzWithDatesBefore1900(self):
+        batch = list(columns.validatedColumnBatches(self._icd,
+                StringIO.StringIO("""38000,23,"John","Doe","male","03.02.1850"\n"""), useNumPy=False))[0]
+        npzPath = dev_test.getTestOutputPath("column_batch_1850.npz")
+        batch.saveNpz(npzPath)
+        npzZip = zipfile.ZipFile(npzPath, "r")
+        try:
+            self.assertEqual(_valuesOfNpyData(npzZip.read(u"date_of_birth.npy")), ("<U19", [u"1850-02-03T00:00:00"]))
+        finally:
+            npzZip.close()
+        self.assertEqual(columns._textOf(time.struct_time((12, 3, 4, 5, 6, 7, 0, 1, -1))), u"0012-03-04T05:06:07")
+
+    def testCanSaveNpy(self):
+        self._icd.getFieldFormat(u"date_of_birth").resultType = fields.DATE_TIME_RESULT_ORDINAL
+        secondBatch = self._batches(2)[1]
+        expectedOrdinals = [datetime.date(1974, 12, 23).toordinal(), datetime.date(1913, 10, 2).toordinal()]
+        self.assertEqual(list(secondBatch.column(u"date_of_birth")), expectedOrdinals)
+        targetFolder = dev_test.getTestOutputPath("column_batch")
+        if not os.path.exists(targetFolder):
+            os.mkdir(targetFolder)
+        secondBatch.saveNpy(targetFolder)
+        for fieldName, expectedDescrAndValues in (
+                (u"date_of_birth", ("<i8", expectedOrdinals)),
+                (u"surname", ("<U7", [u"Webster", u"Dixon"]))):
+            npyFile = open(os.path.join(targetFolder, fieldName + ".npy"), "rb")
+            try:
+                self.assertEqual(_valuesOfNpyData(npyFile.read()), expectedDescrAndValues)
+            finally:
+                npyFile.close()
+
+    def testFailsOnNumPyWithoutNumPy(self):
+        if columns.numpy is None:
+            self.assertRaises(tools.CutplaceError, list, columns.validatedColumnBatches(
+                    self._icd, StringIO.StringIO(_TEST_DATA), useNumPy=True))
+        else:  # pragma: no cover
+            batches = list(columns.validatedColumnBatches(self._icd, StringIO.StringIO(_TEST_DATA), errors="ignore"))
+            self.assertEqual(batches[0].column(u"customer_id").tolist(), [23, 59, 17, 96])
+
+if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig()
+    logging.getLogger("cutplace").setLevel(logging.INFO)
+    unittest.main()
@@ -69,6 +69,40 @@ class CutplaceTest(unittest.TestCase):
         os.remove(acceptedDataPath)
         os.remove(rejectedDataPath)
 
+    def testSplitBrokenDataWithJobs(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        dataPath = dev_test.getTestInputPath("broken_customers.csv")
+        exitCode = _cutplace.main(["test_cutplace.py", "--split", icdPath, dataPath])
+        self.assertEquals(exitCode, 1)
+        acceptedDataPath = dev_test.getTestInputPath("broken_customers_accepted.csv")
+        rejectedDataPath = dev_test.getTestInputPath("broken_customers_rejected.txt")
+        try:
+            expectedAccepted = open(acceptedDataPath, "rb").read()
+            expectedRejected = open(rejectedDataPath, "rb").read()
+            for options in (["--jobs", "2"], ["--mmap"], ["--mmap", "--jobs", "2"], ["--unique-keys-in-memory", "1"],
+                    ["--unique-keys-in-memory", "1", "--jobs", "2"], ["--distinct-count-error", "0.01", "--jobs", "2"]):
+                exitCode = _cutplace.main(["test_cutplace.py"] + options + ["--split", icdPath, dataPath])
+                self.assertEquals(exitCode, 1)
+                self.assertEqual(open(acceptedDataPath, "rb").read(), expectedAccepted)
+                self.assertEqual(open(rejectedDataPath, "rb").read(), expectedRejected)
+        finally:
+            os.remove(acceptedDataPath)
+            os.remove(rejectedDataPath)
+
+    def testCanSummarizeRejectedRows(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        dataPath = dev_test.getTestInputPath("broken_customers.csv")
+        rejectedDataPath = dev_test.getTestInputPath("broken_customers_rejected.txt")
+        acceptedDataPath = dev_test.getTestInputPath("broken_customers_accepted.csv")
+        try:
+            exitCode = _cutplace.main(["test_cutplace.py", "--max-errors", "1", "--split", icdPath, dataPath])
+            self.assertEquals(exitCode, 1)
+            rejectedLines = open(rejectedDataPath, "rb").read().splitlines()
+            self.assertEqual(len([line for line in rejectedLines if line.startswith("items: ")]), 1)
+        finally:
+            os.remove(acceptedDataPath)
+            os.remove(rejectedDataPath)
+
     def _testValidIcd(self, suffix):
         assert suffix is not None
         icdPath = dev_test.getTestIcdPath("customers." + suffix)
@@ -115,6 +149,12 @@ class CutplaceTest(unittest.TestCase):
         exitCode = _cutplace.main(["test_cutplace.py", icdPath, dataPath])
         self.assertEqual(exitCode, 0)
 
+    def testValidFixedTxtWithMemoryMap(self):
+        icdPath = dev_test.getTestIcdPath("customers_fixed.ods")
+        dataPath = dev_test.getTestInputPath("valid_customers_fixed.txt")
+        exitCode = _cutplace.main(["test_cutplace.py", "--mmap", icdPath, dataPath])
+        self.assertEqual(exitCode, 0)
+
     def testValidNativeExcelFormats(self):
         icdPath = dev_test.getTestIcdPath("native_excel_formats.ods")
         dataPath = dev_test.getTestInputPath("valid_native_excel_formats.xls")
@@ -124,6 +164,61 @@ class CutplaceTest(unittest.TestCase):
     def testBrokenUnknownCommandLineOption(self):
         self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--no-such-option"])
 
+    def testBrokenJobs(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--jobs", "0", icdPath])
+
+    def testCanStoreUniqueKeys(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        dataPath = dev_test.getTestInputPath("valid_customers.csv")
+        keyStorePath = dev_test.getTestOutputPath("customer_keys.db")
+        if os.path.exists(keyStorePath):
+            os.remove(keyStorePath)
+        exitCode = _cutplace.main(["test_cutplace.py", "--unique-key-store", keyStorePath, icdPath, dataPath])
+        self.assertEquals(exitCode, 0)
+        exitCode = _cutplace.main(["test_cutplace.py", "--unique-key-store", keyStorePath, icdPath, dataPath])
+        self.assertEquals(exitCode, 1)
+
+    def testCanStoreReferenceIndexInFolder(self):
+        indexFolder = dev_test.getTestOutputPath("cutplace_reference_indices")
+        if not os.path.exists(indexFolder):
+            os.mkdir(indexFolder)
+        for fileName in os.listdir(indexFolder):
+            os.remove(os.path.join(indexFolder, fileName))
+        icdPath = dev_test.getTestOutputPath("reference_orders_icd.csv")
+        referencedIcdPath = dev_test.getTestIcdPath("customers.csv")
+        referencedDataPath = dev_test.getTestInputPath("valid_customers.csv")
+        dataPath = dev_test.getTestOutputPath("reference_orders.csv")
+        icdFile = open(icdPath, "wb")
+        try:
+            icdFile.write(",Interface: orders\nD,Format,CSV\nD,Line delimiter,any\n"
+                    + ",Name,Example,Empty,Length,Type,Rule\nF,branch_id,38000,,,RegEx,38\\d\\d\\d\n"
+                    + "C,branch must exist,Reference,\"branch_id references branch_id in \"\"%s\"\" using \"\"%s\"\"\"\n"
+                    % (referencedDataPath, referencedIcdPath))
+        finally:
+            icdFile.close()
+        dataFile = open(dataPath, "wb")
+        try:
+            dataFile.write("38000\n")
+        finally:
+            dataFile.close()
+        exitCode = _cutplace.main(["test_cutplace.py", "--reference-index-folder", indexFolder, icdPath, dataPath])
+        self.assertEqual(exitCode, 0)
+        self.assertEqual(len(os.listdir(indexFolder)), 1)
+
+    def testBrokenUniqueKeysInMemory(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--unique-keys-in-memory", "0", icdPath])
+
+    def testBrokenDistinctCountError(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--distinct-count-error", "0", icdPath])
+        self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--distinct-count-error", "1.5", icdPath])
+
+    def testBrokenMaxErrors(self):
+        icdPath = dev_test.getTestIcdPath("customers.ods")
+        self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", "--max-errors", "-1", icdPath])
+
     def testBrokenNoCommandLineOptions(self):
         self.assertRaises(optparse.OptionError, _cutplace.process, ["test_cutplace.py", ])
 
@@ -16,25 +16,44 @@ Tests  for field formats.
 #
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import datetime
 import decimal
+import io
 import logging
+import os
+import time
 import unittest
 
 import data
+import dev_test
 import fields
 
 _anyFormat = data.createDataFormat(data.FORMAT_CSV)
 _fixedFormat = data.createDataFormat(data.FORMAT_FIXED)
 
 
-def _createGermanDecimalFormat():
+def _createGermanDecimalFormat(rule=""):
     germanFormat = data.createDataFormat(data.FORMAT_CSV)
     germanFormat.set(data.KEY_DECIMAL_SEPARATOR, ",")
     germanFormat.set(data.KEY_THOUSANDS_SEPARATOR, ".")
-    result = fields.DecimalFieldFormat("x", False, None, "", germanFormat)
+    result = fields.DecimalFieldFormat("x", False, None, rule, germanFormat)
     return result
 
 
+def _assertIsValidMatchesValidated(testCase, fieldFormat, values):
+    """
+    Assert that `fields.AbstractFieldFormat.isValid()` tells for each of ``values`` whether
+    `fields.AbstractFieldFormat.validated()` accepts it.
+    """
+    for value in values:
+        try:
+            fieldFormat.validated(value)
+            isValid = True
+        except fields.FieldValueError:
+            isValid = False
+        testCase.assertEqual(fieldFormat.isValid(value), isValid, u"value=%r" % value)
+
+
 class AbstractFieldFormatTest(unittest.TestCase):
     """
     Test for base validation in `AbstractFieldFormatTest`.
@@ -64,6 +83,79 @@ class AbstractFieldFormatTest(unittest.TestCase):
         fieldFormat = fields.AbstractFieldFormat("x", True, "3:5", "", _anyFormat)
         self.assertRaises(NotImplementedError, fieldFormat.validated, "xyz")
 
+    def testCanValidateColumn(self):
+        fieldFormat = _UpperTextFieldFormat("x", True, "2:3", "", _anyFormat)
+        self.assertEqual(fieldFormat.validatedColumn([u"ab", u"", u"abc"]), [u"AB", None, u"ABC"])
+        self.assertEqual(fieldFormat.validatedValuesCalls, [[u"ab", u"abc"]])
+        self.assertEqual(fieldFormat.validatedColumn([]), [])
+        self.assertRaises(fields.FieldValueError, fieldFormat.validatedColumn, [u"ab", u"abcd"])
+        fieldFormat = _UpperTextFieldFormat("x", False, "", "", _anyFormat)
+        self.assertRaises(fields.FieldValueError, fieldFormat.validatedColumn, [u"ab", u""])
+        fixedFieldFormat = _UpperTextFieldFormat("x", True, "3", "", _fixedFormat)
+        self.assertEqual(fixedFieldFormat.validatedColumn([u"ab ", u"   "]), [u"AB", None])
+        self.assertEqual(fixedFieldFormat.validatedValuesCalls, [])
+
+    def testCanTellValidValues(self):
+        dataFormat = data.createDataFormat(data.FORMAT_CSV)
+        dataFormat.set(data.KEY_ALLOWED_CHARACTERS, "32:126")
+        values = [u"", u"a", u"ab", u"abc", u"abcd", u"a\tb", u"a\u20acb"]
+        _assertIsValidMatchesValidated(self, _UpperTextFieldFormat("x", True, "2:3", "", dataFormat), values)
+        _assertIsValidMatchesValidated(self, _UpperTextFieldFormat("x", False, "", "", dataFormat), values)
+        _assertIsValidMatchesValidated(self, _UpperTextFieldFormat("x", False, "3", "", _fixedFormat), [u"ab ", u"   "])
+
+
+class _UpperTextFieldFormat(fields.AbstractFieldFormat):
+    """
+    Field format converting values to upper case that records the values passed to
+    `validatedValues()`.
+    """
+    def __init__(self, fieldName, isAllowedToBeEmpty, length, rule, dataFormat):
+        super(_UpperTextFieldFormat, self).__init__(fieldName, isAllowedToBeEmpty, length, rule, dataFormat)
+        self.validatedValuesCalls = []
+
+    def validatedValue(self, value):
+        return value.upper()
+
+    def validatedValues(self, values):
+        self.validatedValuesCalls.append(list(values))
+        return [value.upper() for value in values]
+
+
+class ValueCacheTest(unittest.TestCase):
+    """
+    Test for caching of validated values in `AbstractFieldFormat`.
+    """
+
+    def testCanCacheValues(self):
+        fieldFormat = fields.IntegerFieldFormat("x", False, None, "1:9", _anyFormat)
+        self.assertEqual(fieldFormat.valueCacheSize, 0)
+        self.assertEqual(fieldFormat.valueCache, None)
+        fieldFormat.valueCacheSize = 2
+        for value in ["1", "2", "1", "1"]:
+            self.assertEqual(fieldFormat.validated(value), long(value))
+        valueCache = fieldFormat.valueCache
+        self.assertEqual((valueCache.hits, valueCache.misses, valueCache.evictions), (2, 2, 0))
+        fieldFormat.validated("3")
+        self.assertEqual(valueCache.evictions, 1)
+
+    def testCanCacheErrors(self):
+        fieldFormat = fields.IntegerFieldFormat("x", False, None, "1:9", _anyFormat)
+        fieldFormat.valueCacheSize = 10
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "10")
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "10")
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "")
+        self.assertEqual(fieldFormat.valueCache.hits, 1)
+
+    def testCanUseValueCacheSizeOfDataFormat(self):
+        dataFormat = data.createDataFormat(data.FORMAT_CSV)
+        dataFormat.set(data.KEY_VALUE_CACHE_SIZE, "100")
+        fieldFormat = fields.ChoiceFieldFormat("x", False, None, "red, green", dataFormat)
+        self.assertEqual(fieldFormat.valueCacheSize, 100)
+        self.assertEqual(fieldFormat.validated(u"red"), u"red")
+        self.assertEqual(fieldFormat.valueCache.misses, 1)
+        fieldFormat.valueCacheSize = 0
+        self.assertEqual(fieldFormat.valueCache, None)
+
 
 class DateTimeFieldFormatTest(unittest.TestCase):
     """
@@ -96,6 +188,46 @@ class DateTimeFieldFormatTest(unittest.TestCase):
         fieldFormat = fields.DateTimeFieldFormat("x", False, None, "%YYYY-MM-DD", _anyFormat)
         fieldFormat.validated("%2000-01-01")
 
+    def testCanCompileCommonRules(self):
+        for rule in ("YYYY-MM-DD", "DD.MM.YYYY", "YYYY-MM-DD hh:mm:ss", "YYYY-MM-DDThh:mm", "hh:mm", "YYYYMMDD"):
+            fieldFormat = fields.DateTimeFieldFormat("x", False, None, rule, _anyFormat)
+            self.assertTrue(fieldFormat.isCompiled, u"rule=%r" % rule)
+        for rule in ("%YYYY-MM-DD", "DD.MM.YY", "DD.MM.YYYY hhh"):
+            fieldFormat = fields.DateTimeFieldFormat("x", False, None, rule, _anyFormat)
+            self.assertFalse(fieldFormat.isCompiled, u"rule=%r" % rule)
+
+    def testCompiledRulesValidateLikeStrptime(self):
+        for rule, values in (
+                ("DD.MM.YYYY", ["08.03.1957", "29.02.2012", "8.3.1957", "29.02.2011", "32.01.2000", "1.1.0000"]),
+                ("YYYY-MM-DD hh:mm:ss", ["2012-06-13 23:59:59", "2012-06-13   01:02:03", "2012-06-13 24:00:00", "2012-06-13 12:00:61"]),
+                ("hh:mm", ["00:00", "23:59", "24:00", "1:2"]),
+                ("YYYY-MM-DDThh:mm", ["2012-06-13T12:34", "2012-06-13t12:34", "2012-06-13 12:34"])):
+            fieldFormat = fields.DateTimeFieldFormat("x", False, None, rule, _anyFormat)
+            for value in values:
+                try:
+                    expectedValue = time.strptime(value, fieldFormat.strptimeFormat)
+                except ValueError:
+                    expectedValue = None
+                if expectedValue is not None:
+                    self.assertEqual(fieldFormat.validated(value), expectedValue, u"value=%r" % value)
+                else:
+                    self.assertRaises(fields.FieldValueError, fieldFormat.validated, value)
+
+    def testCanValidateToResultType(self):
+        fieldFormat = fields.DateTimeFieldFormat("x", False, None, "YYYY-MM-DD hh:mm:ss", _anyFormat)
+        fieldFormat.resultType = fields.DATE_TIME_RESULT_DATETIME
+        self.assertEqual(fieldFormat.validated("2012-06-13 12:34:56"), datetime.datetime(2012, 6, 13, 12, 34, 56))
+        fieldFormat.resultType = fields.DATE_TIME_RESULT_DATE
+        self.assertEqual(fieldFormat.validated("2012-06-13 12:34:56"), datetime.date(2012, 6, 13))
+        self.assertEqual(fieldFormat.validated("2012-6-13 12:34:56"), datetime.date(2012, 6, 13))
+        fieldFormat.resultType = fields.DATE_TIME_RESULT_ORDINAL
+        self.assertEqual(fieldFormat.validated("0001-01-02 00:00:00"), 2)
+        # Leap seconds are valid for `time.strptime()` but not for `datetime`.
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "2012-06-30 23:59:60")
+        fieldFormat.resultType = fields.DATE_TIME_RESULT_STRUCT_TIME
+        self.assertEqual(fieldFormat.validated("2012-06-30 23:59:60")[:6], (2012, 6, 30, 23, 59, 60))
+        self.assertRaises(fields.FieldSyntaxError, setattr, fieldFormat, "resultType", "broken")
+
 
 class DecimalFieldFormatTest(unittest.TestCase):
     """
@@ -125,8 +257,73 @@ class DecimalFieldFormatTest(unittest.TestCase):
         self.assertRaises(fields.FieldValueError, germanFormat.validated, "12,345,678")
         self.assertRaises(fields.FieldValueError, germanFormat.validated, "12,345.678")
 
+    def testValidDecimalsWithOtherSyntax(self):
+        fieldFormat = fields.DecimalFieldFormat("x", False, None, "", _anyFormat)
+        self.assertEqual(decimal.Decimal("-0.5"), fieldFormat.validated("-.5"))
+        self.assertEqual(decimal.Decimal("17"), fieldFormat.validated("17."))
+        self.assertEqual(decimal.Decimal("1700"), fieldFormat.validated("1.7e3"))
+
+    def testValidDecimalsWithPrecisionAndScale(self):
+        fieldFormat = fields.DecimalFieldFormat("x", False, None, "5, 2", _anyFormat)
+        self.assertEqual(fieldFormat.precision, 5)
+        self.assertEqual(fieldFormat.scale, 2)
+        self.assertEqual(decimal.Decimal("999.99"), fieldFormat.validated("999.99"))
+        self.assertEqual(decimal.Decimal("-0.5"), fieldFormat.validated("-000.500"))
+        self.assertEqual(decimal.Decimal("100.1"), fieldFormat.validated("1.001e2"))
+        fieldFormat = fields.DecimalFieldFormat("x", False, None, "3", _anyFormat)
+        self.assertEqual(fieldFormat.scale, 0)
+        self.assertEqual(decimal.Decimal("123"), fieldFormat.validated("123.0"))
+
+    def testBrokenDecimalsWithPrecisionAndScale(self):
+        fieldFormat = fields.DecimalFieldFormat("x", False, None, "5, 2", _anyFormat)
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "1000")
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "1.234")
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "1e3")
+        self.assertRaises(fields.FieldValueError, fieldFormat.validated, "NaN")
+        germanFormat = _createGermanDecimalFormat("5, 2")
+        self.assertRaises(fields.FieldValueError, germanFormat.validated, "1.000")
+        self.assertEqual(decimal.Decimal("100.12"), germanFormat.validated("100,12"))
+
+    def testCanValidateScaledIntegers(self):
+        fieldFormat = _createGermanDecimalFormat("10, 2")
+        fieldFormat.isScaledInteger = True
+        self.assertEqual(fieldFormat.validated("17,3"), 1730)
+        self.assertEqual(fieldFormat.validated("-1.234,56"), -123456)
+        self.assertEqual(fieldFormat.validated(",5"), 50)
+        self.assertEqual(fieldFormat.validated("1,7e2"), 17000)
+        self.assertTrue(isinstance(fieldFormat.validated("0"), long))
+        fieldFormat = fields.DecimalFieldFormat("x", False, None, "", _anyFormat)
+        self.assertRaises(fields.FieldSyntaxError, setattr, fieldFormat, "isScaledInteger", True)
+
+    def testCanValidateColumn(self):
+        fieldFormat = fields.DecimalFieldFormat("x", True, None, "5, 2", _anyFormat)
+        values = [u"17.23", u"", u"-.5", u"+3", u"007.10", u"1e2"]
+        expectedValues = [fieldFormat.validated(value) for value in values]
+        self.assertEqual(fieldFormat.validatedColumn(values), expectedValues)
+        self.assertEqual(fieldFormat.validatedColumn(values[:-1]), expectedValues[:-1])
+        for brokenValue in (u"1.234", u"1000", u"eggs", u"+", u"1\n2"):
+            self.assertRaises(fields.FieldValueError, fieldFormat.validatedColumn, values + [brokenValue])
+        germanFormat = _createGermanDecimalFormat("10, 2")
+        germanFormat.isScaledInteger = True
+        values = [u"17,3", u"-1.234,56", u",5", u"0", u"1,7e2", u"-,05"]
+        self.assertEqual(germanFormat.validatedColumn(values), [1730, -123456, 50, 0, 17000, -5])
+        self.assertTrue(isinstance(germanFormat.validatedColumn([u"0"])[0], long))
+        self.assertRaises(fields.FieldValueError, germanFormat.validatedColumn, [u"1", u"1,234"])
+
+    def testCanTellValidValues(self):
+        values = [u"17.23", u"-.5", u"+3", u"007.10", u"1e2", u"1.234", u"1000", u"eggs", u"+", u".", u"1,000.5",
+                u"1.2.3", u"1.2,3", u"Infinity"]
+        _assertIsValidMatchesValidated(self, fields.DecimalFieldFormat("x", False, None, "5, 2", _anyFormat), values)
+        _assertIsValidMatchesValidated(self, fields.DecimalFieldFormat("x", False, None, "", _anyFormat), values)
+        germanValues = [u"17,3", u"-1.234,56", u",5", u"1,7e2", u"1,234", u"1,2,3", u"1,2.3", u"1.5"]
+        _assertIsValidMatchesValidated(self, _createGermanDecimalFormat("10, 2"), germanValues)
+
     def testBrokenDecimalSyntax(self):
         self.assertRaises(fields.FieldSyntaxError, fields.DecimalFieldFormat, "x", False, None, "eggs", _anyFormat)
+        self.assertRaises(fields.FieldSyntaxError, fields.DecimalFieldFormat, "x", False, None, "1, 2, 3", _anyFormat)
+        self.assertRaises(fields.FieldSyntaxError, fields.DecimalFieldFormat, "x", False, None, "0", _anyFormat)
+        self.assertRaises(fields.FieldSyntaxError, fields.DecimalFieldFormat, "x", False, None, "3, 4", _anyFormat)
+        self.assertRaises(fields.FieldSyntaxError, fields.DecimalFieldFormat, "x", False, None, "3, -1", _anyFormat)
 
 
 class IntegerFieldFormatTest(unittest.TestCase):
@@ -153,6 +350,16 @@ class IntegerFieldFormatTest(unittest.TestCase):
         fieldFormat = fields.IntegerFieldFormat("x", False, None, "1:10", _anyFormat)
         self.assertRaises(fields.FieldValueError, fieldFormat.validated, "abc")
 
+    def testCanValidateColumn(self):
+        fieldFormat = fields.IntegerFieldFormat("x", True, None, "1:10, 20:30", _anyFormat)
+        self.assertEqual(fieldFormat.validatedColumn([u"1", u"", u"25", u"10"]), [1, None, 25, 10])
+        for brokenValue in (u"0", u"15", u"31", u"abc"):
+            self.assertRaises(fields.FieldValueError, fieldFormat.validatedColumn, [u"1", brokenValue, u"25"])
+
+    def testCanTellValidValues(self):
+        fieldFormat = fields.IntegerFieldFormat("x", True, None, "1:10, 20:30", _anyFormat)
+        _assertIsValidMatchesValidated(self, fieldFormat, [u"1", u"", u"0", u"15", u"25", u"31", u"abc", u"1.0"])
+
     def testAsIcdRow(self):
         fieldFormat = fields.IntegerFieldFormat("x", False, None, "1:10", _anyFormat)
         length = fieldFormat.length
@@ -212,6 +419,10 @@ class ChoiceFieldFormatTest(unittest.TestCase):
         self.assertRaises(fields.FieldValueError, fieldFormat.validated, "gReen")
         self.assertRaises(fields.FieldValueError, fieldFormat.validated, "")
 
+    def testCanTellValidValues(self):
+        fieldFormat = fields.ChoiceFieldFormat("x", False, None, "red, green", _anyFormat)
+        _assertIsValidMatchesValidated(self, fieldFormat, [u"red", u"green", u"blue", u""])
+
     def testImproperChoice(self):
         fieldFormat = fields.ChoiceFieldFormat("color", False, None, "red,green, blue ", _anyFormat)
         self.assertRaises(fields.FieldValueError, fieldFormat.validated, "tree")
@@ -230,6 +441,48 @@ class ChoiceFieldFormatTest(unittest.TestCase):
         self.assertEquals(fieldFormat.validated("red"), "red")
         self.assertEquals(fieldFormat.validated(""), "")
 
+    def _writeChoices(self, choicesPath, choices):
+        choicesFile = io.open(choicesPath, "w", encoding="utf-8")
+        try:
+            for choice in choices:
+                choicesFile.write(choice + u"\n")
+        finally:
+            choicesFile.close()
+
+    def testCanReadChoicesFromFile(self):
+        choicesPath = dev_test.getTestOutputPath("product_codes.csv")
+        productCodes = [u"p%05d" % productNumber for productNumber in range(20000, 0, -1)]
+        self._writeChoices(choicesPath, [u"  p99999  ", u""] + productCodes + [u"\"m\u00e4nnlich\",ignored"])
+        fieldFormat = fields.ChoiceFieldFormat("product_code", False, None, u"from \"%s\"" % choicesPath, _anyFormat)
+        self.assertEqual(len(fieldFormat.choices), 20002)
+        self.assertEqual(fieldFormat.choices[:2], [u"p99999", u"p20000"])
+        self.assertEqual(fieldFormat.validated(u"p00001"), u"p00001")
+        self.assertEqual(fieldFormat.validated(u"m\u00e4nnlich"), u"m\u00e4nnlich")
+        try:
+            fieldFormat.validated(u"p00000")
+            self.fail("value not in choices must cause FieldValueError")
+        except fields.FieldValueError, error:
+            self.assertTrue(u"u'p19982', ... (20002 choices in total)" in unicode(error), u"error=%s" % error)
+
+        # Choices are read again only if the file changes.
+        otherFieldFormat = fields.ChoiceFieldFormat("product_code", False, None, u"from \"product_codes.csv\"", _anyFormat,
+                os.path.dirname(choicesPath))
+        self.assertEqual(otherFieldFormat.choicesPath, choicesPath)
+        self.assertEqual(otherFieldFormat.choices, fieldFormat.choices)
+        otherFieldFormat.choices.append(u"changed")
+        self.assertEqual(fields._readChoices(choicesPath)[-1], u"m\u00e4nnlich")
+
+    def testBrokenChoicesFile(self):
+        self.assertRaises(fields.FieldSyntaxError, fields.ChoiceFieldFormat, "color", False, None, "from \"no_such_file.csv\"", _anyFormat)
+        choicesPath = dev_test.getTestOutputPath("no_choices.csv")
+        self._writeChoices(choicesPath, [u"", u" "])
+        self.assertRaises(fields.FieldSyntaxError, fields.ChoiceFieldFormat, "color", False, None, u"from \"%s\"" % choicesPath, _anyFormat)
+
+    def testCanUseFromAsChoice(self):
+        fieldFormat = fields.ChoiceFieldFormat("direction", False, None, "from, to", _anyFormat)
+        self.assertEqual(fieldFormat.choicesPath, None)
+        self.assertEqual(fieldFormat.validated("from"), "from")
+
     def testBrokenEmptyChoice(self):
         self.assertRaises(fields.FieldSyntaxError, fields.ChoiceFieldFormat, "color", False, None, "", _anyFormat)
         self.assertRaises(fields.FieldSyntaxError, fields.ChoiceFieldFormat, "color", False, None, " ", _anyFormat)
@@ -248,6 +501,10 @@ class PatternFieldFormatTest(unittest.TestCase):
         self.assertEquals(fieldFormat.validated("hugo"), "hugo")
         self.assertEquals(fieldFormat.validated("huuuuga"), "huuuuga")
 
+    def testCanTellValidValues(self):
+        fieldFormat = fields.PatternFieldFormat("x", False, None, "h*g?", _anyFormat)
+        _assertIsValidMatchesValidated(self, fieldFormat, [u"hgo", u"hallo", u"hang", u""])
+
     def testFailsOnValueNotMatchingPattern(self):
         fieldFormat = fields.PatternFieldFormat("x", False, None, "h*g?", _anyFormat)
         self.assertRaises(fields.FieldValueError, fieldFormat.validated, "")
@@ -38,6 +38,34 @@ _TooManyTestBranchIds = [
 ]
 
 
+class _RowMapRecordingCheck(checks.AbstractCheck):
+    """
+    Check that only implements `checkRow()` and records the row maps it gets.
+    """
+    def __init__(self, description, rule, availableFieldNames, location=None):
+        super(_RowMapRecordingCheck, self).__init__(description, rule, availableFieldNames, location)
+        self.rowMaps = []
+
+    def checkRow(self, rowMap, location):
+        self.rowMaps.append(rowMap)
+
+
+class _ValuesRecordingCheck(checks.AbstractCheck):
+    """
+    Check that requires the values of some fields and records them.
+    """
+    def __init__(self, description, rule, availableFieldNames, location=None):
+        super(_ValuesRecordingCheck, self).__init__(description, rule, availableFieldNames, location)
+        self.values = []
+
+    @property
+    def requiredFieldNames(self):
+        return [u"surname", u"customer_id"]
+
+    def checkValues(self, values, location):
+        self.values.append(values)
+
+
 class _SimpleErrorLoggingValidationListener(interface.BaseValidationListener):
     """
     Listener for validation events that simply logs and counts the delivered events.
@@ -67,14 +95,28 @@ class _SimpleErrorLoggingValidationListener(interface.BaseValidationListener):
 _defaultIcdListener = _SimpleErrorLoggingValidationListener()
 
 
-def createDefaultTestFixedIcd():
+class _ErrorRecordingValidationListener(interface.BaseValidationListener):
+    """
+    Listener for validation events that records the errors of rejected rows.
+    """
+    def __init__(self):
+        self.errors = []
+
+    def rejectedRow(self, row, error):
+        self.errors.append(error)
+
+
+def createDefaultTestFixedIcd(lineDelimiter=u"any"):
+    if lineDelimiter is None:
+        lineDelimiterRow = u""
+    else:
+        lineDelimiterRow = u"D,Line delimiter,%s\n" % lineDelimiter
     spec = u""",Interface: customer
 ,
 ,Data format
 ,
 D,Format,Fixed
-D,Line delimiter,any
-D,Encoding,ISO-8859-1
+%sD,Encoding,ISO-8859-1
 D,Allowed characters,32:
 ,
 ,Fields
@@ -92,7 +134,7 @@ F,date_of_birth,08.03.1957,,10,DateTime,DD.MM.YYYY
 ,Description,Type,Rule
 C,customer must be unique,IsUnique,"branch_id, customer_id"
 C,distinct branches must be within limit,DistinctCount,branch_id <= 3
-"""
+""" % lineDelimiterRow
     result = interface.InterfaceControlDocument()
     result.read(StringIO.StringIO(spec))
     return result
@@ -176,6 +218,25 @@ class ValidatedRowsTest(unittest.TestCase):
         self.assertNotEqual(errorCount, 0)
         self.assertNotEqual(rowCount, 0)
 
+    def testCanYieldNativeValues(self):
+        rows = list(self._icd.validatedRows(self._validCostumersCsvPath))
+        for output in (u"tuple", u"record", u"dict"):
+            nativeRows = list(self._icd.validatedRows(self._validCostumersCsvPath, output=output))
+            self.assertEqual(len(nativeRows), len(rows))
+        firstRow = rows[0]
+        self.assertEqual(firstRow, [u"38000", u"23", u"John", u"Doe", u"male", u"08.03.1957"])
+        firstTuple = self._icd.validatedRows(self._validCostumersCsvPath, output=u"tuple").next()
+        self.assertEqual(firstTuple[:5], (u"38000", 23L, u"John", u"Doe", u"male"))
+        self.assertEqual(firstTuple[5][:3], (1957, 3, 8))
+        firstRecord = interface.validatedRows(self._icd, self._validCostumersCsvPath, output=u"record").next()
+        self.assertEqual(firstRecord.customer_id, 23L)
+        self.assertEqual(firstRecord.surname, u"Doe")
+        self.assertEqual(firstRecord, self._icd.createRecordClass()(firstTuple))
+        self.assertFalse(hasattr(firstRecord, "__dict__"))
+        self.assertTrue(repr(firstRecord).startswith("Record(branch_id=u'38000', customer_id=23L, "), repr(firstRecord))
+        firstDict = self._icd.validatedRows(self._validCostumersCsvPath, output=u"dict").next()
+        self.assertEqual(firstDict, dict(zip(self._icd.fieldNames, firstTuple)))
+
     def testValidatedRowsWithBrokenDataFormat(self):
         try:
             icdPath = dev_test.getTestIcdPath("native_excel_formats.ods")
@@ -297,6 +358,126 @@ F,first_name,John,X,15,Text
         finally:
             icd.removeValidationListener(_defaultIcdListener)
 
+    def testIsUniqueCheckWithSortedData(self):
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        uniqueCheck = icd.getCheck(u"customer must be unique")
+        self.assertEqual(uniqueCheck.sortedFieldNames, None)
+        icd.addCheck([u"customers must be sorted", u"IsSorted", u"branch_id, customer_id, surname"])
+        self.assertEqual(uniqueCheck.sortedFieldNames, [u"branch_id", u"customer_id"])
+        dataText = """38000,23,"John","Doe","male","08.03.1957"
+38000,23,"Mike","Webster","male","23.12.1974"
+38000,59,"Jane","Miller","female","04.10.1946"
+38000,24,"Tom","Berg","male","02.03.1975"
+38001,1,"Ann","Berg","female","02.03.1976"
+"""
+        icd.validate(StringIO.StringIO(dataText))
+        self.assertEqual(icd.acceptedCount, 3)
+        self.assertEqual(icd.rejectedCount, 2)
+        self.assertEqual(uniqueCheck.uniqueValues, {})
+
+    def testCanPassValuesOrRowMapToChecks(self):
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        icd.addCheck([u"row maps must be recorded", u"_RowMapRecording", u""])
+        icd.addCheck([u"values must be recorded", u"_ValuesRecording", u""])
+        dataText = """38000,23,"John","Doe","male","08.03.1957"
+38000,59,"Jane","Miller","female","04.10.1946"
+"""
+        icd.validate(StringIO.StringIO(dataText))
+        self.assertEqual(icd.acceptedCount, 2)
+        rowMapCheck = icd.getCheck(u"row maps must be recorded")
+        self.assertEqual(len(rowMapCheck.rowMaps), 2)
+        self.assertEqual(sorted(rowMapCheck.rowMaps[1].keys()), sorted(icd.fieldNames))
+        self.assertEqual(rowMapCheck.rowMaps[1][u"surname"], u"Miller")
+        self.assertEqual(rowMapCheck.rowMaps[1][u"customer_id"], 59)
+        valuesCheck = icd.getCheck(u"values must be recorded")
+        self.assertEqual(valuesCheck.values, [(u"Doe", 23), (u"Miller", 59)])
+
+    def testCanValidateColumnsInChunks(self):
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        icd.dataFormat.set(data.KEY_HEADER, "1")
+        rowCount = 2 * interface._VALIDATION_CHUNK_SIZE + 10
+        dataRows = [u"branch_id,customer_id,first_name,surname,gender,date_of_birth"]
+        for customerId in range(rowCount):
+            firstName = u"John" if customerId % 3 else u""
+            dataRows.append(u"38000,%d,%s,Doe,male,08.03.1957" % (customerId, firstName))
+        dataRows[100] = u"38000,x,John,Doe,male,08.03.1957"
+        dataRows[300] = dataRows[300] + u",unexpected"
+        dataRows[301] = u"38000,301,John,Doe,male,31.02.1957"
+        rowsAndErrors = list(icd.validatedRows(StringIO.StringIO(u"\n".join(dataRows)), errors="yield", output="tuple"))
+        errors = [unicode(rowOrError) for rowOrError in rowsAndErrors if isinstance(rowOrError, tools.ErrorInfo)]
+        self.assertEqual(len(errors), 3, errors)
+        self.assertTrue(u"(R101C2)" in errors[0], errors[0])
+        self.assertTrue(u"(R301C7)" in errors[1], errors[1])
+        self.assertTrue(u"(R302C6)" in errors[2], errors[2])
+        rows = [rowOrError for rowOrError in rowsAndErrors if not isinstance(rowOrError, tools.ErrorInfo)]
+        self.assertEqual(len(rows), rowCount - 3)
+        self.assertEqual(rows[0][:5], (u"38000", 0L, u"", u"Doe", u"male"))
+        self.assertEqual(rows[-1][:3], (u"38000", rowCount - 1, u"John"))
+
+    def testCanSummarizeRejectedRows(self):
+        dataRows = []
+        for customerId in range(20):
+            dataRows.append(u"38000,%d,John,Doe,male,08.03.1957" % customerId)
+        for customerId in range(20, 50):
+            dataRows.append(u"38000,%d,John,Doe,male,1957-03-08" % customerId)
+        dataRows.append(u"38000,10,John,Doe,male,08.03.1957")
+        dataRows.append(u"38000,51,John,Doe,male")
+        dataText = u"\n".join(dataRows)
+
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        listener = _ErrorRecordingValidationListener()
+        icd.addValidationListener(listener)
+        try:
+            icd.validate(StringIO.StringIO(dataText))
+            expectedErrors = [unicode(error) for error in listener.errors]
+            icd.rejectionSummary = interface.RejectionSummary(3, 2)
+            listener.errors = []
+            icd.validate(StringIO.StringIO(dataText))
+            self.assertEqual([unicode(error) for error in listener.errors], expectedErrors[:3])
+        finally:
+            icd.removeValidationListener(listener)
+        self.assertEqual(icd.acceptedCount, 20)
+        self.assertEqual(icd.rejectedCount, 32)
+        rejectionSummary = icd.rejectionSummary
+        self.assertEqual(rejectionSummary.rejectedCount, 32)
+        groups = rejectionSummary.groups
+        self.assertEqual([(group.name, group.errorClass, group.count) for group in groups], [
+                (u"date_of_birth", fields.FieldValueError, 30),
+                (u"customer must be unique", checks.CheckError, 1),
+                (None, checks.CheckError, 1)])
+        self.assertEqual([location.line for location in groups[0].exampleLocations], [20, 21])
+        self.assertEqual(groups[0].exampleLocations[0].cell, 5)
+        self.assertEqual(unicode(groups[2]), u"(row): CheckError: 1 rows, for example <io> (R52C6)")
+
+        icd.rejectionSummary = interface.RejectionSummary(100)
+        listener = _ErrorRecordingValidationListener()
+        icd.addValidationListener(listener)
+        try:
+            icd.validate(StringIO.StringIO(dataText))
+        finally:
+            icd.removeValidationListener(listener)
+        self.assertEqual([unicode(error) for error in listener.errors], expectedErrors)
+        self.assertEqual(icd.rejectionSummary.rejectedCount, 32)
+
+    def testCanReadChoicesRelativeToIcd(self):
+        icdPath = dev_test.getTestOutputPath("icd_with_external_choices.csv")
+        icdFile = open(icdPath, "wb")
+        try:
+            icdFile.write("D,Format,CSV\nF,gender,male,,,Choice,\"from \"\"genders.csv\"\"\"\n")
+        finally:
+            icdFile.close()
+        choicesFile = open(dev_test.getTestOutputPath("genders.csv"), "wb")
+        try:
+            choicesFile.write("male\nfemale\n")
+        finally:
+            choicesFile.close()
+        icd = interface.InterfaceControlDocument()
+        icd.read(icdPath)
+        self.assertEqual(icd.getFieldFormat(u"gender").choices, [u"male", u"female"])
+        icd.validate(StringIO.StringIO("male\nunknown\nfemale\n"))
+        self.assertEqual(icd.acceptedCount, 2)
+        self.assertEqual(icd.rejectedCount, 1)
+
     def testDistinctCountCheck(self):
         icd = createDefaultTestIcd(data.FORMAT_CSV)
         dataText = """38000,23,"John","Doe","male","08.03.1957"
@@ -315,8 +496,8 @@ F,first_name,John,X,15,Text
         icd.addValidationListener(_defaultIcdListener)
         try:
             icd.validate(dataReadable)
-            self.assertEqual(icd.acceptedCount, 11)
-            self.assertEqual(icd.rejectedCount, 0)
+            self.assertEqual(icd.acceptedCount, 10)
+            self.assertEqual(icd.rejectedCount, 1)
             self.assertEqual(icd.passedChecksAtEndCount, 1)
             self.assertEqual(icd.failedChecksAtEndCount, 1)
         finally:
@@ -341,8 +522,8 @@ F,first_name,John,X,15,Text
 """
         dataReadable = StringIO.StringIO(dataText)
         icd.validate(dataReadable)
-        self.assertEqual(icd.acceptedCount, 11)
-        self.assertEqual(icd.rejectedCount, 1)
+        self.assertEqual(icd.acceptedCount, 10)
+        self.assertEqual(icd.rejectedCount, 2)
         self.assertEqual(icd.passedChecksAtEndCount, 1)
         self.assertEqual(icd.failedChecksAtEndCount, 1)
 
@@ -393,7 +574,8 @@ F,first_name,John,X,15,Text
             icd.validate(dataReadable)
         finally:
             icd.removeValidationListener(_defaultIcdListener)
-        self.assertEqual(_defaultIcdListener.acceptedRowCount, 0)
+        # The first row is valid because the data are decoded item by item.
+        self.assertEqual(_defaultIcdListener.acceptedRowCount, 1)
         self.assertEqual(_defaultIcdListener.rejectedRowCount, 1)
 
     def testLatin1(self):
@@ -430,6 +612,22 @@ F,first_name,John,X,15,Text
         self.assertEqual(icd.rejectedCount, 0)
         self.assertEqual(icd.acceptedCount, 2)
 
+    def testSimpleFixedIcdWithoutLineDelimiterProperty(self):
+        icd = createDefaultTestFixedIcd(None)
+        self.assertEqual(icd.dataFormat.get(data.KEY_LINE_DELIMITER), None)
+        dataText = u"3800012345John           Doe            male   08.03.19573800012346Jane           Miller         female 04.10.1946"
+        icd.validate(StringIO.StringIO(dataText))
+        self.assertEqual(icd.rejectedCount, 0)
+        self.assertEqual(icd.acceptedCount, 2)
+
+    def testSimpleFixedIcdWithLineDelimiter(self):
+        icd = createDefaultTestFixedIcd(u"crlf")
+        dataText = "3800012345John           Doe            male   08.03.1957\r\n3800012346J\xfcrgen         Miller         male   04.10.1946\r\n"
+        dataReadable = StringIO.StringIO(dataText)
+        icd.validate(dataReadable)
+        self.assertEqual(icd.rejectedCount, 0)
+        self.assertEqual(icd.acceptedCount, 2)
+
     def testValidOds(self):
         icd = createDefaultTestIcd(data.FORMAT_ODS)
         dataPath = dev_test.getTestInputPath("valid_customers.ods")
@@ -992,6 +1190,16 @@ class ValidatorTest(unittest.TestCase):
             self.assertEqual(validator.acceptedCount, 1)
             self.assertEqual(validator.rejectedCount, 0)
 
+    def testCanReturnNativeValues(self):
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        with interface.Validator(icd, output=u"tuple") as validator:
+            location = tools.createCallerInputLocation(hasCell=True)
+            validator.open(location)
+            TestRow = [u"38123", u"12345", u"John", u"Doe", u"male", u"08.03.1957"]
+            values = validator.validatedRow(TestRow)
+            self.assertEqual(values[:5], (u"38123", 12345L, u"John", u"Doe", u"male"))
+            validator.close()
+
     def testFailsOnFieldValueError(self):
         icd = createDefaultTestIcd(data.FORMAT_CSV)
         with interface.Validator(icd) as validator:
@@ -1016,23 +1224,43 @@ class ValidatorTest(unittest.TestCase):
             self.assertEqual(validator.rejectedCount, 1)
             validator.close()
 
+    def testFailsOnTooFewItems(self):
+        icd = createDefaultTestIcd(data.FORMAT_CSV)
+        with interface.Validator(icd) as validator:
+            location = tools.createCallerInputLocation(hasCell=True)
+            validator.open(location)
+            TestRow = [u"38123", u"12345", u"John", u"Doe"]
+            try:
+                validator.validatedRow(TestRow)
+                self.fail("row with too few items must cause CheckError")
+            except checks.CheckError, error:
+                self.assertEqual(error.location.cell, 4)
+                self.assertTrue("[u'gender', u'date_of_birth']" in unicode(error), u"error=%s" % error)
+            location.advanceLine()
+            TestRow = [u"38123", u"12345", u"John", u"Doe", u"male", u"08.03.1957"]
+            self.assertEqual(validator.validatedRow(TestRow), TestRow)
+            validator.close()
+
     def testFailsOnCheckAtEndError(self):
         icd = createDefaultTestIcd(data.FORMAT_CSV)
         try:
             with interface.Validator(icd) as validator:
                 location = tools.createCallerInputLocation(hasCell=True)
                 validator.open(location)
-                for branchId in _TooManyTestBranchIds:
+                for branchId in _TooManyTestBranchIds[:-1]:
                     rowToValidate = [branchId, u"12345", u"John", u"Doe", u"male", u"08.03.1957"]
                     row = validator.validatedRow(rowToValidate)
                     self.assertEqual(row, rowToValidate)
                     location.advanceLine()
+                # The row with the branch exceeding the limit is rejected immediately.
+                rowToValidate = [_TooManyTestBranchIds[-1], u"12345", u"John", u"Doe", u"male", u"08.03.1957"]
+                self.assertRaises(checks.CheckError, validator.validatedRow, rowToValidate)
             self.fail("check 'distinct branches must be within limit' must fail")
         except checks.CheckError, error:
             errorMessage = u"%s" % error
             self.assertTrue("distinct count" in errorMessage, u"errorMessage=%r" % errorMessage)
-        self.assertEqual(validator.acceptedCount, len(_TooManyTestBranchIds))
-        self.assertEqual(validator.rejectedCount, 0)
+        self.assertEqual(validator.acceptedCount, len(_TooManyTestBranchIds) - 1)
+        self.assertEqual(validator.rejectedCount, 1)
 
 
 class WriterTest(unittest.TestCase):
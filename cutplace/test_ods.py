@@ -68,6 +68,16 @@ class OdsTest(unittest.TestCase):
                 hasRow = False
         producer.join()
 
+    def testCanStopProducer(self):
+        testInPath = dev_test.getTestInputPath("valid_customers.ods")
+        contentXmlReadable = _ods.odsContent(testInPath)
+        rowQueue = Queue.Queue()
+        producer = _ods.ProducerThread(contentXmlReadable, rowQueue, batchSize=1)
+        producer.stop()
+        producer.start()
+        self.assertEqual(rowQueue.get(), None)
+        producer.join()
+
 if __name__ == "__main__":  # pragma: no cover
     logging.basicConfig()
     logging.getLogger("cutplace").setLevel(logging.INFO)
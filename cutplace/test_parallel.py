@@ -0,0 +1,228 @@
+"""
+Tests for `_parallel`.
+"""
+# Copyright (C) 2009-2012 Thomas Aglassinger
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import StringIO
+import unittest
+
+import checks
+import data
+import dev_test
+import interface
+import test_interface
+import _parallel
+
+_log = logging.getLogger("cutplace.test_parallel")
+
+# Data containing broken fields, duplicate keys, quoted line delimiters and a broken row.
+_TEST_DATA = """branch_id,customer_id,first_name,surname,gender,date_of_birth
+38000,23,"John","Doe","male","08.03.1957"
+38000,24,"Mike","Webster","male","23.12.1974"
+38000,25,"Jane","Miller
+Smith","female","04.10.1946"
+38000,26,"Jim","""""" Bo","male","01.01.1970"
+38001,27,"Jenny","Sun","female","xx.yy.1980"
+38000,23,"Mike","Webster","male","23.12.1974"
+38001,28,"Tom","Berg","male","02.03.1975"
+38002,24,"Ann","Berg","female","02.03.1976"
+38002,29,"Jill","Berg","female","02.03.1976",
+
+38000,24,"Tim","Twice","male","05.06.1977"
+38003,30,"Ben","Last","male","02.03.1976"
+"""
+
+
+class _RecordingValidationListener(interface.BaseValidationListener):
+    """
+    Listener for validation events that records them as text.
+    """
+    def __init__(self):
+        self.events = []
+
+    def acceptedRow(self, row, location):
+        self.events.append(u"accepted %s: %r" % (location, row))
+
+    def rejectedRow(self, row, error):
+        self.events.append(u"rejected %r: %s" % (row, error))
+
+    def checkAtEndFailed(self, error):
+        self.events.append(u"failed: %s" % error)
+
+
+class DelimitedSplitterTest(unittest.TestCase):
+    def _splitPositions(self, text, lineDelimiter="\n", blockSize=4):
+        splitter = _parallel._DelimitedSplitter(StringIO.StringIO(text), lineDelimiter, "\"", blockSize)
+        result = []
+        position = splitter.splitPosition(0)
+        while position is not None:
+            result.append(position)
+            position = splitter.splitPosition(position)
+        return result
+
+    def testCanSplitAtLineDelimiters(self):
+        self.assertEqual(self._splitPositions("a,b\nc,d\n"), [4, 8])
+        self.assertEqual(self._splitPositions("a,b\r\nc,d", "\r\n"), [5])
+        self.assertEqual(self._splitPositions(""), [])
+
+    def testCanSkipQuotedLineDelimiters(self):
+        self.assertEqual(self._splitPositions("\"a\nb\",c\nd\n"), [8, 10])
+        self.assertEqual(self._splitPositions("\"a\"\"\nb\"\"c\",d\ne\n"), [13, 15])
+
+
+class ParallelValidationTest(unittest.TestCase):
+    def setUp(self):
+        self._icd = test_interface.createDefaultTestIcd(data.FORMAT_CSV)
+        self._icd.dataFormat.set(data.KEY_HEADER, "1")
+        self._dataPath = dev_test.getTestOutputPath("parallel_customers.csv")
+        dataFile = open(self._dataPath, "wb")
+        try:
+            dataFile.write(_TEST_DATA)
+        finally:
+            dataFile.close()
+
+    def _validatedEvents(self, jobs, chunkSize):
+        listener = _RecordingValidationListener()
+        self._icd.addValidationListener(listener)
+        try:
+            if jobs == 1:
+                self._icd.validate(self._dataPath)
+            else:
+                self._icd._resetCounts()
+                self._icd._resetChecks()
+                self.assertTrue(_parallel.canValidateInParallel(self._icd, self._dataPath))
+                location = _parallel.validate(self._icd, self._dataPath, jobs, chunkSize)
+                self._icd._validateChecksAtEnd(location)
+        finally:
+            self._icd.removeValidationListener(listener)
+        counts = (self._icd.acceptedCount, self._icd.rejectedCount, self._icd.passedChecksAtEndCount, self._icd.failedChecksAtEndCount)
+        return (listener.events, counts)
+
+    def testCanValidateLikeSingleProcess(self):
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self.assertEqual(expectedCounts, (6, 6, 2, 0))
+        for chunkSize in (4, 20, 60, 200, _parallel.DEFAULT_CHUNK_SIZE):
+            actualEvents, actualCounts = self._validatedEvents(3, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanValidateMemoryMapLikeSingleProcess(self):
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self._icd.useMemoryMap = True
+        for jobs, chunkSize in ((1, None), (3, 20), (3, _parallel.DEFAULT_CHUNK_SIZE)):
+            actualEvents, actualCounts = self._validatedEvents(jobs, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanValidateSortedLikeSingleProcess(self):
+        self._icd.addCheck([u"customers must be sorted", u"IsSorted", u"branch_id, customer_id"])
+        sortedData = "\n".join(["branch_id,customer_id,first_name,surname,gender,date_of_birth"]
+                + ["3800%d,%d,\"John\",\"Doe\",\"male\",\"08.03.1957\"" % (customerId // 10, customerId)
+                        for customerId in (10, 11, 11, 12, 13, 20, 20, 21, 19, 22, 30, 31, 31)]) + "\n"
+        dataFile = open(self._dataPath, "wb")
+        try:
+            dataFile.write(sortedData)
+        finally:
+            dataFile.close()
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self.assertEqual(expectedCounts, (9, 4, 3, 0))
+        for chunkSize in (40, 60, 200):
+            actualEvents, actualCounts = self._validatedEvents(3, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanCountDistinctValuesExactlyBelowSketchThreshold(self):
+        self._icd.addCheck([u"customers must be counted exactly", u"DistinctCount", u"customer_id == 100"])
+        self._icd.getCheck(u"customers must be counted exactly").approximationError = 0.1
+        self.assertTrue(100 < self._icd.getCheck(u"customers must be counted exactly")._sketch.registerCount)
+        distinctData = "\n".join(["branch_id,customer_id,first_name,surname,gender,date_of_birth"]
+                + ["38000,%d,\"John\",\"Doe\",\"male\",\"08.03.1957\"" % customerId for customerId in xrange(100)]) + "\n"
+        dataFile = open(self._dataPath, "wb")
+        try:
+            dataFile.write(distinctData)
+        finally:
+            dataFile.close()
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self.assertEqual(expectedCounts, (100, 0, 3, 0))
+        for chunkSize in (400, 1000):
+            actualEvents, actualCounts = self._validatedEvents(3, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanValidateKeysStoredOnDiskLikeSingleProcess(self):
+        for checkName in self._icd.checkNames:
+            check = self._icd.getCheck(checkName)
+            if isinstance(check, checks.IsUniqueCheck):
+                check.maxKeysInMemory = 2
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self.assertEqual(expectedCounts, (6, 6, 2, 0))
+        for chunkSize in (4, 60, 200):
+            actualEvents, actualCounts = self._validatedEvents(3, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanIgnoreKeysOfRowsRejectedByPreviousCheck(self):
+        self._icd.addCheck([u"first names must be unique", u"IsUnique", u"first_name"])
+        conflictData = "\n".join(["branch_id,customer_id,first_name,surname,gender,date_of_birth"]
+                + ["38000,%d,\"%s\",\"Doe\",\"male\",\"08.03.1957\"" % (customerId, firstName)
+                        for customerId, firstName in ((1, "John"), (1, "Jim"), (2, "Jim"), (3, "Jim"))]) + "\n"
+        dataFile = open(self._dataPath, "wb")
+        try:
+            dataFile.write(conflictData)
+        finally:
+            dataFile.close()
+        expectedEvents, expectedCounts = self._validatedEvents(1, None)
+        self.assertEqual(expectedCounts, (2, 2, 3, 0))
+        self.assertTrue(expectedEvents[2].startswith(u"accepted"), expectedEvents[2])
+        # Use chunks with a single row so the duplicate first names are found by the merge.
+        for chunkSize in (4, 40):
+            actualEvents, actualCounts = self._validatedEvents(3, chunkSize)
+            self.assertEqual(actualCounts, expectedCounts)
+            self.assertEqual(actualEvents, expectedEvents)
+
+    def testCanValidateWithJobs(self):
+        listener = _RecordingValidationListener()
+        self._icd.addValidationListener(listener)
+        try:
+            self._icd.validate(self._dataPath, jobs=2)
+        finally:
+            self._icd.removeValidationListener(listener)
+        self.assertEqual(self._icd.acceptedCount, 6)
+        self.assertEqual(self._icd.rejectedCount, 6)
+
+    def testCanValidateReadableWithJobs(self):
+        readable = StringIO.StringIO(_TEST_DATA)
+        self.assertFalse(_parallel.canValidateInParallel(self._icd, readable))
+        self._icd.validate(readable, jobs=2)
+        self.assertEqual(self._icd.acceptedCount, 6)
+        self.assertEqual(self._icd.rejectedCount, 6)
+
+    def testCannotValidateWithRejectionSummaryInParallel(self):
+        self.assertTrue(_parallel.canValidateInParallel(self._icd, self._dataPath))
+        self._icd.rejectionSummary = interface.RejectionSummary()
+        self.assertFalse(_parallel.canValidateInParallel(self._icd, self._dataPath))
+        self._icd.validate(self._dataPath, jobs=2)
+        self.assertEqual(self._icd.rejectedCount, 6)
+        self.assertEqual(self._icd.rejectionSummary.rejectedCount, 6)
+
+    def testCannotValidateFixedInParallel(self):
+        icd = test_interface.createDefaultTestFixedIcd()
+        self.assertFalse(_parallel.canValidateInParallel(icd, self._dataPath))
+
+if __name__ == '__main__':  # pragma: no cover
+    logging.basicConfig()
+    logging.getLogger("cutplace").setLevel(logging.INFO)
+    unittest.main()
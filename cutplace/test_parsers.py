@@ -18,11 +18,14 @@ Tests for `_parsers`.
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 import StringIO
+import threading
 import types
 import unittest
 
 import dev_test
+import tools
 import _parsers
+import _tools
 
 _log = logging.getLogger("cutplace.test_parsers")
 
@@ -100,6 +103,88 @@ class FixedParserTest(AbstractParserTest):
     def testBrokenEndingTooSoon(self):
         self.assertRaises(_parsers.ParserSyntaxError, self._testParse, [], u"38000 123Doe  ")
 
+    def _assertSyntaxErrorAt(self, lineNumber, itemNumberInLine, columnNumberInLine, readable, **keywords):
+        reader = _parsers.fixedReader(readable, FixedParserTest._DEFAULT_FIELD_LENGTHS, **keywords)
+        try:
+            for dummy in reader:
+                pass
+            self.fail(u"reader must raise %s" % _parsers.ParserSyntaxError.__name__)
+        except _parsers.ParserSyntaxError, error:
+            self.assertEqual(error.lineNumber, lineNumber)
+            self.assertEqual(error.itemNumberInLine, itemNumberInLine)
+            self.assertEqual(error.columnNumberInLine, columnNumberInLine)
+
+    def testCanReadBlocks(self):
+        text = u"38000 123Doe       38001 124Miller    38002 125Webster   "
+        expectedRows = [
+            [u"38000", u" 123", u"Doe       "],
+            [u"38001", u" 124", u"Miller    "],
+            [u"38002", u" 125", u"Webster   "]
+        ]
+        for blockSize in (1, 7, 19, 20, _parsers.DEFAULT_FIXED_BLOCK_SIZE):
+            self.readAndAssertEquals(expectedRows, _parsers.fixedReader(StringIO.StringIO(text), self._DEFAULT_FIELD_LENGTHS, blockSize=blockSize))
+
+    def testCanDecodeItems(self):
+        text = u"38000 123M\xfcller    38001 124\u20acuro      "
+        expectedRows = [[u"38000", u" 123", u"M\xfcller    "], [u"38001", u" 124", u"\u20acuro      "]]
+        for encoding in ("iso-8859-15", "utf-8", "cp1140"):
+            for blockSize in (1, 3, 20, _parsers.DEFAULT_FIXED_BLOCK_SIZE):
+                readable = StringIO.StringIO(text.encode(encoding))
+                reader = _parsers.fixedReader(readable, self._DEFAULT_FIELD_LENGTHS, encoding, blockSize=blockSize)
+                self.readAndAssertEquals(expectedRows, reader)
+
+    def testCanReadLineDelimiters(self):
+        expectedRows = [[u"38000", u" 123", u"Doe       "], [u"38001", u" 124", u"Miller    "]]
+        for lineDelimiter in (_parsers.CR, _parsers.CRLF, _parsers.LF):
+            for text in (u"38000 123Doe       %s38001 124Miller    ", u"38000 123Doe       %s38001 124Miller    %s"):
+                for encoding in (None, "ascii", "utf-8"):
+                    delimitedText = text.replace(u"%s", lineDelimiter)
+                    if encoding is not None:
+                        delimitedText = delimitedText.encode(encoding)
+                    for blockSize in (1, 20, _parsers.DEFAULT_FIXED_BLOCK_SIZE):
+                        reader = _parsers.fixedReader(StringIO.StringIO(delimitedText), self._DEFAULT_FIELD_LENGTHS,
+                                encoding, lineDelimiter, blockSize)
+                        self.readAndAssertEquals(expectedRows, reader)
+
+    def testBrokenPositionOfEndingTooSoon(self):
+        self._assertSyntaxErrorAt(0, 2, 9, StringIO.StringIO(u"38000 123Doe  "))
+        self._assertSyntaxErrorAt(1, 1, 5, StringIO.StringIO("38000 123Doe       38001"), encoding="ascii", blockSize=3)
+        self._assertSyntaxErrorAt(1, 0, 0, StringIO.StringIO(u"38000 123Doe       3800"), blockSize=3)
+
+    def testBrokenLineLength(self):
+        self._assertSyntaxErrorAt(1, 2, 9, StringIO.StringIO(u"38000 123Doe       \n38001 124Doe\n"), lineDelimiter=_parsers.LF)
+        self._assertSyntaxErrorAt(0, 3, 19, StringIO.StringIO("38000 123Doe        \n"), encoding="ascii",
+                lineDelimiter=_parsers.LF)
+        self._assertSyntaxErrorAt(0, 3, 19, StringIO.StringIO(u"38000 123Doe       \r\n"), lineDelimiter=_parsers.LF)
+        self._assertSyntaxErrorAt(1, 0, 0, StringIO.StringIO(u"38000 123Doe       \n\n"), lineDelimiter=_parsers.LF)
+
+    def _assertMappedRowsEqual(self, expectedRows, text, encoding, lineDelimiter=None):
+        dataPath = dev_test.getTestOutputPath("fixed_mapped.txt")
+        dataFile = open(dataPath, "wb")
+        try:
+            dataFile.write(text.encode(encoding))
+        finally:
+            dataFile.close()
+        mapped = _tools.mappedFile(dataPath)
+        try:
+            reader = _parsers.fixedReader(mapped, self._DEFAULT_FIELD_LENGTHS, encoding, lineDelimiter, 7)
+            self.readAndAssertEquals(expectedRows, reader)
+        finally:
+            mapped.close()
+
+    def testCanReadMemoryMap(self):
+        expectedRows = [[u"38000", u" 123", u"M\xfcller    "], [u"38001", u" 124", u"\u20acuro      "]]
+        for encoding in ("iso-8859-15", "utf-8"):
+            self._assertMappedRowsEqual(expectedRows, u"38000 123M\xfcller    38001 124\u20acuro      ", encoding)
+            self._assertMappedRowsEqual(expectedRows, u"38000 123M\xfcller    \n38001 124\u20acuro      \n", encoding,
+                    _parsers.LF)
+
+    def testBrokenUnicode(self):
+        readable = StringIO.StringIO("38000 123M\xfcller    ")
+        self.assertRaises(tools.CutplaceUnicodeError, list, _parsers.fixedReader(readable, self._DEFAULT_FIELD_LENGTHS, "ascii"))
+        readable = StringIO.StringIO("38000 123M\xfcller    ")
+        self.assertRaises(tools.CutplaceUnicodeError, list, _parsers.fixedReader(readable, self._DEFAULT_FIELD_LENGTHS, "utf-8"))
+
 
 class DelimitedParserTest(AbstractParserTest):
     """
@@ -234,6 +319,85 @@ class DelimitedParserTest(AbstractParserTest):
             self.assertEqual(7, len(row))
         self.assertEqual(1, rowCount)
 
+    def testCanReadInBatches(self):
+        dialect = self._createDefaultDialect()
+        text = "a,b\nc,d\ne,f\ng,h\ni,j"
+        expectedRows = [["a", "b"], ["c", "d"], ["e", "f"], ["g", "h"], ["i", "j"]]
+        for batchSize in (1, 2, 5, 6, _parsers.DEFAULT_BATCH_SIZE):
+            reader = _parsers.delimitedReader(StringIO.StringIO(text), dialect, batchSize=batchSize, queueSize=1)
+            self.readAndAssertEquals(expectedRows, reader)
+
+    def testCanReadWithoutThread(self):
+        dialect = self._createDefaultDialect()
+        reader = _parsers.delimitedReader(StringIO.StringIO("a,b\nc,d"), dialect, isThreaded=False)
+        self.readAndAssertEquals([["a", "b"], ["c", "d"]], reader)
+
+    def testCanReadEncodings(self):
+        expectedRows = [[u"M\xfcller", u"\u20ac"], [u"x\ny", u"z"]]
+        for lineDelimiter in (_parsers.CR, _parsers.CRLF, _parsers.LF):
+            dialect = self._createDefaultDialect()
+            dialect.lineDelimiter = lineDelimiter
+            text = u"M\xfcller,\u20ac%s\"x\ny\",z%s" % (lineDelimiter, lineDelimiter)
+            for encoding in ("cp1252", "iso-8859-15", "utf-8", "utf-16"):
+                reader = _parsers.delimitedReader(StringIO.StringIO(text.encode(encoding)), dialect, encoding)
+                self.readAndAssertEquals(expectedRows, reader)
+
+    def testBrokenUtf8(self):
+        dialect = self._createDefaultDialect()
+        reader = _parsers.delimitedReader(StringIO.StringIO("a,b\nc,\xfc\n"), dialect, "utf-8")
+        self.assertRaises(tools.CutplaceUnicodeError, list, reader)
+
+    def testCanStopReadingEarly(self):
+        dialect = self._createDefaultDialect()
+        threadCount = threading.activeCount()
+        reader = _parsers.delimitedReader(StringIO.StringIO("a,b\n" * 100), dialect, batchSize=1, queueSize=1)
+        self.assertEqual(reader.next(), ["a", "b"])
+        reader.close()
+        self.assertEqual(threading.activeCount(), threadCount)
+
+    def _assertRaisesCutplaceUnicodeError(self, **keywords):
+        dialect = self._createDefaultDialect()
+        reader = _parsers.delimitedReader(StringIO.StringIO("a,b\nc,d\ne,\xe4"), dialect, **keywords)
+        self.assertRaises(tools.CutplaceUnicodeError, list, reader)
+
+    def testBrokenUnicodeInBatches(self):
+        self._assertRaisesCutplaceUnicodeError(batchSize=1)
+        self._assertRaisesCutplaceUnicodeError(batchSize=3, queueSize=1)
+
+    def testBrokenUnicodeWithoutThread(self):
+        self._assertRaisesCutplaceUnicodeError(isThreaded=False)
+
+
+class OdsReaderTest(AbstractParserTest):
+    def _assertReadsCustomers(self, **keywords):
+        odsPath = dev_test.getTestInputPath("valid_customers.ods")
+        readable = open(odsPath, "rb")
+        try:
+            rows = list(_parsers.odsReader(readable, **keywords))
+        finally:
+            readable.close()
+        self.assertTrue(len(rows) > 1)
+        return rows
+
+    def testCanReadInBatches(self):
+        expectedRows = self._assertReadsCustomers(batchSize=1)
+        self.assertEqual(self._assertReadsCustomers(batchSize=3, queueSize=1), expectedRows)
+        self.assertEqual(self._assertReadsCustomers(), expectedRows)
+
+    def testCanReadWithoutThread(self):
+        self.assertEqual(self._assertReadsCustomers(isThreaded=False), self._assertReadsCustomers())
+
+    def testCanStopReadingEarly(self):
+        threadCount = threading.activeCount()
+        readable = open(dev_test.getTestInputPath("valid_customers.ods"), "rb")
+        try:
+            reader = _parsers.odsReader(readable, batchSize=1, queueSize=1)
+            self.assertTrue(reader.next())
+            reader.close()
+        finally:
+            readable.close()
+        self.assertEqual(threading.activeCount(), threadCount)
+
 if __name__ == '__main__':  # pragma: no cover
     logging.basicConfig()
     _log.setLevel(logging.DEBUG)
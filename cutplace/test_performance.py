@@ -17,9 +17,15 @@ Test cutplace performance.
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 import os.path
+import sys
+import timeit
 import unittest
 
+import checks
+import data
 import dev_test
+import fields
+import tools
 import _cutplace
 
 _log = logging.getLogger("cutplace.dev_reports")
@@ -42,6 +48,39 @@ def _buildAndValidateManyCustomers():
         raise ValueError(u"exit code of performance test must be 0 but is %d" % exitCode)
 
 
+def _uniqueKeysMemorySize(keyCount):
+    """
+    Approximate number of bytes `checks.IsUniqueCheck` needs to remember ``keyCount`` keys
+    consisting of an integer and a text field.
+    """
+    fieldNames = ["branch_id", "customer_id"]
+    check = checks.IsUniqueCheck("test check", ", ".join(fieldNames), fieldNames)
+    location = tools.InputLocation("<memory>", hasCell=True)
+    for keyNumber in xrange(keyCount):
+        check.checkRow({"branch_id": long(keyNumber % 100), "customer_id": u"%08d" % keyNumber}, location)
+        location.advanceLine()
+    result = sys.getsizeof(check.uniqueValues)
+    objectIds = set()
+    for key, line in check.uniqueValues.iteritems():
+        for item in (key,) + key + (line,):
+            if id(item) not in objectIds:
+                objectIds.add(id(item))
+                result += sys.getsizeof(item)
+    return result
+
+
+def _microsecondsPerCell(fieldFormat, values, repeatCount=3, roundCount=2000):
+    """
+    Microseconds ``fieldFormat.validated()`` takes at best per value in ``values``.
+    """
+    def validateValues():
+        for value in values:
+            fieldFormat.validated(value)
+
+    bestTime = min(timeit.repeat(validateValues, repeat=repeatCount, number=roundCount))
+    return bestTime * 1000000.0 / (roundCount * len(values))
+
+
 class PerformanceTest(unittest.TestCase):
     """
     Test case for performance profiling.
@@ -62,6 +101,26 @@ class PerformanceTest(unittest.TestCase):
         else:  # pragma: no cover
             _buildAndValidateManyCustomers()
 
+    def testCanValidateCellsQuickly(self):
+        dataFormat = data.createDataFormat(data.FORMAT_CSV)
+        dataFormat.set(data.KEY_ALLOWED_CHARACTERS, "32:")
+        # Validate each value again instead of remembering the result for the repeated values.
+        dataFormat.set(data.KEY_VALUE_CACHE_SIZE, "0")
+        for fieldFormat, values in (
+                (fields.TextFieldFormat("surname", False, "1:60", "", dataFormat), [u"Doe", u"Miller", u"Webster"]),
+                (fields.IntegerFieldFormat("customer_id", False, "1:5", "0:99999", dataFormat), [u"23", u"59", u"17"])):
+            microsecondsPerCell = _microsecondsPerCell(fieldFormat, values)
+            _log.info(u"%s validates a cell in %.2f microseconds", fieldFormat.__class__.__name__, microsecondsPerCell)
+            # Even a slow machine must validate such simple cells in far less than a millisecond.
+            self.assertTrue(microsecondsPerCell < 1000.0, u"microsecondsPerCell=%.2f" % microsecondsPerCell)
+
+    def testCanRememberManyUniqueKeys(self):
+        keyCount = 100000
+        bytesPerMillionKeys = _uniqueKeysMemorySize(keyCount) * (1000000 / keyCount)
+        _log.info(u"unique keys need about %d MB per million keys", bytesPerMillionKeys // (1024 * 1024))
+        # Without location objects per key, a million keys must fit in less than 500 MB.
+        self.assertTrue(bytesPerMillionKeys < 500 * 1024 * 1024, u"bytesPerMillionKeys=%d" % bytesPerMillionKeys)
+
 
 if __name__ == '__main__':  # pragma: no cover
     logging.basicConfig()
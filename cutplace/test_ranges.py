@@ -149,6 +149,82 @@ class RangeTest(unittest.TestCase):
         self.assertRaises(ranges.RangeValueError, multiRange.validate, "x", 10)
         self.assertRaises(ranges.RangeValueError, multiRange.validate, "x", 723)
 
+    def testCanValidateManyItems(self):
+        manyRange = ranges.Range("20:29, :-10, 7, 4:5, 0:3, 40:, 31:35")
+        self.assertEqual(manyRange.items, [(20, 29), (None, -10), (7, 7), (4, 5), (0, 3), (40, None), (31, 35)])
+        self.assertEqual(manyRange._mergedIntervals(), [
+            (float("-inf"), -10), (0, 5), (7, 7), (20, 29), (31, 35), (40, float("inf"))])
+        for value in range(-20, 50) + [- (2 ** 64), 2 ** 64]:
+            isExpectedWithin = any(manyRange._itemContains(item, value) for item in manyRange.items)
+            self.assertEqual(manyRange.isWithin(value), isExpectedWithin, u"value=%d" % value)
+        try:
+            manyRange.validate("x", 6)
+            self.fail(u"value outside of range must cause RangeValueError")
+        except ranges.RangeValueError, error:
+            self.assertEqual(unicode(error), u"x is 6 but must be within range: '20:29, :-10, 7, 4:5, 0:3, 40:, 31:35'")
+
+    def testCanValidateSingleItem(self):
+        for description, validValues, invalidValues in (
+                ("3", [3], [2, 4]),
+                ("3:5", [3, 4, 5], [2, 6]),
+                ("3:", [3, 2 ** 64], [2]),
+                (":3", [3, - (2 ** 64)], [4]),
+                ("3:4, 5:6", [3, 6], [2, 7])):
+            singleRange = ranges.Range(description)
+            self.assertEqual(len(singleRange._mergedIntervals()), 1, description)
+            for value in validValues:
+                self.assertTrue(singleRange.isWithin(value), u"%s: %d" % (description, value))
+            for value in invalidValues:
+                self.assertFalse(singleRange.isWithin(value), u"%s: %d" % (description, value))
+
+    def testCanValidateEachItem(self):
+        for description, validValues, invalidValues in (
+                ("", [-(2 ** 64), 2 ** 64], []),
+                ("3:5", [3, 4, 5], [2, 6]),
+                ("3:", [3, 2 ** 64], [2]),
+                (":-10, 0:3, 7, 20:", [-11, 0, 3, 7, 20], [-9, 4, 19])):
+            eachRange = ranges.Range(description)
+            self.assertTrue(eachRange.isEachWithin([]), description)
+            self.assertTrue(eachRange.isEachWithin(validValues), description)
+            for value in invalidValues:
+                self.assertFalse(eachRange.isEachWithin(validValues + [value]), u"%s: %d" % (description, value))
+
+    def testCanDescribeValueOutsideOfRange(self):
+        error = ranges.Range("1:5").error("x", 7)
+        self.assertTrue(isinstance(error, ranges.RangeValueError))
+        self.assertEqual(unicode(error), u"x is 7 but must be within range: '1:5'")
+
+    def testCanValidateCharacters(self):
+        characterRange = ranges.Range("32:126, 0xe4, 0x20ac:")
+        characterRange.validateCharacters("x", u"")
+        characterRange.validateCharacters("x", u"Spam & eggs: 17\u20ac for m\u00e4h \U0001f600")
+        for invalidText, invalidCode in ((u"tab\there", 9), (u"\u00f6", 0xf6), (u"a\u20abb\x00", 0x20ab)):
+            try:
+                characterRange.validateCharacters("x", invalidText)
+                self.fail(u"invalid character must cause RangeValueError: %r" % invalidText)
+            except ranges.RangeValueError, error:
+                self.assertEqual(unicode(error), u"x is %d but must be within range: '32:126, 228, 8364:'" % invalidCode)
+        ranges.Range("").validateCharacters("x", u"\x00\uffff")
+
+    def testCanTellValidCharacters(self):
+        characterRange = ranges.Range("32:126, 0xe4")
+        self.assertTrue(characterRange.isEachCharacterWithin(u""))
+        self.assertTrue(characterRange.isEachCharacterWithin(u"Spam & m\u00e4h"))
+        self.assertFalse(characterRange.isEachCharacterWithin(u"tab\there"))
+        self.assertTrue(ranges.Range("").isEachCharacterWithin(u"\x00\uffff"))
+        ranges.Range(":-1, 0").validateCharacters("x", u"\x00")
+        self.assertRaises(ranges.RangeValueError, ranges.Range(":-1").validateCharacters, "x", u"a")
+
+    def testCanCompileCharacters(self):
+        characterRange = ranges.Range("32:126")
+        characterRange.compileCharacters()
+        invalidCharacterRegEx = characterRange._invalidCharacterRegEx
+        self.assertNotEqual(invalidCharacterRegEx, None)
+        characterRange.compileCharacters()
+        self.assertTrue(characterRange._invalidCharacterRegEx is invalidCharacterRegEx)
+        self.assertFalse(characterRange.isEachCharacterWithin(u"tab\there"))
+        ranges.Range("").compileCharacters()
+
 
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
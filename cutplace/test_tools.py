@@ -16,7 +16,7 @@ Test for `tools` module.
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import decimal
-import os.path
+import os
 import StringIO
 import unittest
 
@@ -165,5 +165,75 @@ class NumberedTest(unittest.TestCase):
         self.assertEqual(actual, expected)
 
 
+
+class BoundedCacheTest(unittest.TestCase):
+    def testCanKeepEntriesInUse(self):
+        cache = _tools.BoundedCache(4)
+        cache.put("a", 1)
+        for value in range(10):
+            cache.put(value, value)
+            self.assertEqual(cache.get("a"), 1)
+            self.assertTrue(len(cache) <= 4)
+        self.assertEqual(cache.hits, 10)
+        self.assertEqual(cache.evictions + len(cache), 11)
+
+    def testCanCacheSingleEntry(self):
+        cache = _tools.BoundedCache(1)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 1)
+
+    def testCanClear(self):
+        cache = _tools.BoundedCache(2)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.hitRate, 0.5)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hitRate, 0.0)
+        self.assertEqual(cache.get("a", 0), 0)
+
+
+class MappedFileTest(unittest.TestCase):
+    def _createTestFile(self, name, content):
+        result = dev_test.getTestOutputPath(name)
+        testFile = open(result, "wb")
+        try:
+            testFile.write(content)
+        finally:
+            testFile.close()
+        return result
+
+    def testCanMapFile(self):
+        mapped = _tools.mappedFile(self._createTestFile("mapped.txt", "a\nbc\ndef"))
+        try:
+            self.assertEqual(mapped[:], "a\nbc\ndef")
+        finally:
+            mapped.close()
+
+    def testCannotMapEmptyFile(self):
+        self.assertEqual(_tools.mappedFile(self._createTestFile("mapped_empty.txt", "")), None)
+
+    def testCanReadMappedRange(self):
+        mapped = _tools.mappedFile(self._createTestFile("mapped_range.txt", "a\nbc\ndef\ngh"))
+        try:
+            mappedRange = _tools.MappedRange(mapped, 2, 9)
+            self.assertEqual(mappedRange.readline(), "bc\n")
+            self.assertEqual(mappedRange.tell(), 3)
+            self.assertEqual(mappedRange.read(2), "de")
+            self.assertEqual(mappedRange.read(), "f\n")
+            self.assertEqual(mappedRange.read(), "")
+            mappedRange.seek(0)
+            self.assertEqual(list(mappedRange), ["bc\n", "def\n"])
+            mappedRange.seek(-2, os.SEEK_END)
+            self.assertEqual(mappedRange.readline(), "f\n")
+            self.assertEqual(list(_tools.MappedRange(mapped, 9)), ["gh"])
+        finally:
+            mapped.close()
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
@@ -118,6 +118,16 @@ class InputLocation(object):
         self._column = 0
         self._cell = 0
 
+    def moveLine(self, amount):
+        """
+        Move the current line by ``amount`` without changing the column and cell, for example to
+        turn a location relative to a part of the input into a location relative to the whole
+        input.
+        """
+        assert amount is not None
+        assert amount >= 0
+        self._line += amount
+
     def advanceSheet(self):
         self._sheet += 1
         self._line = 0
@@ -38,3 +38,9 @@ class FullNameLengthIsInRangeCheck(checks.AbstractCheck):
         except ranges.RangeValueError, error:
             raise CheckError("full name length is %d but must be in range %s: %r" \
                 % (fullNameLength, self._fullNameRange, fullName))
+
+    def partialState(self):
+        return None
+
+    def mergePartialState(self, partialState, lineOffset=0):
+        return []
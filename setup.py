@@ -103,7 +103,7 @@ setup(
       author="Thomas Aglassinger",
       author_email="roskakori@users.sourceforge.net",
       url="http://roskakori.github.com/cutplace/",
-      install_requires=["coverage", "proconex>=0.4", "xlrd"],
+      install_requires=["coverage", "xlrd"],
       packages=["cutplace"],
       data_files=[
           ("", ["setup.py"]),